@@ -254,156 +254,3 @@ def onAnswerAcceptCanceled(answer, user, timestamp=None):
                reputation_type=-1,
                reputation=user.reputation)
     reputation.save()
-
-@transaction.commit_on_success
-def onUpVoted(vote, post, user, timestamp=None):
-    if timestamp is None:
-        timestamp = datetime.datetime.now()
-    vote.save()
-
-    if post.post_type != 'comment':
-        post.vote_up_count = int(post.vote_up_count) + 1
-    post.points = int(post.points) + 1
-    post.save()
-
-    if post.post_type == 'comment':
-        #reputation is not affected by the comment votes
-        return
-
-    if not (post.wiki or post.is_anonymous):
-        author = post.author
-        todays_rep_gain = Repute.objects.get_reputation_by_upvoted_today(author)
-        if todays_rep_gain <  askbot_settings.MAX_REP_GAIN_PER_USER_PER_DAY:
-            author.receive_reputation(
-                askbot_settings.REP_GAIN_FOR_RECEIVING_UPVOTE
-            )
-            author.save()
-
-            question = post.thread._question_post() # TODO: this is suboptimal if post is already a question
-
-            reputation = Repute(user=author,
-                       positive=askbot_settings.REP_GAIN_FOR_RECEIVING_UPVOTE,
-                       question=question,
-                       reputed_at=timestamp,
-                       reputation_type=1,
-                       reputation=author.reputation)
-            reputation.save()
-
-@transaction.commit_on_success
-def onUpVotedCanceled(vote, post, user, timestamp=None):
-    if timestamp is None:
-        timestamp = datetime.datetime.now()
-    vote.delete()
-
-    if post.post_type != 'comment':
-        post.vote_up_count = int(post.vote_up_count) - 1
-        if post.vote_up_count < 0:
-            post.vote_up_count  = 0
-
-    post.points = int(post.points) - 1
-    post.save()
-
-    if post.post_type == 'comment':
-        #comment votes do not affect reputation
-        return
-
-    if not (post.wiki or post.is_anonymous):
-        author = post.author
-        author.receive_reputation(
-            askbot_settings.REP_LOSS_FOR_RECEIVING_UPVOTE_CANCELATION
-        )
-        author.save()
-
-        question = post.thread._question_post() # TODO: this is suboptimal if post is already a question
-
-        reputation = Repute(
-            user=author,
-            negative=askbot_settings.REP_LOSS_FOR_RECEIVING_UPVOTE_CANCELATION,
-            question=question,
-            reputed_at=timestamp,
-            reputation_type=-8,
-            reputation=author.reputation
-        )
-        reputation.save()
-
-@transaction.commit_on_success
-def onDownVoted(vote, post, user, timestamp=None):
-    if timestamp is None:
-        timestamp = datetime.datetime.now()
-    vote.save()
-
-    post.vote_down_count = int(post.vote_down_count) + 1
-    post.points = int(post.points) - 1
-    post.save()
-
-    if not (post.wiki or post.is_anonymous):
-        author = post.author
-        author.receive_reputation(
-            askbot_settings.REP_LOSS_FOR_RECEIVING_DOWNVOTE
-        )
-        author.save()
-
-        question = post.thread._question_post() # TODO: this is suboptimal if post is already a question
-
-        reputation = Repute(user=author,
-                   negative=askbot_settings.REP_LOSS_FOR_RECEIVING_DOWNVOTE,
-                   question=question,
-                   reputed_at=timestamp,
-                   reputation_type=-3,
-                   reputation=author.reputation)
-        reputation.save()
-
-        user.receive_reputation(
-            askbot_settings.REP_LOSS_FOR_DOWNVOTING,
-        )
-        user.save()
-
-        reputation = Repute(user=user,
-                   negative=askbot_settings.REP_LOSS_FOR_DOWNVOTING,
-                   question=question,
-                   reputed_at=timestamp,
-                   reputation_type=-5,
-                   reputation=user.reputation)
-        reputation.save()
-
-@transaction.commit_on_success
-def onDownVotedCanceled(vote, post, user, timestamp=None):
-    if timestamp is None:
-        timestamp = datetime.datetime.now()
-    vote.delete()
-
-    post.vote_down_count = int(post.vote_down_count) - 1
-    if post.vote_down_count < 0:
-        post.vote_down_count  = 0
-    post.points = post.points + 1
-    post.save()
-
-    if not (post.wiki or post.is_anonymous):
-        author = post.author
-        author.receive_reputation(
-            askbot_settings.REP_GAIN_FOR_RECEIVING_DOWNVOTE_CANCELATION
-        )
-        author.save()
-
-        question = post.thread._question_post() # TODO: this is suboptimal if post is already a question
-
-        reputation = Repute(user=author,
-                positive=\
-                    askbot_settings.REP_GAIN_FOR_RECEIVING_DOWNVOTE_CANCELATION,
-                question=question,
-                reputed_at=timestamp,
-                reputation_type=4,
-                reputation=author.reputation
-            )
-        reputation.save()
-
-        user.receive_reputation(askbot_settings.REP_GAIN_FOR_CANCELING_DOWNVOTE)
-        user.save()
-
-        reputation = Repute(user=user,
-                   positive=askbot_settings.REP_GAIN_FOR_CANCELING_DOWNVOTE,
-                   question=question,
-                   reputed_at=timestamp,
-                   reputation_type=5,
-                   reputation=user.reputation)
-        reputation.save()
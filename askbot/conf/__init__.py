@@ -38,6 +38,9 @@ def should_show_sort_by_relevance():
     """True if configuration support sorting
     questions by search relevance
     """
+    from askbot.search import local_search
+    if local_search.is_enabled():
+        return True
     return ('postgresql_psycopg2' in askbot.get_database_engine_name())
 
 def get_tag_display_filter_strategy_choices():
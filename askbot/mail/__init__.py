@@ -13,6 +13,8 @@ from askbot import exceptions
 from askbot import const
 from askbot.conf import settings as askbot_settings
 from askbot.mail import parsing
+from askbot.mail import send_queue
+from askbot.mail import transport
 from askbot.utils import url_utils
 from askbot.utils.file_utils import store_file
 from askbot.utils.html import absolutize_urls
@@ -88,8 +90,8 @@ def thread_headers(post, orig_post, update):
 
     return headers
 
-def _send_mail(subject_line, body_text, sender_email, recipient_list, headers=None):
-    """base send_mail function, which will attach email in html format
+def build_message(subject_line, body_text, sender_email, recipient_list, headers=None):
+    """returns email message, with the alternative in html format
     if html email is enabled"""
     html_enabled = askbot_settings.HTML_EMAIL_ENABLED
     if html_enabled:
@@ -106,7 +108,62 @@ def _send_mail(subject_line, body_text, sender_email, recipient_list, headers=No
             )
     if html_enabled:
         msg.attach_alternative(body_text, "text/html")
-    msg.send()
+    return msg
+
+def _send_mail(subject_line, body_text, sender_email, recipient_list, headers=None):
+    """base send_mail function, sends the message
+    over the pooled connection or saves it to the outgoing queue"""
+    msg = build_message(
+                subject_line,
+                body_text,
+                sender_email,
+                recipient_list,
+                headers=headers
+            )
+    if send_queue.is_enabled():
+        send_queue.enqueue([msg])
+    else:
+        transport.send_messages([msg])
+
+def make_message(
+            subject_line=None,
+            body_text=None,
+            from_email=None,
+            recipient_list=None,
+            headers=None
+        ):
+    """returns message as would be sent by the :func:`send_mail`,
+    to be sent in a batch with the :func:`send_messages`"""
+    from_email = from_email or askbot_settings.ADMIN_EMAIL or \
+                                    django_settings.DEFAULT_FROM_EMAIL
+    return build_message(
+                prefix_the_subject_line(subject_line),
+                absolutize_urls(body_text),
+                from_email,
+                recipient_list,
+                headers=dict(headers or {})
+            )
+
+def send_messages(messages, raise_on_failure=False):
+    """sends the messages made by the :func:`make_message`
+    over one pooled connection or saves them to the outgoing queue,
+    returns number of the sent or queued messages
+
+    if raise_on_failure is True, exceptions.EmailNotSent is raised
+    """
+    if send_queue.is_enabled():
+        send_queue.enqueue(messages)
+        return len(messages)
+    errors = list()
+    sent_count = transport.send_messages(messages, errors=errors)
+    logging.debug('sent %d updates' % sent_count)
+    for message, error in errors:
+        sys.stderr.write('\n' + unicode(error).encode('utf-8') + '\n')
+    if errors and raise_on_failure == True:
+        raise exceptions.EmailNotSent(
+            '; '.join([unicode(error) for message, error in errors])
+        )
+    return sent_count
 
 def send_mail(
             subject_line=None,
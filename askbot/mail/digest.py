@@ -0,0 +1,861 @@
+"""Builder of the delayed email alerts ("digests"),
+sent by the command ``python manage.py send_email_alerts``.
+
+Subscribers with the due subscriptions are processed in batches
+of :data:`BATCH_SIZE` users. The threads active since the oldest
+due report, their tags and changes - new questions, edits of the
+questions, new answers and edits of the answers - are loaded once
+per run and shared by the batches. For each batch a few set-based
+queries load the comments and mentions, the followed, asked and
+answered threads, the tag selections, the question visits
+and the records of the previously sent alerts. Then the tuples
+(subscriber, thread, kind of change) are grouped per user in memory
+and the emails are rendered and sent one by one.
+
+The changes are reported since the previous report
+of the subscription, or since the user has joined the site,
+if nothing was reported yet, but not older than :data:`MAX_REPORT_AGE`.
+A thread is skipped, if the user
+has visited it after the last activity, if the last activity
+is by the user, or if an alert about the thread has
+already been sent in the current period of the subscription.
+
+The subscribers can be split into shards by the ranges of the user ids,
+run in the parallel worker processes or as separate celery tasks.
+Each batch is read after the last user id of the previous one,
+so the memory use of the worker does not grow with the number of users.
+The subscriptions and the alert records of a batch are updated after
+its emails are sent; with a checkpoint file, the id of the last user
+who has received the email is saved, so the interrupted run
+resumed with the same file does not send the emails again.
+"""
+import datetime
+import multiprocessing
+import time
+from django.conf import settings as django_settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.db import reset_queries
+from django.db.models import Count, Max, Min, Q
+from django.template.loader import get_template
+from django.utils.datastructures import SortedDict
+from django.utils.translation import ugettext as _
+from django.utils.translation import ungettext
+from django.utils.translation import activate as activate_language
+from askbot import const
+from askbot import mail
+from askbot.conf import settings as askbot_settings
+from askbot.models import Activity, ActivityAuditStatus, EmailFeedSetting
+from askbot.models import MarkedTag, Post, PostRevision, PostToGroup
+from askbot.models import QuestionView, Thread, User
+from askbot.models.user import AuthUserGroups
+from askbot.search.bulk_indexer import Checkpoint
+from askbot.utils.html import site_url
+
+#number of the subscribers processed together
+BATCH_SIZE = 500
+#maximum number of ids in one "IN" clause
+CHUNK_SIZE = 500
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+#changes older than this are not reported, even if the subscription
+#has not been reported for longer, e.g. since the user has joined
+MAX_REPORT_AGE = datetime.timedelta(days=28)
+
+def chunks(values, size=CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def get_due_feeds_filter(now):
+    """returns filter for the subscriptions due to be reported"""
+    due_filter = Q(reported_at__isnull=True)
+    for frequency in ('d', 'w'):
+        cutoff_time = now - EmailFeedSetting.DELTA_TABLE[frequency]
+        due_filter |= Q(frequency=frequency, reported_at__lte=cutoff_time)
+    return Q(frequency__in=('d', 'w')) & due_filter
+
+
+def get_shard_ranges(shard_count):
+    """returns list of ``shard_count`` tuples (start id, end id)
+    of the ranges of the user ids, the end id is not included,
+    ``None`` means that the range is open on that side"""
+    id_range = User.objects.aggregate(Min('id'), Max('id'))
+    if shard_count == 1 or id_range['id__min'] is None:
+        return [(None, None)] * shard_count
+    span = (id_range['id__max'] - id_range['id__min']) / shard_count + 1
+    ranges = list()
+    for shard in range(shard_count):
+        start_id = id_range['id__min'] + shard * span
+        ranges.append((start_id, start_id + span))
+    #users who join during the run belong to the last shard
+    ranges[0] = (None, ranges[0][1])
+    ranges[-1] = (ranges[-1][0], None)
+    return ranges
+
+
+def get_id_range_filter(start_id=None, end_id=None, field='id'):
+    """returns filter of the users with the ids
+    from ``start_id`` up to, but not including ``end_id``"""
+    id_filter = Q()
+    if start_id is not None:
+        id_filter &= Q(**{field + '__gte': start_id})
+    if end_id is not None:
+        id_filter &= Q(**{field + '__lt': end_id})
+    return id_filter
+
+
+def get_checkpoint_path(checkpoint_path, shard, shard_count):
+    """checkpoint files are separate per shard"""
+    return '%s.%d-%d' % (checkpoint_path, shard, shard_count)
+
+
+def add_missing_subscriptions(user_filter=None):
+    """adds the missing subscription records of the users,
+    so that their default subscriptions are reported"""
+    from askbot import forms#need to avoid circular dependency
+    form = forms.EditUserEmailFeedsForm()
+    feed_type_count = len(form.get_db_model_subscription_type_names())
+    users = User.objects.filter(user_filter or Q()).annotate(
+                        feed_count=Count('notification_subscriptions')
+                    ).filter(feed_count__lt=feed_type_count)
+    for user in users:
+        user.add_missing_askbot_subscriptions()
+
+
+def format_action_count(string, number, output):
+    if number > 0:
+        output.append(_(string) % {'num':number})
+
+
+def get_run_start_time(due_feeds, now):
+    """returns the earliest time since which the changes
+    may be reported to the subscribers with the ``due_feeds``"""
+    earliest_time = now - MAX_REPORT_AGE
+    if due_feeds.filter(reported_at__isnull=True).exists():
+        return earliest_time
+    reported_at = due_feeds.aggregate(Min('reported_at'))['reported_at__min']
+    return max(earliest_time, reported_at or now)
+
+
+class DigestThreads(object):
+    """threads active since the ``start_time`` with their changes
+    and tags, loaded once per run and shared by the batches"""
+
+    def __init__(self, start_time):
+        self.start_time = start_time
+        #thread id -> thread, threads with the question data
+        self.threads = dict()
+        #thread id -> dict of the change lists
+        self.changes = dict()
+        #thread id -> list of tuples (tag id, tag name)
+        self.thread_tags = dict()
+        #question author id -> set of thread ids
+        self.asked = dict()
+        self.loaded_ids = set()
+        self.sorted_threads = None
+        self.load_threads(
+            Thread.objects.filter(last_activity_at__gte=self.start_time)
+        )
+        self.load_changes()
+        self.load_thread_tags()
+
+    def load_threads(self, threads):
+        """loads the threads which can be reported and their questions"""
+        threads = threads.filter(closed=False, deleted=False)
+        questions = Post.objects.filter(
+                            post_type='question',
+                            deleted=False,
+                            thread__in=threads
+                        )
+        if askbot_settings.CONTENT_MODERATION_MODE == 'premoderation':
+            questions = questions.filter(approved=True)
+        questions = questions.values_list('thread_id', 'id', 'author_id', 'added_at')
+        question_data = dict([(row[0], row[1:]) for row in questions])
+
+        for thread in threads:
+            self.loaded_ids.add(thread.id)
+            if thread.id not in question_data:
+                continue
+            thread.question_id, thread.question_author_id, thread.question_added_at = \
+                                                        question_data[thread.id]
+            self.threads[thread.id] = thread
+            self.asked.setdefault(thread.question_author_id, set()).add(thread.id)
+            self.changes[thread.id] = {
+                'question_edits': list(),
+                'answers': list(),
+                'answer_edits': list()
+            }
+        self.sorted_threads = None
+
+    def add_threads(self, thread_ids):
+        """loads the threads, which are not loaded yet,
+        e.g. those with the comments, which do not change
+        the last activity of the threads"""
+        thread_ids = set(thread_ids) - self.loaded_ids
+        thread_ids.discard(None)
+        for ids in chunks(thread_ids):
+            self.loaded_ids.update(ids)
+            self.load_threads(Thread.objects.filter(id__in=ids))
+
+    def get_threads(self, thread_ids):
+        """returns list of the loaded threads with the given ids,
+        the recently active first"""
+        threads = [
+            self.threads[thread_id] for thread_id in thread_ids \
+                if thread_id in self.threads
+        ]
+        threads.sort(key=lambda thread: thread.last_activity_at, reverse=True)
+        return threads
+
+    def get_sorted_threads(self):
+        """returns list of the threads, the recently active first"""
+        if self.sorted_threads is None:
+            self.sorted_threads = sorted(
+                        self.threads.values(),
+                        key=lambda thread: thread.last_activity_at,
+                        reverse=True
+                    )
+        return self.sorted_threads
+
+    def load_changes(self):
+        """loads the edits of the questions, new answers
+        and the edits of the answers"""
+        revisions = PostRevision.objects.filter(
+                                revised_at__gte=self.start_time,
+                                revision__gt=1,
+                                post__deleted=False,
+                                post__thread__last_activity_at__gte=self.start_time
+                            )
+        question_edits = revisions.filter(
+                                post__post_type='question'
+                            ).values_list('post__thread_id', 'author_id', 'revised_at')
+        for thread_id, author_id, revised_at in question_edits:
+            if thread_id in self.changes:
+                self.changes[thread_id]['question_edits'].append((author_id, revised_at))
+
+        answers = Post.objects.filter(
+                                post_type='answer',
+                                deleted=False,
+                                added_at__gte=self.start_time,
+                                thread__last_activity_at__gte=self.start_time
+                            ).values_list('thread_id', 'id', 'author_id', 'added_at')
+        answer_ids = set()
+        for thread_id, answer_id, author_id, added_at in answers:
+            if thread_id in self.changes:
+                self.changes[thread_id]['answers'].append((answer_id, author_id, added_at))
+                answer_ids.add(answer_id)
+
+        answer_edits = revisions.filter(
+                                post__post_type='answer'
+                            ).values_list(
+                                'post__thread_id', 'post_id', 'author_id', 'revised_at'
+                            )
+        for thread_id, answer_id, author_id, revised_at in answer_edits:
+            if thread_id in self.changes:
+                self.changes[thread_id]['answer_edits'].append(
+                                                (answer_id, author_id, revised_at)
+                                            )
+                answer_ids.add(answer_id)
+
+        #answer id -> set of group ids
+        self.answer_groups = None
+        if askbot_settings.GROUPS_ENABLED:
+            self.answer_groups = dict()
+            for ids in chunks(answer_ids):
+                post_groups = PostToGroup.objects.filter(
+                                        post__id__in=ids
+                                    ).values_list('post_id', 'group_id')
+                for answer_id, group_id in post_groups:
+                    self.answer_groups.setdefault(answer_id, set()).add(group_id)
+
+    def load_thread_tags(self):
+        thread_tags = Thread.tags.through.objects.filter(
+                                thread__last_activity_at__gte=self.start_time
+                            ).values_list('thread_id', 'tag_id', 'tag__name')
+        for thread_id, tag_id, tag_name in thread_tags:
+            self.thread_tags.setdefault(thread_id, list()).append((tag_id, tag_name))
+
+
+class DigestBatch(object):
+    """subscription data of a batch of the subscribers,
+    the changes of the threads are taken from the :class:`DigestThreads`"""
+
+    def __init__(self, users, feeds, now, thread_data=None):
+        self.users = users
+        self.now = now
+        #user id -> list of the due subscriptions
+        self.feeds = dict()
+        for feed in feeds:
+            self.feeds.setdefault(feed.subscriber_id, list()).append(feed)
+
+        self.start_times = dict()
+        for user in users:
+            for feed in self.feeds[user.id]:
+                self.start_times[feed.id] = self.get_start_time(user, feed)
+        self.start_time = min(self.start_times.values())
+
+        if thread_data is None:
+            thread_data = DigestThreads(self.start_time)
+        self.thread_data = thread_data
+        self.threads = thread_data.threads
+        self.changes = thread_data.changes
+        self.thread_tags = thread_data.thread_tags
+        self.answer_groups = thread_data.answer_groups
+        self.load_user_groups()
+        self.load_subscriptions()
+        self.load_responses()
+
+    def get_start_time(self, user, feed):
+        """returns the time since which the changes are reported"""
+        start_time = user.date_joined
+        if feed.reported_at and feed.reported_at > start_time:
+            start_time = feed.reported_at
+        return max(start_time, self.now - MAX_REPORT_AGE)
+
+    def get_user_ids(self, feed_type=None):
+        if feed_type is None:
+            return [user.id for user in self.users]
+        return [
+            user.id for user in self.users \
+                if feed_type in [feed.feed_type for feed in self.feeds[user.id]]
+        ]
+
+    def load_user_groups(self):
+        #user id -> set of group ids
+        self.user_groups = dict()
+        if self.answer_groups is None:
+            return
+        memberships = AuthUserGroups.objects.filter(
+                                user__id__in=self.get_user_ids()
+                            ).values_list('user_id', 'group_id')
+        for user_id, group_id in memberships:
+            self.user_groups.setdefault(user_id, set()).add(group_id)
+
+    def load_subscriptions(self):
+        """loads the followed and the answered threads,
+        selections of the tags and the visits of the questions"""
+        active_threads = Q(thread__last_activity_at__gte=self.start_time)
+
+        #user id -> set of thread ids
+        self.followed = dict()
+        user_ids = self.get_user_ids('q_sel')
+        if user_ids:
+            follows = Thread.followed_by.through.objects.filter(
+                                    active_threads, user__id__in=user_ids
+                                ).values_list('user_id', 'thread_id')
+            for user_id, thread_id in follows:
+                self.followed.setdefault(user_id, set()).add(thread_id)
+
+        #user id -> set of thread ids
+        self.answered = dict()
+        user_ids = self.get_user_ids('q_ans')
+        if user_ids:
+            answers = Post.objects.filter(
+                                    active_threads,
+                                    post_type='answer',
+                                    author__id__in=user_ids
+                                ).values_list('author_id', 'thread_id').distinct()
+            for user_id, thread_id in answers:
+                self.answered.setdefault(user_id, set()).add(thread_id)
+
+        #user id -> reason -> set of tag ids
+        self.marked_tags = dict()
+        user_ids = self.get_user_ids('q_all')
+        if user_ids:
+            marks = MarkedTag.objects.filter(
+                                    user__id__in=user_ids
+                                ).values_list('user_id', 'reason', 'tag_id')
+            for user_id, reason, tag_id in marks:
+                user_marks = self.marked_tags.setdefault(user_id, dict())
+                user_marks.setdefault(reason, set()).add(tag_id)
+
+        #(user id, thread id) -> time of the last visit
+        self.visits = dict()
+        visits = QuestionView.objects.filter(
+                                who__id__in=self.get_user_ids(),
+                                question__thread__last_activity_at__gte=self.start_time
+                            ).values_list('who_id', 'question__thread_id', 'when')
+        for user_id, thread_id, visited_at in visits:
+            key = (user_id, thread_id)
+            self.visits[key] = max(visited_at, self.visits.get(key, visited_at))
+
+    def load_responses(self):
+        """loads comments to the posts of the users
+        and the mentions of the users"""
+        #user id -> thread id -> list of tuples (author id, time)
+        self.comments = dict()
+        self.mentions = dict()
+        user_ids = self.get_user_ids('m_and_c')
+        if not user_ids:
+            return
+
+        comments = Post.objects.filter(
+                            post_type='comment',
+                            deleted=False,
+                            added_at__gte=self.start_time,
+                            parent__author__id__in=user_ids
+                        ).values_list('parent__author_id', 'thread_id', 'author_id', 'added_at')
+        for user_id, thread_id, author_id, added_at in comments:
+            user_comments = self.comments.setdefault(user_id, dict())
+            user_comments.setdefault(thread_id, list()).append((author_id, added_at))
+
+        mentions = ActivityAuditStatus.objects.filter(
+                            user__id__in=user_ids,
+                            activity__activity_type=const.TYPE_ACTIVITY_MENTION,
+                            activity__active_at__gte=self.start_time
+                        ).values_list(
+                            'user_id',
+                            'activity__question__thread_id',
+                            'activity__user_id',
+                            'activity__active_at'
+                        )
+        for user_id, thread_id, author_id, mentioned_at in mentions:
+            user_mentions = self.mentions.setdefault(user_id, dict())
+            user_mentions.setdefault(thread_id, list()).append((author_id, mentioned_at))
+
+        #comments do not change the last activity of the threads
+        thread_ids = set()
+        for responses in self.comments.values() + self.mentions.values():
+            thread_ids.update(responses.keys())
+        self.thread_data.add_threads(thread_ids)
+
+    def load_sent_alerts(self, question_ids):
+        """loads the records of the alerts about the questions
+        sent to the users of the batch"""
+        #(user id, question id) -> (activity id, time of the alert)
+        self.sent_alerts = dict()
+        content_type = ContentType.objects.get_for_model(Post)
+        for ids in chunks(question_ids):
+            alerts = Activity.objects.filter(
+                            user__id__in=self.get_user_ids(),
+                            activity_type=const.TYPE_ACTIVITY_EMAIL_UPDATE_SENT,
+                            content_type=content_type,
+                            object_id__in=ids
+                        ).values_list('user_id', 'object_id', 'id', 'active_at')
+            for user_id, question_id, activity_id, sent_at in alerts:
+                key = (user_id, question_id)
+                if key not in self.sent_alerts or sent_at > self.sent_alerts[key][1]:
+                    self.sent_alerts[key] = (activity_id, sent_at)
+
+    def is_visible(self, user, thread):
+        """True if the news of the thread are not known to the user yet"""
+        if thread.last_activity_by_id == user.id:
+            return False
+        visited_at = self.visits.get((user.id, thread.id))
+        return visited_at is None or visited_at < thread.last_activity_at
+
+    def get_tag_filter(self, user):
+        """returns function telling if the thread passes the tag
+        filter of the user, or ``None`` if all threads pass,
+        and True if the threads are selected by the tags,
+        rather than filtered"""
+        strategy = user.email_tag_filter_strategy
+        marks = self.marked_tags.get(user.id, dict())
+        if strategy == const.EXCLUDE_IGNORED:
+            tag_ids = marks.get('bad', set())
+            wildcards = user.ignored_tags.strip().split()
+        elif strategy == const.INCLUDE_INTERESTING \
+            and not askbot_settings.SUBSCRIBED_TAG_SELECTOR_ENABLED:
+            tag_ids = marks.get('good', set())
+            wildcards = user.interesting_tags.strip().split()
+        elif strategy in (const.INCLUDE_INTERESTING, const.INCLUDE_SUBSCRIBED):
+            tag_ids = marks.get('subscribed', set())
+            wildcards = user.subscribed_tags.strip().split()
+        else:
+            return None, False
+
+        prefixes = tuple([wildcard[:-1] for wildcard in wildcards])
+
+        def is_marked(thread):
+            for tag_id, tag_name in self.thread_tags.get(thread.id, ()):
+                if tag_id in tag_ids or (prefixes and tag_name.startswith(prefixes)):
+                    return True
+            return False
+
+        if strategy == const.EXCLUDE_IGNORED:
+            return lambda thread: not is_marked(thread), False
+        return is_marked, True
+
+    def get_all_questions_threads(self, user, start_time, languages):
+        """returns up to ``MAX_ALERTS_PER_EMAIL`` recently active threads
+        for the subscription to all questions, and True if the threads
+        were selected by the tags; the threads are scanned from the
+        most recently active and the scan stops as soon as enough
+        threads are found"""
+        max_alerts = askbot_settings.MAX_ALERTS_PER_EMAIL
+        tag_filter, selected = self.get_tag_filter(user)
+        threads = list()
+        for thread in self.thread_data.get_sorted_threads():
+            if len(threads) >= max_alerts or thread.last_activity_at < start_time:
+                break
+            if languages and thread.language_code not in languages:
+                continue
+            if not self.is_visible(user, thread):
+                continue
+            if tag_filter and not tag_filter(thread):
+                continue
+            threads.append(thread)
+        return threads, selected
+
+    def get_user_threads(self, user):
+        """returns sorted dictionary thread -> meta data
+        of the threads which may be reported to the user,
+        in the order of the report"""
+        if getattr(django_settings, 'ASKBOT_MULTILINGUAL', False):
+            languages = user.languages.split()
+        else:
+            languages = None
+
+        groups = SortedDict()
+        limited = set()
+        max_alerts = askbot_settings.MAX_ALERTS_PER_EMAIL
+        for feed in self.feeds[user.id]:
+            start_time = self.start_times[feed.id]
+            if feed.feed_type == 'm_and_c':
+                for name, responses in (('comments', self.comments), ('mentions', self.mentions)):
+                    user_responses = responses.get(user.id, dict())
+                    thread_responses = list()
+                    for thread in self.thread_data.get_threads(user_responses.keys()):
+                        if languages and thread.language_code not in languages:
+                            continue
+                        times = [
+                            at for author_id, at in user_responses[thread.id] \
+                                if at >= start_time and author_id != user.id
+                        ]
+                        if times and (name == 'comments' or self.is_visible(user, thread)):
+                            thread_responses.append((thread, {name: times}))
+                    groups[name] = (feed, thread_responses)
+                continue
+
+            if feed.feed_type == 'q_all':
+                feed_threads, selected = self.get_all_questions_threads(
+                                                    user, start_time, languages
+                                                )
+                if not selected:
+                    limited.add(feed.feed_type)
+                groups[feed.feed_type] = (feed, [(thread, dict()) for thread in feed_threads])
+                continue
+
+            if feed.feed_type == 'q_sel':
+                thread_ids = self.followed.get(user.id, ())
+            elif feed.feed_type == 'q_ask':
+                thread_ids = self.thread_data.asked.get(user.id, ())
+                limited.add(feed.feed_type)
+            elif feed.feed_type == 'q_ans':
+                thread_ids = self.answered.get(user.id, ())
+                limited.add(feed.feed_type)
+            else:
+                continue
+            feed_threads = [
+                thread for thread in self.thread_data.get_threads(thread_ids) \
+                    if thread.last_activity_at >= start_time \
+                        and (not languages or thread.language_code in languages) \
+                        and self.is_visible(user, thread)
+            ]
+            if feed.feed_type == 'q_ans':
+                feed_threads = feed_threads[:max_alerts]
+            groups[feed.feed_type] = (feed, [(thread, dict()) for thread in feed_threads])
+
+        #threads selected by the user go first, the rest
+        #is added while the report is shorter than the maximum
+        user_threads = SortedDict()
+        order = ('q_sel', 'comments', 'mentions', 'q_all', 'q_ask', 'q_ans')
+        for name in sorted(groups.keys(), key=lambda name: (name in limited, order.index(name))):
+            if name in limited and len(user_threads) >= max_alerts:
+                continue
+            feed, group_threads = groups[name]
+            start_time = self.start_times[feed.id]
+            cutoff_time = feed.get_previous_report_cutoff_time()
+            for thread, responses in group_threads:
+                meta_data = user_threads.setdefault(thread, {
+                                            'start_time': start_time,
+                                            'cutoff_time': cutoff_time,
+                                            'comments': list(),
+                                            'mentions': list()
+                                        })
+                #the earliest start and the latest cutoff time win,
+                #if the thread falls into several subscriptions
+                meta_data['start_time'] = min(meta_data['start_time'], start_time)
+                meta_data['cutoff_time'] = max(meta_data['cutoff_time'], cutoff_time)
+                for key, times in responses.items():
+                    meta_data[key].extend(times)
+        return user_threads
+
+    def can_see_answer(self, user, answer_id):
+        if self.answer_groups is None:
+            return True
+        answer_groups = self.answer_groups.get(answer_id, set())
+        return len(answer_groups & self.user_groups.get(user.id, set())) > 0
+
+    def get_news(self, user, thread, meta_data):
+        """returns dictionary with the numbers of the changes in
+        the thread not reported to the user yet, or ``None``
+        if the thread must be skipped"""
+        sent_at = None
+        alert = self.sent_alerts.get((user.id, thread.question_id))
+        if alert:
+            sent_at = alert[1]
+            last_change_at = max(
+                    [thread.last_activity_at] + meta_data['comments'] + meta_data['mentions']
+                )
+            if sent_at > meta_data['cutoff_time'] or sent_at > last_change_at:
+                return None
+
+        start_time = meta_data['start_time']
+        def is_new(author_id, changed_at):
+            return author_id != user.id and changed_at >= start_time \
+                and (sent_at is None or changed_at > sent_at)
+
+        changes = self.changes[thread.id]
+        news = {
+            'new_q': is_new(thread.question_author_id, thread.question_added_at),
+            'q_rev': len([
+                1 for author_id, at in changes['question_edits'] if is_new(author_id, at)
+            ]),
+            'new_ans': len([
+                1 for answer_id, author_id, at in changes['answers'] \
+                    if is_new(author_id, at) and self.can_see_answer(user, answer_id)
+            ]),
+            'ans_rev': len([
+                1 for answer_id, author_id, at in changes['answer_edits'] \
+                    if is_new(author_id, at) and self.can_see_answer(user, answer_id)
+            ]),
+            'comments': len([
+                1 for at in meta_data['comments'] if sent_at is None or at > sent_at
+            ]),
+            'mentions': len([
+                1 for at in meta_data['mentions'] if sent_at is None or at > sent_at
+            ])
+        }
+        if sum(news.values()) == 0:
+            return None
+        return news
+
+    def get_digests(self):
+        """returns list of tuples (user, sorted dictionary thread -> news)
+        of the users who have news"""
+        user_threads = list()
+        question_ids = set()
+        for user in self.users:
+            threads = self.get_user_threads(user)
+            if threads:
+                user_threads.append((user, threads))
+                question_ids.update([thread.question_id for thread in threads])
+
+        self.load_sent_alerts(question_ids)
+        digests = list()
+        for user, threads in user_threads:
+            digest = SortedDict()
+            for thread, meta_data in threads.items():
+                news = self.get_news(user, thread, meta_data)
+                if news:
+                    digest[thread] = news
+            if digest:
+                digests.append((user, digest))
+        return digests
+
+    def save_sent_alerts(self, digests):
+        """records the time of the alerts about the reported questions"""
+        content_type = ContentType.objects.get_for_model(Post)
+        activity_ids = list()
+        new_alerts = list()
+        for user, digest in digests:
+            for thread in digest:
+                alert = self.sent_alerts.get((user.id, thread.question_id))
+                if alert:
+                    activity_ids.append(alert[0])
+                else:
+                    new_alerts.append(Activity(
+                            user=user,
+                            content_type=content_type,
+                            object_id=thread.question_id,
+                            activity_type=const.TYPE_ACTIVITY_EMAIL_UPDATE_SENT,
+                            active_at=self.now
+                        ))
+        for ids in chunks(activity_ids):
+            Activity.objects.filter(id__in=ids).update(active_at=self.now)
+        Activity.objects.bulk_create(new_alerts)
+
+
+def send_digest(user, digest, template):
+    """renders and sends the email with the news of the threads"""
+    question_count = len(digest)
+    tag_summary = Thread.objects.get_tag_summary_from_threads(digest.keys())
+    if tag_summary:
+        subject_line = ungettext(
+            '%(question_count)d update about %(topics)s',
+            '%(question_count)d updates about %(topics)s',
+            question_count
+        ) % {
+            'question_count': question_count,
+            'topics': tag_summary
+        }
+    else:
+        subject_line = ungettext(
+            '%(question_count)d update',
+            '%(question_count)d updates',
+            question_count
+        ) % {
+            'question_count': question_count,
+        }
+
+    questions_data = list()
+    for thread, news in digest.items()[:askbot_settings.MAX_ALERTS_PER_EMAIL]:
+        act_list = []
+        if news['new_q']:
+            act_list.append(_('new question'))
+        format_action_count('%(num)d rev', news['q_rev'], act_list)
+        format_action_count('%(num)d ans', news['new_ans'], act_list)
+        format_action_count('%(num)d ans rev', news['ans_rev'], act_list)
+        questions_data.append({
+            'url': site_url(thread.get_absolute_url()),
+            'info': ', '.join(act_list),
+            'title': thread.title
+        })
+
+    activate_language(user.get_primary_language())
+    text = template.render({
+        'recipient_user': user,
+        'questions': questions_data,
+        'name': user.username,
+        'admin_email': askbot_settings.ADMIN_EMAIL,
+        'site_name': askbot_settings.APP_SHORT_NAME,
+        'is_multilingual': getattr(django_settings, 'ASKBOT_MULTILINGUAL', False)
+    })
+
+    mail.send_mail(
+        subject_line=subject_line,
+        body_text=text,
+        recipient_list=[user.email]
+    )
+
+
+def send_digests(batch_size=BATCH_SIZE, report=None,
+                 start_id=None, end_id=None, checkpoint_path=None):
+    """sends the delayed email alerts to the users with the ids
+    from ``start_id`` up to, but not including ``end_id``
+    (see :func:`get_shard_ranges`), who have the due subscriptions,
+    marks the subscriptions reported.
+
+    ``report`` - optional callable, receiving the dictionary
+    with the progress after each batch.
+    ``checkpoint_path`` - optional file to save the progress to,
+    the interrupted run is resumed when the function is called
+    again with the same file, for the same range of the users.
+    Returns the dictionary with the totals.
+    """
+    activate_language(django_settings.LANGUAGE_CODE)
+    template = get_template('email/delayed_email_alert.html')
+
+    now = datetime.datetime.now()
+    sent_user_id = None
+    checkpoint = None
+    if checkpoint_path:
+        checkpoint = Checkpoint(checkpoint_path)
+        if checkpoint.get('now'):
+            #resumed run reports the same period
+            #to the same users as the interrupted one
+            now = datetime.datetime.strptime(checkpoint.get('now'), TIME_FORMAT)
+            sent_user_id = checkpoint.get('sent_user_id')
+            start_id = checkpoint.get('start_id')
+            end_id = checkpoint.get('end_id')
+        else:
+            checkpoint.set('start_id', start_id)
+            checkpoint.set('end_id', end_id)
+            checkpoint.set('now', now.strftime(TIME_FORMAT))
+
+    add_missing_subscriptions(get_id_range_filter(start_id, end_id))
+    due_feeds = EmailFeedSetting.objects.filter(
+                                get_due_feeds_filter(now),
+                                get_id_range_filter(start_id, end_id, 'subscriber__id')
+                            )
+    user_ids = due_feeds.order_by('subscriber').values_list('subscriber_id', flat=True)
+    progress = {
+        'users': user_ids.distinct().count(),
+        'processed': 0,
+        'emails': 0,
+        'elapsed': 0
+    }
+    started_at = time.time()
+    #threads and their changes are loaded once for all batches
+    thread_data = None
+    last_user_id = 0
+    while True:
+        ids = list(user_ids.filter(subscriber__id__gt=last_user_id).distinct()[:batch_size])
+        if len(ids) == 0:
+            break
+        users = list(User.objects.filter(id__in=ids).order_by('id'))
+        feeds = list(due_feeds.filter(subscriber__id__in=ids))
+        if thread_data is None:
+            thread_data = DigestThreads(get_run_start_time(due_feeds, now))
+        batch = DigestBatch(users, feeds, now, thread_data)
+        digests = batch.get_digests()
+
+        for user, digest in digests:
+            if sent_user_id and user.id <= sent_user_id:
+                continue#sent before the interruption
+            send_digest(user, digest, template)
+            if checkpoint:
+                checkpoint.set('sent_user_id', user.id)
+
+        batch.save_sent_alerts(digests)
+        EmailFeedSetting.objects.filter(
+                            id__in=[feed.id for feed in feeds]
+                        ).update(reported_at=now)
+
+        last_user_id = ids[-1]
+        progress['processed'] += len(users)
+        progress['emails'] += len(digests)
+        progress['elapsed'] = time.time() - started_at
+        if report:
+            report(progress)
+        #query log grows without limit when DEBUG is True
+        reset_queries()
+
+    if checkpoint:
+        checkpoint.delete()
+    activate_language(django_settings.LANGUAGE_CODE)
+    return progress
+
+
+def _send_shard(args):
+    """runs :func:`send_digests` in the worker process"""
+    start_id, end_id, batch_size, checkpoint_path = args
+    try:
+        return send_digests(
+                        batch_size=batch_size,
+                        start_id=start_id,
+                        end_id=end_id,
+                        checkpoint_path=checkpoint_path
+                    )
+    finally:
+        connection.close()
+
+
+def send_digests_in_shards(shard_count, batch_size=BATCH_SIZE,
+                           checkpoint_path=None, parallel=False):
+    """sends the alerts to all shards of the users, optionally
+    in parallel worker processes - one per shard, with separate
+    checkpoint files per shard.
+    Returns list of the totals returned by :func:`send_digests`
+    """
+    jobs = list()
+    for shard, (start_id, end_id) in enumerate(get_shard_ranges(shard_count)):
+        shard_checkpoint_path = None
+        if checkpoint_path:
+            shard_checkpoint_path = get_checkpoint_path(
+                                                checkpoint_path, shard, shard_count
+                                            )
+        jobs.append((start_id, end_id, batch_size, shard_checkpoint_path))
+
+    if parallel and len(jobs) > 1:
+        #forked workers must not share the database connection
+        connection.close()
+        pool = multiprocessing.Pool(len(jobs))
+        try:
+            return pool.map(_send_shard, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    return map(_send_shard, jobs)
@@ -0,0 +1,345 @@
+"""Persistent queue of the outgoing email.
+
+When the queue is enabled, :func:`askbot.mail.send_mail` and
+:func:`askbot.mail.send_messages` do not talk to the mail server,
+but save the messages - one record per recipient - into the table
+:class:`~askbot.models.OutgoingEmail`, in the same transaction
+as the rest of the changes. The messages are sent by :func:`drain`,
+called from the celery task ``drain_mail_queue_celery_task``
+or the command ``python manage.py drain_mail_queue``.
+
+The drainer claims a batch of the due messages, so several drainers
+may run at once, and sends them with a pool of worker threads, each
+using its own pooled connection from the :mod:`askbot.mail.transport`.
+Messages to each recipient domain are paced to the rate limit of the
+domain, a batch holds only as many messages as can be sent at these
+rates within a half of :data:`CLAIM_TIMEOUT`. The rate limits apply
+per drainer process: with N drainers running at once a domain may
+receive up to N times its limit, so when the limits matter,
+run a single drainer with more worker threads. The failed messages are retried with the
+exponential backoff, after :data:`MAX_ATTEMPTS` attempts or on a permanent
+error they become "dead letters" - kept in the table with the last error,
+until requeued with :func:`requeue_dead` or deleted.
+Messages claimed by a drainer which has crashed are
+returned to the queue after :data:`CLAIM_TIMEOUT` seconds,
+so a message may be sent twice, but is not lost.
+
+:func:`get_stats` returns the depth of the queue and the
+send latency of the last drain run.
+
+The queue is enabled with ``ASKBOT_MAIL_QUEUE_ENABLED = True``
+in the ``settings.py`` file, the rate limits are set with
+``ASKBOT_MAIL_QUEUE_DOMAIN_RATE`` and ``ASKBOT_MAIL_QUEUE_DOMAIN_RATES``.
+"""
+import datetime
+import logging
+import Queue
+import threading
+import time
+import uuid
+from django.conf import settings as django_settings
+from django.core import cache
+from django.core import mail
+from django.db.models import Count, Min
+from django.utils import simplejson
+from askbot import const
+from askbot.mail import transport
+
+STATS_CACHE_KEY = 'askbot-mail-queue-stats'
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 60
+CLAIM_TIMEOUT = 600
+
+def is_enabled():
+    return getattr(django_settings, 'ASKBOT_MAIL_QUEUE_ENABLED', False)
+
+
+def get_domain_rate(domain):
+    """maximum number of messages per second
+    sent to the domain, ``None`` - no limit"""
+    rates = getattr(django_settings, 'ASKBOT_MAIL_QUEUE_DOMAIN_RATES', {})
+    if domain in rates:
+        return rates[domain]
+    return getattr(django_settings, 'ASKBOT_MAIL_QUEUE_DOMAIN_RATE', 10)
+
+
+def get_domain(email):
+    return email.rsplit('@', 1)[-1].strip(' >').lower()
+
+
+def get_seconds(timedelta):
+    return timedelta.days * 86400 + timedelta.seconds + timedelta.microseconds / 1e6
+
+
+def enqueue(messages):
+    """saves the email messages to the queue,
+    one record per recipient, returns number of the records"""
+    from askbot.models import OutgoingEmail
+    now = datetime.datetime.now()
+    records = list()
+    for message in messages:
+        body_html = ''
+        for content, mimetype in getattr(message, 'alternatives', ()):
+            if mimetype == 'text/html':
+                body_html = content
+        for recipient in message.recipients():
+            records.append(
+                OutgoingEmail(
+                    from_email=message.from_email,
+                    recipient=recipient,
+                    domain=get_domain(recipient),
+                    subject=message.subject,
+                    body_text=message.body,
+                    body_html=body_html,
+                    headers=simplejson.dumps(message.extra_headers),
+                    queued_at=now,
+                    next_attempt_at=now
+                )
+            )
+    OutgoingEmail.objects.bulk_create(records)
+    return len(records)
+
+
+def make_message(record):
+    """returns email message from the queue record"""
+    headers = simplejson.loads(record.headers)
+    if record.body_html:
+        message = mail.EmailMultiAlternatives(
+                            record.subject,
+                            record.body_text,
+                            record.from_email,
+                            [record.recipient],
+                            headers=headers
+                        )
+        message.attach_alternative(record.body_html, 'text/html')
+        return message
+    return mail.EmailMessage(
+                        record.subject,
+                        record.body_text,
+                        record.from_email,
+                        [record.recipient],
+                        headers=headers
+                    )
+
+
+def get_paced_ids(candidates, time_budget=CLAIM_TIMEOUT / 2):
+    """returns ids of the messages from the list of tuples
+    (id, domain), which can be sent within the ``time_budget``
+    seconds at the rate limits of their domains,
+    so that the claim does not expire while they are being sent"""
+    ids = list()
+    send_time = 0
+    for message_id, domain in candidates:
+        rate = get_domain_rate(domain)
+        message_time = rate and 1.0 / rate or 0
+        if send_time + message_time > time_budget:
+            continue#too slow, left in the queue for the next batch
+        send_time += message_time
+        ids.append(message_id)
+    return ids
+
+
+def claim_batch(batch_size=BATCH_SIZE):
+    """marks a batch of the due messages as being sent by this drainer,
+    returns list of the claimed records"""
+    from askbot.models import OutgoingEmail
+    now = datetime.datetime.now()
+    candidates = OutgoingEmail.objects.filter(
+                            status='queued',
+                            next_attempt_at__lte=now
+                        ).order_by(
+                            'next_attempt_at'
+                        ).values_list('id', 'domain')[:batch_size]
+    ids = get_paced_ids(candidates)
+    claim = uuid.uuid4().hex
+    #records claimed by another drainer in the meantime are not updated
+    OutgoingEmail.objects.filter(
+                            id__in=ids,
+                            status='queued'
+                        ).update(status='sending', claim=claim, claimed_at=now)
+    return list(OutgoingEmail.objects.filter(claim=claim, status='sending'))
+
+
+def release_stale_claims():
+    """returns to the queue messages claimed by the drainers,
+    which have not finished in time"""
+    from askbot.models import OutgoingEmail
+    stale_time = datetime.datetime.now() - datetime.timedelta(seconds=CLAIM_TIMEOUT)
+    return OutgoingEmail.objects.filter(
+                            status='sending',
+                            claimed_at__lt=stale_time
+                        ).update(status='queued', claim='')
+
+
+class RateLimiter(object):
+    """paces the messages to each domain to its rate limit,
+    shared by the worker threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        #domain -> earliest time of the next message
+        self.next_times = dict()
+
+    def wait(self, domain):
+        rate = get_domain_rate(domain)
+        if not rate:
+            return
+        self.lock.acquire()
+        try:
+            now = time.time()
+            send_time = max(now, self.next_times.get(domain, now))
+            self.next_times[domain] = send_time + 1.0 / rate
+        finally:
+            self.lock.release()
+        if send_time > now:
+            time.sleep(send_time - now)
+
+
+def send_records(records, workers=1, rate_limiter=None):
+    """sends the messages of the records with the pool of
+    the worker threads, the database is not used by the workers.
+    Returns list of tuples (record, error or ``None``, send time in seconds)
+    """
+    rate_limiter = rate_limiter or RateLimiter()
+    tasks = Queue.Queue()
+    for record in records:
+        tasks.put(record)
+    results = list()
+
+    def work():
+        try:
+            while True:
+                try:
+                    record = tasks.get_nowait()
+                except Queue.Empty:
+                    return
+                rate_limiter.wait(record.domain)
+                started_at = time.time()
+                try:
+                    transport.send_messages([make_message(record)], max_retries=0)
+                    error = None
+                except Exception, error:
+                    pass
+                #list.append is atomic
+                results.append((record, error, time.time() - started_at))
+        finally:
+            transport.close_connection()
+
+    if workers == 1:
+        work()
+    else:
+        threads = [threading.Thread(target=work) for number in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return results
+
+
+def save_results(results):
+    """deletes the sent messages, schedules retries of the failed
+    ones or marks them dead, returns number of the dead letters"""
+    from askbot.models import OutgoingEmail
+    sent_ids = [record.id for record, error, send_time in results if error is None]
+    OutgoingEmail.objects.filter(id__in=sent_ids).delete()
+
+    now = datetime.datetime.now()
+    dead_count = 0
+    for record, error, send_time in results:
+        if error is None:
+            continue
+        attempts = record.attempts + 1
+        changes = {
+            'attempts': attempts,
+            'last_error': unicode(error),
+            'claim': '',
+        }
+        if attempts >= MAX_ATTEMPTS or not transport.is_transient(error):
+            changes['status'] = 'dead'
+            dead_count += 1
+            logging.error('email to %s is not sent: %s' % (record.recipient, error))
+        else:
+            changes['status'] = 'queued'
+            delay = RETRY_DELAY * 2 ** (attempts - 1)
+            changes['next_attempt_at'] = now + datetime.timedelta(seconds=delay)
+        OutgoingEmail.objects.filter(id=record.id).update(**changes)
+    return dead_count
+
+
+def drain(workers=1, batch_size=BATCH_SIZE, time_limit=None):
+    """sends the due messages until the queue is empty,
+    or ``time_limit`` seconds have passed,
+    returns dictionary with the numbers of the sent, failed
+    and dead messages and the latencies"""
+    started_at = time.time()
+    release_stale_claims()
+    rate_limiter = RateLimiter()
+    totals = {'sent': 0, 'failed': 0, 'dead': 0}
+    send_times = list()
+    queue_times = list()
+    while time_limit is None or time.time() - started_at < time_limit:
+        records = claim_batch(batch_size)
+        if len(records) == 0:
+            break
+        results = send_records(records, workers=workers, rate_limiter=rate_limiter)
+        totals['dead'] += save_results(results)
+        sent_at = datetime.datetime.now()
+        for record, error, send_time in results:
+            if error is None:
+                totals['sent'] += 1
+                send_times.append(send_time)
+                queue_times.append(get_seconds(sent_at - record.queued_at))
+            else:
+                totals['failed'] += 1
+
+    drain_stats = dict(totals)
+    drain_stats['drained_at'] = datetime.datetime.now()
+    drain_stats['elapsed'] = time.time() - started_at
+    if send_times:
+        drain_stats['send_time_avg'] = sum(send_times) / len(send_times)
+        drain_stats['send_time_max'] = max(send_times)
+        drain_stats['queue_time_avg'] = sum(queue_times) / len(queue_times)
+        drain_stats['queue_time_max'] = max(queue_times)
+    cache.cache.set(STATS_CACHE_KEY, drain_stats, const.LONG_TIME)
+    logging.info(
+        'sent %d queued emails, %d failed, %d dead' % \
+        (totals['sent'], totals['failed'], totals['dead'])
+    )
+    return drain_stats
+
+
+def requeue_dead():
+    """returns the dead letters to the queue,
+    returns number of the requeued messages"""
+    from askbot.models import OutgoingEmail
+    return OutgoingEmail.objects.filter(
+                            status='dead'
+                        ).update(
+                            status='queued',
+                            attempts=0,
+                            next_attempt_at=datetime.datetime.now()
+                        )
+
+
+def get_stats():
+    """returns dictionary with the numbers of the messages
+    per status ("queued", "sending", "dead"), the age of
+    the oldest queued one in seconds ("lag"), and under the key
+    "last_drain", if available - the dictionary returned by :func:`drain`
+    """
+    from askbot.models import OutgoingEmail
+    stats = {'queued': 0, 'sending': 0, 'dead': 0, 'lag': 0}
+    counts = OutgoingEmail.objects.values('status').annotate(
+                                                count=Count('id'),
+                                                oldest=Min('queued_at')
+                                            ).order_by()
+    for row in counts:
+        stats[row['status']] = row['count']
+        if row['status'] == 'queued':
+            stats['lag'] = int(get_seconds(datetime.datetime.now() - row['oldest']))
+
+    last_drain = cache.cache.get(STATS_CACHE_KEY)
+    if last_drain:
+        stats['last_drain'] = last_drain
+    return stats
@@ -0,0 +1,313 @@
+"""In-process index of the subscribers to the instant email alerts
+about the new posts in all questions (feed "q_all" with the frequency "i").
+
+For each tag mark reason ("good", "bad", "subscribed") the index keeps
+the ids of the subscribers per marked tag id, and the prefix tree of the
+wildcard tags of the subscribers, plus the subscribers grouped by the
+email tag filter strategy. Then the recipients of the alert about
+a new post are found with a few set operations, instead of the joins
+and the loop over all users with the wildcard tags.
+
+Only the instant subscribers are in the index, when the user
+subscribes or unsubscribes, the tag marks of the user are added
+to the index or removed from it.
+
+The index lives in the memory of each worker process, it is built on
+the first use and then updated incrementally from the signal handlers
+of the :class:`~askbot.models.MarkedTag`, the user and the
+:class:`~askbot.models.EmailFeedSetting`: the data of the changed
+subscriber is published in the cache and the workers apply it
+to their copies, see :mod:`askbot.utils.shared_index`.
+Changes of the users who are not subscribed are not published.
+
+The index is enabled with ``ASKBOT_SUBSCRIBER_INDEX_ENABLED = True``
+in the ``settings.py`` file.
+"""
+from django.conf import settings as django_settings
+from django.core import cache
+from askbot import const
+from askbot.utils.shared_index import SharedIndex
+
+CACHE_KEY = 'askbot-subscriber-index'
+STATE_CACHE_KEY = 'askbot-subscriber-index-%s-%d'
+
+#longer lists of user ids are not passed to the
+#database queries, some backends limit number of parameters
+MAX_ID_LIST_SIZE = 900
+
+#email tag filter strategy of the users
+#to whom the tag marks with the reason apply
+REASON_STRATEGIES = {
+    'good': const.INCLUDE_INTERESTING,
+    'bad': const.EXCLUDE_IGNORED,
+    'subscribed': const.INCLUDE_SUBSCRIBED,
+}
+
+#user attributes with the wildcard tags per reason
+WILDCARD_ATTRIBUTES = {
+    'good': 'interesting_tags',
+    'bad': 'ignored_tags',
+    'subscribed': 'subscribed_tags',
+}
+
+def is_enabled():
+    return getattr(django_settings, 'ASKBOT_SUBSCRIBER_INDEX_ENABLED', False)
+
+
+def get_wildcard_prefixes(wildcard_tags):
+    """returns set of prefixes of the space separated wildcard tags,
+    i.e. of the names without the trailing asterisk"""
+    return set([wildcard[:-1] for wildcard in wildcard_tags.split()])
+
+
+class WildcardTrie(object):
+    """prefix tree of the wildcard tags, nodes are dictionaries
+    character -> child node, the ids of the users whose wildcard
+    ends at the node are stored under the key ``None``"""
+
+    def __init__(self):
+        self.root = dict()
+
+    def add(self, prefix, user_id):
+        node = self.root
+        for char in prefix:
+            node = node.setdefault(char, dict())
+        node.setdefault(None, set()).add(user_id)
+
+    def remove(self, prefix, user_id):
+        path = list()
+        node = self.root
+        for char in prefix:
+            if char not in node:
+                return
+            path.append((node, char))
+            node = node[char]
+        user_ids = node.get(None, set())
+        user_ids.discard(user_id)
+        if len(user_ids) == 0:
+            node.pop(None, None)
+        #prune the empty branch
+        while path and len(node) == 0:
+            parent, char = path.pop()
+            del parent[char]
+            node = parent
+
+    def match(self, tag_name):
+        """returns set of ids of the users with
+        a wildcard matching the tag name"""
+        user_ids = set(self.root.get(None, ()))
+        node = self.root
+        for char in tag_name:
+            node = node.get(char)
+            if node is None:
+                break
+            user_ids.update(node.get(None, ()))
+        return user_ids
+
+
+class UserRecord(object):
+    """what the index knows about one subscriber"""
+
+    def __init__(self, strategy, marks, wildcards):
+        self.strategy = strategy
+        #set of tuples (tag id, reason)
+        self.marks = marks
+        #set of tuples (reason, wildcard prefix)
+        self.wildcards = wildcards
+
+
+class SubscriberIndex(object):
+    """instant subscribers per strategy, per marked tag
+    and per wildcard tag prefix"""
+
+    def __init__(self):
+        self.users = dict()
+        self.strategies = dict()
+        self.tag_subscribers = dict(
+            [(reason, dict()) for reason in REASON_STRATEGIES]
+        )
+        self.wildcard_subscribers = dict(
+            [(reason, WildcardTrie()) for reason in REASON_STRATEGIES]
+        )
+
+    def load(self, users, marks):
+        """builds the index from the iterable of tuples
+        (user id, email tag filter strategy, interesting tags,
+        ignored tags, subscribed tags) of the subscribers and the
+        iterable of their tag marks (user id, tag id, reason)
+        """
+        user_marks = dict()
+        for user_id, tag_id, reason in marks:
+            user_marks.setdefault(user_id, set()).add((tag_id, reason))
+        for user in users:
+            user_id = user[0]
+            self.add_user(*user, marks=user_marks.get(user_id))
+
+    def add_user(self, user_id, strategy, interesting_tags='',
+                 ignored_tags='', subscribed_tags='', marks=None):
+        """adds the subscriber, ``marks`` - set of
+        tuples (tag id, reason) of the tag marks of the user"""
+        self.remove_user(user_id)
+        wildcard_tags = {
+            'interesting_tags': interesting_tags,
+            'ignored_tags': ignored_tags,
+            'subscribed_tags': subscribed_tags,
+        }
+        wildcards = set()
+        for reason, attribute in WILDCARD_ATTRIBUTES.items():
+            for prefix in get_wildcard_prefixes(wildcard_tags[attribute]):
+                wildcards.add((reason, prefix))
+                self.wildcard_subscribers[reason].add(prefix, user_id)
+
+        marks = set(marks or ())
+        for tag_id, reason in marks:
+            self.tag_subscribers[reason].setdefault(tag_id, set()).add(user_id)
+
+        self.strategies.setdefault(strategy, set()).add(user_id)
+        self.users[user_id] = UserRecord(strategy, marks, wildcards)
+
+    def remove_user(self, user_id):
+        record = self.users.pop(user_id, None)
+        if record is None:
+            return
+        for tag_id, reason in record.marks:
+            user_ids = self.tag_subscribers[reason][tag_id]
+            user_ids.discard(user_id)
+            if len(user_ids) == 0:
+                del self.tag_subscribers[reason][tag_id]
+        for reason, prefix in record.wildcards:
+            self.wildcard_subscribers[reason].remove(prefix, user_id)
+        self.strategies[record.strategy].discard(user_id)
+
+    def get_strategy_subscriber_ids(self, strategy):
+        return self.strategies.get(strategy, set())
+
+    def get_tag_based_subscriber_ids(self, reason, tag_ids,
+                                     tag_names=None, use_wildcards=False):
+        """returns set of ids of the subscribers, who follow
+        (reasons "good" and "subscribed") or do not ignore (reason "bad")
+        the given tags, as
+        :meth:`~askbot.models.Post.get_global_tag_based_subscribers`"""
+        marked_ids = set()
+        tag_subscribers = self.tag_subscribers[reason]
+        for tag_id in tag_ids:
+            marked_ids.update(tag_subscribers.get(tag_id, ()))
+        if use_wildcards:
+            for tag_name in tag_names or ():
+                marked_ids.update(
+                    self.wildcard_subscribers[reason].match(tag_name)
+                )
+        strategy_ids = self.get_strategy_subscriber_ids(REASON_STRATEGIES[reason])
+        if reason == 'bad':
+            return strategy_ids - marked_ids
+        return strategy_ids & marked_ids
+
+    def get_subscriber_ids(self, tag_ids, tag_names=None,
+                           good_reason='good', use_wildcards=False):
+        """returns set of ids of all instant subscribers to the post
+        with the given tags, as
+        :meth:`~askbot.models.Post.get_global_instant_notification_subscribers`
+        """
+        user_ids = set(self.get_strategy_subscriber_ids(const.INCLUDE_ALL))
+        for reason in (good_reason, 'bad'):
+            user_ids.update(
+                self.get_tag_based_subscriber_ids(
+                                    reason,
+                                    tag_ids,
+                                    tag_names=tag_names,
+                                    use_wildcards=use_wildcards
+                                )
+            )
+        return user_ids
+
+
+def get_subscriber_id_query():
+    """query of the ids of the instant subscribers"""
+    from askbot.models import EmailFeedSetting
+    return EmailFeedSetting.objects.filter(
+                                feed_type='q_all',
+                                frequency='i'
+                            ).values_list('subscriber_id', flat=True)
+
+
+def load_users(user_ids):
+    """returns list of the users with the given ids"""
+    from askbot.models import User
+    user_ids = list(user_ids)
+    users = list()
+    for start in range(0, len(user_ids), MAX_ID_LIST_SIZE):
+        chunk = user_ids[start:start + MAX_ID_LIST_SIZE]
+        users.extend(User.objects.filter(id__in=chunk))
+    return users
+
+
+class SharedSubscriberIndex(SharedIndex):
+    """per process instance of the :class:`SubscriberIndex`,
+    built from the database on the first use and then
+    updated from the log of the changed subscribers
+    """
+    cache_key = CACHE_KEY
+
+    def query_users(self, user_ids):
+        from askbot.models import User
+        return User.objects.filter(
+                            id__in=user_ids
+                        ).values_list(
+                            'id',
+                            'email_tag_filter_strategy',
+                            'interesting_tags',
+                            'ignored_tags',
+                            'subscribed_tags'
+                        )
+
+    def query_marks(self, user_ids):
+        from askbot.models import MarkedTag
+        return MarkedTag.objects.filter(
+                            user__in=user_ids
+                        ).values_list('user_id', 'tag_id', 'reason')
+
+    def load(self):
+        subscriber_ids = get_subscriber_id_query()
+        index = SubscriberIndex()
+        index.load(
+            self.query_users(subscriber_ids).iterator(),
+            self.query_marks(subscriber_ids).iterator()
+        )
+        return index
+
+    def apply_change(self, index, change):
+        user_id, user_data, marks = change
+        if user_data is None:
+            index.remove_user(user_id)
+        else:
+            index.add_user(*user_data, marks=marks)
+
+    def update_user(self, user_id, subscription_changed=False):
+        """publishes the current data of the user, so that all
+        processes update their copies of the index.
+        Changes of the users who are not the instant subscribers
+        are not published, unless the user has just unsubscribed"""
+        subscriber_ids = get_subscriber_id_query().filter(subscriber=user_id)
+        users = list(self.query_users(subscriber_ids))
+        if users:
+            marks = [
+                (tag_id, reason) for mark_user_id, tag_id, reason \
+                    in self.query_marks(subscriber_ids)
+            ]
+            self.publish((user_id, users[0], marks))
+        elif subscription_changed:
+            self.publish((user_id, None, None))
+
+    def update_user_if_changed(self, user_id, key, state, subscription_changed=False):
+        """updates the user in the index, unless the ``state``
+        (a value with the data relevant to the index) saved under
+        the ``key`` is the same as on the last update,
+        so that the unrelated changes do not update the index"""
+        cache_key = STATE_CACHE_KEY % (key, user_id)
+        if cache.cache.get(cache_key) == state:
+            return
+        cache.cache.set(cache_key, state, const.LONG_TIME)
+        self.update_user(user_id, subscription_changed=subscription_changed)
+
+
+shared_index = SharedSubscriberIndex()
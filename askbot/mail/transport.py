@@ -0,0 +1,147 @@
+"""Sending of the email messages over pooled connections.
+
+Each worker (process or thread) keeps an open connection of the
+email backend and reuses it for the following messages, instead
+of connecting to the SMTP server for every message.
+The connection is replaced when it has been idle longer
+than :data:`MAX_IDLE_TIME`, or has sent :data:`MAX_MESSAGES_PER_CONNECTION`
+messages, or after an error.
+
+:func:`send_messages` sends the list of messages over one connection.
+The transient failures - lost connection, temporary (4xx) SMTP
+replies - are retried with the exponential backoff, starting
+with the message that has failed, so none of the messages is sent twice.
+
+The backend is given with the usual ``EMAIL_BACKEND`` setting,
+for the benchmarks (``python manage.py benchmark_mail``) the local
+backends can be selected by the short names from the :data:`BACKENDS`.
+"""
+import logging
+import smtplib
+import socket
+import threading
+import time
+from django.conf import settings as django_settings
+from django.core import mail
+
+MAX_IDLE_TIME = 60
+MAX_MESSAGES_PER_CONNECTION = 100
+MAX_RETRIES = 3
+RETRY_DELAY = 1
+
+BACKENDS = {
+    'smtp': 'django.core.mail.backends.smtp.EmailBackend',
+    'locmem': 'django.core.mail.backends.locmem.EmailBackend',
+    'file': 'django.core.mail.backends.filebased.EmailBackend',
+    'dummy': 'django.core.mail.backends.dummy.EmailBackend',
+}
+
+TRANSIENT_ERRORS = (
+    smtplib.SMTPServerDisconnected,
+    smtplib.SMTPConnectError,
+    socket.error,
+)
+
+#connections of the current thread per backend
+_pool = threading.local()
+
+def get_backend_path(backend=None):
+    backend = backend or django_settings.EMAIL_BACKEND
+    return BACKENDS.get(backend, backend)
+
+
+def is_transient(error):
+    """True if sending of the message may succeed when retried"""
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    return False
+
+
+class PooledConnection(object):
+    """open connection of the email backend
+    with the time of the last use and the number of the sent messages"""
+
+    def __init__(self, backend_path, **kwargs):
+        self.backend = mail.get_connection(backend=backend_path, **kwargs)
+        self.backend.open()
+        self.used_at = time.time()
+        self.message_count = 0
+
+    def is_usable(self):
+        return time.time() - self.used_at < MAX_IDLE_TIME \
+            and self.message_count < MAX_MESSAGES_PER_CONNECTION
+
+    def send(self, message):
+        sent = self.backend.send_messages([message])
+        self.used_at = time.time()
+        self.message_count += 1
+        return sent
+
+    def close(self):
+        try:
+            self.backend.close()
+        except Exception:
+            #connection is probably lost already
+            pass
+
+
+def get_connection(backend=None, **kwargs):
+    """returns the pooled connection of the current thread"""
+    backend_path = get_backend_path(backend)
+    connections = getattr(_pool, 'connections', None)
+    if connections is None:
+        connections = _pool.connections = dict()
+    connection = connections.get(backend_path)
+    if connection and not connection.is_usable():
+        close_connection(backend_path)
+        connection = None
+    if connection is None:
+        connection = PooledConnection(backend_path, **kwargs)
+        connections[backend_path] = connection
+    return connection
+
+
+def close_connection(backend=None):
+    """closes the pooled connection of the current thread"""
+    connections = getattr(_pool, 'connections', dict())
+    connection = connections.pop(get_backend_path(backend), None)
+    if connection:
+        connection.close()
+
+
+def send_messages(messages, backend=None, max_retries=MAX_RETRIES,
+                  retry_delay=RETRY_DELAY, errors=None, **kwargs):
+    """sends the email messages over the pooled connection,
+    retries the transient failures,
+    returns number of the sent messages.
+
+    If a message could not be sent, the error is raised,
+    or, if the list ``errors`` is given, the tuple (message, error)
+    is appended to it and the remaining messages are sent.
+    """
+    sent_count = 0
+    for message in messages:
+        attempt = 0
+        while True:
+            try:
+                connection = get_connection(backend, **kwargs)
+                if connection.send(message):
+                    sent_count += 1
+                break
+            except Exception, error:
+                #state of the connection is unknown after the error
+                close_connection(backend)
+                if attempt >= max_retries or not is_transient(error):
+                    if errors is None:
+                        raise
+                    errors.append((message, error))
+                    break
+                delay = retry_delay * 2 ** attempt
+                logging.warning(
+                    'email not sent: %s, retrying in %d s' % (error, delay)
+                )
+                time.sleep(delay)
+                attempt += 1
+    return sent_count
@@ -117,6 +117,7 @@ class Command(BaseImportXMLCommand):
         #model="forum.question"/answer/comment - derivatives of the Node model
         self.import_threads()
         self.import_posts('question', True)
+        Thread.objects.fill_question_posts()
         #inside we also mark accepted answer, b/c it's more convenient that way
         self.import_posts('answer')
         self.import_posts('comment')
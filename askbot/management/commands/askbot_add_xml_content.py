@@ -52,6 +52,7 @@ class Command(BaseImportXMLCommand):
 
         #model="askbot.posttogroup">
         self.import_posts('question', save_redirects=True)
+        Thread.objects.fill_question_posts()
         self.import_posts('answer')
         self.import_posts('comment')
         self.import_post_revisions()
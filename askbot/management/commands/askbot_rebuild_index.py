@@ -5,12 +5,18 @@ from django.core.management import get_commands, load_command_class
 from django.utils.translation import activate as activate_language
 from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
+from django.db import transaction
+from askbot.search import bulk_indexer
+from askbot.search import local_search
+from askbot.utils.console import ProgressBar
+
+from askbot.management.commands.askbot_update_index import get_language_codes
+from askbot.management.commands.askbot_update_index import run_streaming_update
+from askbot.management.commands.askbot_update_index import STREAMING_OPTIONS
 
 try:
     from haystack.management.commands.clear_index import Command as ClearCommand
-    from haystack.management.commands.update_index import Command as UpdateCommand
-    haystack_option_list = [option for option in UpdateCommand.base_options if option.get_opt_string() != '--verbosity'] + \
-                  [option for option in ClearCommand.base_options if not option.get_opt_string() in ['--using', '--verbosity']]
+    haystack_option_list = [option for option in ClearCommand.base_options if not option.get_opt_string() in ['--using', '--verbosity']]
 except ImportError:
     haystack_option_list = []
 
@@ -18,18 +24,37 @@ class Command(BaseCommand):
     help = "Completely rebuilds the search index by removing the old data and then updating."
     base_options = [make_option("-l", "--language", action="store", type="string", dest="language",
                                 help='Language to user, in language code format'),]
-    option_list = list(BaseCommand.option_list) + haystack_option_list + base_options
+    option_list = list(BaseCommand.option_list) + haystack_option_list + base_options + STREAMING_OPTIONS
 
     def handle(self, *args, **options):
-        lang_code = options.get('language', settings.LANGUAGE_CODE.lower())
-        options['using'] = ['default_%s' % lang_code[:2],]
-        activate_language(lang_code)
+        if local_search.is_enabled():
+            self.rebuild_local_index()
+            return
+
+        lang_codes = get_language_codes(options)
+        checkpoint = options.get('checkpoint')
+        if not (checkpoint and bulk_indexer.has_checkpoints(checkpoint, lang_codes)):
+            #the interrupted rebuild is resumed without clearing the index
+            klass = self._get_command_class('clear_index')
+            for lang_code in lang_codes:
+                options['using'] = [bulk_indexer.get_connection_alias(lang_code),]
+                activate_language(lang_code)
+                klass.handle(*args, **options)
 
-        klass = self._get_command_class('clear_index')
-        klass.handle(*args, **options)
+        run_streaming_update(options)
 
-        klass = self._get_command_class('update_index')
-        klass.handle(*args, **options)
+    @transaction.commit_manually
+    def rebuild_local_index(self):
+        """rebuilds index of the built-in full text search"""
+        from askbot.models import Thread
+        local_search.clear_index()
+        transaction.commit()
+        threads = Thread.objects.only('id', 'title', 'tagnames')
+        count = threads.count()
+        message = 'Indexing threads'
+        for thread in ProgressBar(threads.iterator(), count, message):
+            local_search.add_thread(thread)
+            transaction.commit()
 
     def _get_command_class(self, name):
         try:
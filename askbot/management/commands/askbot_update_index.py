@@ -1,86 +1,72 @@
-import sys
 from optparse import make_option
 
-from django.core.management import get_commands, load_command_class
 from django.utils.translation import activate as activate_language
-from django.core.management.base import BaseCommand, CommandError
+from django.core.management.base import BaseCommand
 from django.conf import settings
 
+from askbot.search import bulk_indexer
+
 try:
     from haystack.management.commands.update_index import Command as UpdateCommand
     haystack_option_list = [option for option in UpdateCommand.base_options if option.get_opt_string() != '--verbosity']
 except ImportError:
+    UpdateCommand = None
     haystack_option_list = []
 
-class Command(BaseCommand):
-    help = "Completely rebuilds the search index by removing the old data and then updating."
-    base_options = [make_option("-l", "--language", action="store", type="string", dest="language",
-                                help='Language to user, in language code format'),]
-    option_list = list(BaseCommand.option_list) + haystack_option_list + base_options
+STREAMING_OPTIONS = [
+    make_option("-b", "--batch-size", action="store", type="int", dest="batchsize",
+                default=bulk_indexer.DEFAULT_CHUNK_SIZE,
+                help='Number of objects read from the database and indexed at once'),
+    make_option("--all-languages", action="store_true", dest="all_languages",
+                default=False, help='Index all languages from the LANGUAGES setting'),
+    make_option("--parallel", action="store_true", dest="parallel", default=False,
+                help='Index each language in a separate process'),
+    make_option("--checkpoint", action="store", type="string", dest="checkpoint",
+                help='File to save the progress to, the interrupted run is resumed '
+                     'when the command is started again with the same file'),
+]
 
-    def handle(self, *args, **options):
-        lang_code = options.get('language', settings.LANGUAGE_CODE.lower())
-        activate_language(lang_code)
-        options['using'] = ['default_%s' % lang_code[:2],]
-        klass = self._get_command_class('update_index')
-        klass.handle(*args, **options)
+#with these haystack options only a part of the index is updated,
+#so the run is handed to the haystack ``update_index`` command
+INCREMENTAL_OPTIONS = ('age', 'remove', 'start_date', 'end_date', 'using')
 
-    def _get_command_class(self, name):
-        try:
-            app_name = get_commands()[name]
-            if isinstance(app_name, BaseCommand):
-                # If the command is already loaded, use it directly.
-                klass = app_name
-            else:
-                klass = load_command_class(app_name, name)
-        except KeyError:
-            raise CommandError("Unknown command: %r" % name)
-        return klass
+def get_language_codes(options):
+    if options.get('all_languages'):
+        return [lang_code for lang_code, lang_name in settings.LANGUAGES]
+    return [options.get('language') or settings.LANGUAGE_CODE.lower()]
 
+def run_streaming_update(options):
+    """indexes all objects with the streaming bulk indexer"""
+    bulk_indexer.index_languages(
+                        get_language_codes(options),
+                        chunk_size=options.get('batchsize') or bulk_indexer.DEFAULT_CHUNK_SIZE,
+                        checkpoint_path=options.get('checkpoint'),
+                        parallel=options.get('parallel')
+                    )
 
-    def execute(self, *args, **options):
-        """
-        Try to execute this command, performing model validation if
-        needed (as controlled by the attribute
-        ``self.requires_model_validation``). If the command raises a
-        ``CommandError``, intercept it and print it sensibly to
-        stderr.
-        """
-        show_traceback = options.get('traceback', False)
+def is_incremental_update(options):
+    for name in INCREMENTAL_OPTIONS:
+        if options.get(name):
+            return True
+    return False
 
-        if self.can_import_settings:
-            try:
-                #language part used to be here
-                pass
-            except ImportError, e:
-                # If settings should be available, but aren't,
-                # raise the error and quit.
-                if show_traceback:
-                    traceback.print_exc()
-                else:
-                    sys.stderr.write(smart_str(self.style.ERROR('Error: %s\n' % e)))
-                sys.exit(1)
+class Command(BaseCommand):
+    help = "Updates the search index, full runs stream the objects from the database in chunks."
+    base_options = [make_option("-l", "--language", action="store", type="string", dest="language",
+                                help='Language to user, in language code format'),]
+    #haystack has its own --batch-size option
+    option_list = list(BaseCommand.option_list) + haystack_option_list + base_options + [
+        option for option in STREAMING_OPTIONS \
+            if not (haystack_option_list and option.dest == 'batchsize')
+    ]
 
-        try:
-            self.stdout = options.get('stdout', sys.stdout)
-            self.stderr = options.get('stderr', sys.stderr)
-            if self.requires_model_validation:
-                self.validate()
-            output = self.handle(*args, **options)
-            if output:
-                if self.output_transaction:
-                    # This needs to be imported here, because it relies on
-                    # settings.
-                    from django.db import connections, DEFAULT_DB_ALIAS
-                    connection = connections[options.get('database', DEFAULT_DB_ALIAS)]
-                    if connection.ops.start_transaction_sql():
-                        self.stdout.write(self.style.SQL_KEYWORD(connection.ops.start_transaction_sql()) + '\n')
-                self.stdout.write(output)
-                if self.output_transaction:
-                    self.stdout.write('\n' + self.style.SQL_KEYWORD("COMMIT;") + '\n')
-        except CommandError, e:
-            if show_traceback:
-                traceback.print_exc()
-            else:
-                self.stderr.write(smart_str(self.style.ERROR('Error: %s\n' % e)))
-            sys.exit(1)
+    def handle(self, *args, **options):
+        if UpdateCommand and is_incremental_update(options):
+            using = options.get('using')
+            for lang_code in get_language_codes(options):
+                activate_language(lang_code)
+                if not using:
+                    options['using'] = [bulk_indexer.get_connection_alias(lang_code),]
+                UpdateCommand().handle(*args, **options)
+        else:
+            run_streaming_update(options)
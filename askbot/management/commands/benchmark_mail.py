@@ -0,0 +1,87 @@
+"""Measures throughput of the email sending in messages per second,
+over the pooled connection and, for comparison, with a new
+connection per message, as the messages used to be sent.
+
+By default the messages are kept in memory (``--backend=locmem``),
+``--backend=file`` writes them to the directory ``--file-path``,
+``--backend=smtp`` sends them to the server from the settings,
+so the recipient must be given with ``--recipient``.
+"""
+import tempfile
+import time
+from optparse import make_option
+from django.core import mail as django_mail
+from django.core.management.base import NoArgsCommand, CommandError
+from askbot import mail
+from askbot.mail import transport
+
+def make_messages(number, recipient):
+    return [
+        mail.make_message(
+            subject_line='benchmark message %d' % message_number,
+            body_text='<p>benchmark message %d</p>' % message_number,
+            recipient_list=[recipient]
+        ) for message_number in range(number)
+    ]
+
+
+class Command(NoArgsCommand):
+    help = 'Measures throughput of the email sending'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--messages', action='store', type='int', dest='messages',
+            default=1000, help='Number of the sent messages'
+        ),
+        make_option('--backend', action='store', type='choice', dest='backend',
+            choices=transport.BACKENDS.keys(), default='locmem',
+            help='Email backend: ' + ', '.join(transport.BACKENDS.keys())
+        ),
+        make_option('--file-path', action='store', type='string', dest='file_path',
+            default=None, help='Directory for the file backend'
+        ),
+        make_option('--recipient', action='store', type='string', dest='recipient',
+            default=None, help='Recipient of the messages'
+        ),
+    )
+
+    def handle_noargs(self, **options):
+        backend = options['backend']
+        recipient = options['recipient']
+        if recipient is None:
+            if backend == 'smtp':
+                raise CommandError('--recipient is required with the smtp backend')
+            recipient = 'benchmark@example.com'
+
+        backend_options = dict()
+        if backend == 'file':
+            backend_options['file_path'] = options['file_path'] or tempfile.mkdtemp()
+            self.stdout.write('Directory: %s\n' % backend_options['file_path'])
+
+        messages = make_messages(max(1, options['messages']), recipient)
+        #locmem backend keeps the messages in the module
+        outbox = getattr(django_mail, 'outbox', None)
+        django_mail.outbox = list()
+        try:
+            transport.close_connection(backend)
+            started_at = time.time()
+            sent_count = transport.send_messages(messages, backend, **backend_options)
+            self.print_throughput('Pooled connection', sent_count, time.time() - started_at)
+            transport.close_connection(backend)
+
+            backend_path = transport.get_backend_path(backend)
+            started_at = time.time()
+            sent_count = 0
+            for message in messages:
+                connection = django_mail.get_connection(backend_path, **backend_options)
+                sent_count += connection.send_messages([message]) or 0
+            self.print_throughput('Connection per message', sent_count, time.time() - started_at)
+        finally:
+            if outbox is None:
+                del django_mail.outbox
+            else:
+                django_mail.outbox = outbox
+
+    def print_throughput(self, title, sent_count, elapsed):
+        elapsed = max(elapsed, 0.000001)
+        self.stdout.write(
+            '%s: %d messages, %.0f messages/s\n' % (title, sent_count, sent_count / elapsed)
+        )
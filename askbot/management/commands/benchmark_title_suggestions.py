@@ -0,0 +1,110 @@
+"""Measures latency of the title suggestions under concurrent load"""
+import random
+import threading
+import time
+from optparse import make_option
+from django.core.management.base import NoArgsCommand, CommandError
+from django.db import connection
+from askbot.models import Thread
+from askbot.search import title_index
+
+def get_percentile(sorted_values, percent):
+    """returns value at the given percentile of the sorted list"""
+    position = int(round(percent / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[position]
+
+
+def get_sample_queries(number, seed=None):
+    """returns list of queries typed as the beginnings of the
+    titles of the random threads, e.g. "how to ins" """
+    titles = list(
+        Thread.objects.filter(deleted=False).values_list('title', flat=True)[:10000]
+    )
+    if len(titles) == 0:
+        return list()
+    rand = random.Random(seed)
+    queries = list()
+    for idx in xrange(number):
+        title = rand.choice(titles)
+        queries.append(title[:rand.randint(1, max(1, min(len(title), 20)))])
+    return queries
+
+
+class Command(NoArgsCommand):
+    help = 'Measures latency of the title suggestions under concurrent load'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--queries', action='store', type='int', dest='queries',
+            default=1000, help='Total number of queries'
+        ),
+        make_option('--concurrency', action='store', type='int', dest='concurrency',
+            default=8, help='Number of the concurrent client threads'
+        ),
+        make_option('--index-only', action='store_true', dest='index_only',
+            default=False, help='Measure only the lookups in the index, '
+                                'without loading the threads from the database'
+        ),
+    )
+
+    def handle_noargs(self, **options):
+        if not title_index.is_enabled():
+            raise CommandError('set ASKBOT_TITLE_INDEX_ENABLED = True in settings.py')
+
+        queries = get_sample_queries(options['queries'], seed=1)
+        if len(queries) == 0:
+            raise CommandError('there are no questions to search')
+
+        started_at = time.time()
+        index = title_index.shared_index.get()
+        self.stdout.write('Index loaded in %.1f ms\n' % ((time.time() - started_at) * 1000))
+
+        if options['index_only']:
+            run_query = index.search
+        else:
+            run_query = Thread.objects.get_title_suggestions
+
+        concurrency = max(1, options['concurrency'])
+        timings = list()
+
+        def run_queries(worker_queries):
+            worker_timings = list()
+            for query in worker_queries:
+                query_started_at = time.time()
+                run_query(query)
+                worker_timings.append(time.time() - query_started_at)
+            #list.extend is atomic
+            timings.extend(worker_timings)
+
+        def run_worker(worker_queries):
+            try:
+                run_queries(worker_queries)
+            finally:
+                #each thread has own database connection
+                connection.close()
+
+        started_at = time.time()
+        if concurrency == 1:
+            run_queries(queries)
+        else:
+            workers = list()
+            for worker_number in range(concurrency):
+                worker = threading.Thread(
+                                target=run_worker,
+                                args=(queries[worker_number::concurrency],)
+                            )
+                workers.append(worker)
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        elapsed = time.time() - started_at
+
+        if len(timings) < len(queries):
+            raise CommandError('some of the client threads have failed')
+
+        timings.sort()
+        self.stdout.write('Queries: %d, concurrency: %d\n' % (len(timings), concurrency))
+        self.stdout.write('Throughput: %.0f queries/s\n' % (len(timings) / elapsed))
+        for percent in (50, 90, 99):
+            value = get_percentile(timings, percent) * 1000
+            self.stdout.write('p%d: %.2f ms\n' % (percent, value))
+        self.stdout.write('max: %.2f ms\n' % (timings[-1] * 1000))
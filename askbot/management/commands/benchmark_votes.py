@@ -0,0 +1,134 @@
+"""Measures latency of the votes applied concurrently to one post
+and checks that none of the votes is lost.
+
+The votes are cast by the users who have not voted for the post
+yet and are canceled afterwards, unless ``--keep-votes`` is given,
+but the records of the reputation changes stay,
+so run the command on a copy of the database.
+"""
+import threading
+import time
+from optparse import make_option
+from django.core.management.base import NoArgsCommand, CommandError
+from django.db import connection
+from askbot.management.commands.benchmark_title_suggestions import get_percentile
+from askbot.models import Post, User, Vote
+
+def get_voters(post, number):
+    """returns list of the users who can vote for the post"""
+    voted_user_ids = Vote.objects.filter(
+                            voted_post=post
+                        ).values_list('user_id', flat=True)
+    voters = User.objects.filter(
+                            is_active=True
+                        ).exclude(
+                            id=post.author_id
+                        ).exclude(
+                            id__in=list(voted_user_ids)
+                        ).order_by('id')
+    return list(voters[:number])
+
+
+class Command(NoArgsCommand):
+    help = 'Measures latency of the concurrent votes for one post'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--post-id', action='store', type='int', dest='post_id',
+            default=None, help='Id of the voted post, by default - the latest question'
+        ),
+        make_option('--votes', action='store', type='int', dest='votes',
+            default=100, help='Maximum number of the votes'
+        ),
+        make_option('--concurrency', action='store', type='int', dest='concurrency',
+            default=8, help='Number of the concurrent voting threads'
+        ),
+        make_option('--keep-votes', action='store_true', dest='keep_votes',
+            default=False, help='Do not cancel the votes'
+        ),
+    )
+
+    def run_votes(self, post_id, voters, concurrency, cancel=False):
+        """casts or cancels upvotes of the ``voters``
+        in the concurrent threads, returns list of the timings"""
+        timings = list()
+
+        def vote(worker_voters):
+            #each thread votes with own copy of the post
+            post = Post.objects.get(id=post_id)
+            worker_timings = list()
+            for voter in worker_voters:
+                started_at = time.time()
+                voter.upvote(post, cancel=cancel)
+                worker_timings.append(time.time() - started_at)
+            #list.extend is atomic
+            timings.extend(worker_timings)
+
+        def run_worker(worker_voters):
+            try:
+                vote(worker_voters)
+            finally:
+                #each thread has own database connection
+                connection.close()
+
+        if concurrency == 1:
+            vote(voters)
+        else:
+            workers = list()
+            for worker_number in range(concurrency):
+                worker = threading.Thread(
+                                target=run_worker,
+                                args=(voters[worker_number::concurrency],)
+                            )
+                workers.append(worker)
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+
+        if len(timings) < len(voters):
+            raise CommandError('some of the voting threads have failed')
+        return timings
+
+    def print_timings(self, title, timings, elapsed):
+        timings.sort()
+        self.stdout.write('%s: %d\n' % (title, len(timings)))
+        self.stdout.write('Throughput: %.0f votes/s\n' % (len(timings) / elapsed))
+        for percent in (50, 90, 99):
+            value = get_percentile(timings, percent) * 1000
+            self.stdout.write('p%d: %.2f ms\n' % (percent, value))
+        self.stdout.write('max: %.2f ms\n' % (timings[-1] * 1000))
+
+    def handle_noargs(self, **options):
+        if options['post_id']:
+            try:
+                post = Post.objects.get(id=options['post_id'])
+            except Post.DoesNotExist:
+                raise CommandError('post %d does not exist' % options['post_id'])
+        else:
+            questions = Post.objects.filter(post_type='question').order_by('-id')
+            if len(questions[:1]) == 0:
+                raise CommandError('there are no questions to vote for')
+            post = questions[0]
+
+        voters = get_voters(post, options['votes'])
+        if len(voters) == 0:
+            raise CommandError('there are no users who can vote for the post')
+
+        concurrency = max(1, options['concurrency'])
+        self.stdout.write('Post: %d, concurrency: %d\n' % (post.id, concurrency))
+
+        started_at = time.time()
+        timings = self.run_votes(post.id, voters, concurrency)
+        self.print_timings('Votes', timings, time.time() - started_at)
+
+        points = Post.objects.get(id=post.id).points
+        self.stdout.write('Lost votes: %d\n' % (post.points + len(voters) - points))
+
+        if options['keep_votes']:
+            return
+
+        started_at = time.time()
+        timings = self.run_votes(post.id, voters, concurrency, cancel=True)
+        self.print_timings('Canceled votes', timings, time.time() - started_at)
+
+        points = Post.objects.get(id=post.id).points
+        self.stdout.write('Lost cancelations: %d\n' % (points - post.points))
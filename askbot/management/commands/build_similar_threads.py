@@ -0,0 +1,27 @@
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+from askbot.models import Thread, SimilarThread
+from askbot.search import tag_index
+from askbot.utils.console import ProgressBar
+
+class Command(NoArgsCommand):
+    help = 'Rebuilds the precomputed lists of similar threads'
+
+    @transaction.commit_manually
+    def handle_noargs(self, **options):
+        index = tag_index.shared_index.load()
+        excluded_ids = SimilarThread.objects.get_excluded_thread_ids()
+        SimilarThread.objects.all().delete()
+        transaction.commit()
+
+        thread_ids = Thread.objects.filter(
+                                deleted=False
+                            ).values_list('id', flat=True)
+        count = thread_ids.count()
+        message = "Calculating similar threads"
+        for thread_id in ProgressBar(thread_ids.iterator(), count, message):
+            records = SimilarThread.objects.compute_for_thread(
+                                                thread_id, index, excluded_ids
+                                            )
+            SimilarThread.objects.bulk_create(records)
+            transaction.commit()
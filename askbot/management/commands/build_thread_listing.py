@@ -0,0 +1,14 @@
+from django.core.management.base import NoArgsCommand
+from askbot.models import Thread, ThreadListing
+from askbot.utils.console import ProgressBar
+
+class Command(NoArgsCommand):
+    help = 'Rebuilds the denormalized question list table'
+
+    def handle_noargs(self, **options):
+        ThreadListing.objects.all().delete()
+        message = "Rebuilding question list table"
+        threads = Thread.objects.all()
+        count = threads.count()
+        for thread in ProgressBar(threads.iterator(), count, message):
+            ThreadListing.objects.update_for_thread(thread)
@@ -1,10 +1,23 @@
+from optparse import make_option
 from django.core.management.base import NoArgsCommand
 from askbot.models import Thread
-from askbot.utils.console import ProgressBar
+from askbot.utils import summary_warmer
 
 class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--parallel', action='store_true', dest='parallel',
+            default=False,
+            help='Render each language in a separate process'
+        ),
+    )
+
     def handle_noargs(self, **options):
-        message = "Rebuilding thread summary cache"
-        count = Thread.objects.count()
-        for thread in ProgressBar(Thread.objects.iterator(), count, message):
-            thread.update_summary_html()
+        self.stdout.write('Rebuilding thread summary cache\n')
+        threads = Thread.objects.order_by(
+                                    '-last_activity_at'
+                                ).values_list('language_code', 'id')
+        count = summary_warmer.render_languages(
+                                    threads.iterator(),
+                                    parallel=options['parallel']
+                                )
+        self.stdout.write('Rendered %d summaries\n' % count)
@@ -0,0 +1,62 @@
+from optparse import make_option
+from django.core.management.base import NoArgsCommand
+from askbot.mail import send_queue
+
+class Command(NoArgsCommand):
+    help = 'Sends the email messages from the outgoing queue'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--workers', action='store', type='int', dest='workers',
+            default=1, help='Number of the sending threads'
+        ),
+        make_option('--batch-size', action='store', type='int', dest='batch_size',
+            default=send_queue.BATCH_SIZE,
+            help='Number of the messages claimed at once'
+        ),
+        make_option('--time-limit', action='store', type='int', dest='time_limit',
+            default=None, help='Stop claiming the messages after this many seconds'
+        ),
+        make_option('--requeue-dead', action='store_true', dest='requeue_dead',
+            default=False, help='Return the dead letters to the queue first'
+        ),
+        make_option('--stats', action='store_true', dest='stats',
+            default=False,
+            help='Only print the queue depth and the latency of the last run'
+        ),
+    )
+
+    def handle_noargs(self, **options):
+        if not options['stats']:
+            if options['requeue_dead']:
+                count = send_queue.requeue_dead()
+                self.stdout.write('Requeued %d messages\n' % count)
+            send_queue.drain(
+                    workers=max(1, options['workers']),
+                    batch_size=max(1, options['batch_size']),
+                    time_limit=options['time_limit']
+                )
+        stats = send_queue.get_stats()
+        self.stdout.write('Queued: %d\n' % stats['queued'])
+        self.stdout.write('Sending: %d\n' % stats['sending'])
+        self.stdout.write('Dead: %d\n' % stats['dead'])
+        self.stdout.write('Lag: %d seconds\n' % stats['lag'])
+        last_drain = stats.get('last_drain')
+        if last_drain:
+            self.stdout.write(
+                'Last run: %d sent, %d failed, %d dead in %.2f s\n' % (
+                    last_drain['sent'],
+                    last_drain['failed'],
+                    last_drain['dead'],
+                    last_drain['elapsed']
+                )
+            )
+            if last_drain['sent']:
+                self.stdout.write(
+                    'Send time: avg %.3f s, max %.3f s\n' % (
+                        last_drain['send_time_avg'], last_drain['send_time_max']
+                    )
+                )
+                self.stdout.write(
+                    'Time in queue: avg %.1f s, max %.1f s\n' % (
+                        last_drain['queue_time_avg'], last_drain['queue_time_max']
+                    )
+                )
@@ -0,0 +1,17 @@
+from optparse import make_option
+from django.core.management.base import NoArgsCommand
+from askbot.models import Thread
+
+class Command(NoArgsCommand):
+    help = 'Fills the denormalized question post field of the threads'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--batch-size', action='store', type='int', dest='batch_size',
+            default=1000,
+            help='Number of the threads updated with one query'
+        ),
+    )
+
+    def handle_noargs(self, **options):
+        Thread.objects.fill_question_posts(batch_size=options['batch_size'])
+        missing = Thread.objects.filter(question_post__isnull=True).count()
+        self.stdout.write('Threads without question post: %d\n' % missing)
@@ -0,0 +1,19 @@
+from optparse import make_option
+from django.core.management.base import NoArgsCommand
+from askbot.utils import visit_recorder
+
+class Command(NoArgsCommand):
+    help = 'Saves the buffered question visits to the database'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--stats', action='store_true', dest='stats',
+            default=False,
+            help='Only print the number of the buffered visits'
+        ),
+    )
+
+    def handle_noargs(self, **options):
+        if not options['stats']:
+            count = visit_recorder.flush()
+            self.stdout.write('Saved %d visits\n' % count)
+        stats = visit_recorder.get_stats()
+        self.stdout.write('Buffered visits: %d\n' % stats['depth'])
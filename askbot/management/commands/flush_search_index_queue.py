@@ -0,0 +1,25 @@
+from optparse import make_option
+from django.core.management.base import NoArgsCommand
+from askbot.search import update_queue
+
+class Command(NoArgsCommand):
+    help = 'Applies the queued updates of the search index'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--delay', action='store', type='int', dest='delay',
+            default=None,
+            help='Process updates queued at least this many seconds ago, '
+                'default is the ASKBOT_SEARCH_UPDATE_DELAY setting'
+        ),
+        make_option('--stats', action='store_true', dest='stats',
+            default=False,
+            help='Only print the queue depth and lag'
+        ),
+    )
+
+    def handle_noargs(self, **options):
+        if not options['stats']:
+            count = update_queue.flush(delay=options['delay'])
+            self.stdout.write('Processed %d updates\n' % count)
+        stats = update_queue.get_stats()
+        self.stdout.write('Queue depth: %d\n' % stats['depth'])
+        self.stdout.write('Lag: %d seconds\n' % stats['lag'])
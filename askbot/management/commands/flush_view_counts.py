@@ -0,0 +1,19 @@
+from optparse import make_option
+from django.core.management.base import NoArgsCommand
+from askbot.utils import view_counter
+
+class Command(NoArgsCommand):
+    help = 'Writes the buffered question view counts to the database'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--stats', action='store_true', dest='stats',
+            default=False,
+            help='Only print the number of the threads with the buffered views'
+        ),
+    )
+
+    def handle_noargs(self, **options):
+        if not options['stats']:
+            count = view_counter.flush()
+            self.stdout.write('Updated view counts of %d threads\n' % count)
+        stats = view_counter.get_stats()
+        self.stdout.write('Buffered threads: %d\n' % stats['depth'])
@@ -0,0 +1,38 @@
+from optparse import make_option
+from django.core.management.base import NoArgsCommand
+from askbot.utils import summary_warmer
+
+class Command(NoArgsCommand):
+    help = 'Renders summaries of the questions marked by the summary warmer'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--limit', action='store', type='int', dest='limit',
+            default=None,
+            help='Render at most this many of the most important summaries'
+        ),
+        make_option('--parallel', action='store_true', dest='parallel',
+            default=False,
+            help='Render each language in a separate process'
+        ),
+        make_option('--stats', action='store_true', dest='stats',
+            default=False,
+            help='Only print the number of the marked questions '
+                'and the summary cache hit counts'
+        ),
+    )
+
+    def handle_noargs(self, **options):
+        if not options['stats']:
+            count = summary_warmer.warm(
+                                limit=options['limit'],
+                                parallel=options['parallel']
+                            )
+            self.stdout.write('Rendered %d summaries\n' % count)
+        stats = summary_warmer.get_stats()
+        self.stdout.write('Marked questions: %d\n' % stats['depth'])
+        self.stdout.write('Lag: %d seconds\n' % stats['lag'])
+        from askbot.models import Thread
+        cache_stats = Thread.objects.get_summary_cache_stats()
+        self.stdout.write(
+            'Summary cache hits: %d, misses: %d\n' % \
+            (cache_stats['hits'], cache_stats['misses'])
+        )
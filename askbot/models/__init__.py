@@ -42,8 +42,18 @@ from askbot.conf import settings as askbot_settings
 from askbot.models.question import Thread
 from askbot.skins import utils as skin_utils
 from askbot.mail import messages
+from askbot.mail import subscriber_index
+from askbot.search import result_cache as search_result_cache
+from askbot.search import tag_index
+from askbot.search import local_search
+from askbot.search import title_index
+from askbot.search import update_queue as search_update_queue
 from askbot.models.question import QuestionView, AnonymousQuestion
 from askbot.models.question import DraftQuestion
+from askbot.models.question import ThreadListing
+from askbot.models.question import SimilarThread
+from askbot.models.question import ThreadSearchDocument, ThreadSearchPosting
+from askbot.models.question import ThreadSummaryUpdate
 from askbot.models.question import FavoriteQuestion
 from askbot.models.tag import Tag, MarkedTag, TagSynonym
 from askbot.models.tag import format_personal_group_name
@@ -60,6 +70,7 @@ from askbot.models.badges import award_badges_signal, get_badge
 from askbot.models.repute import Award, Repute, Vote, BadgeData
 from askbot.models.widgets import AskWidget, QuestionWidget
 from askbot.models.meta import ImportRun, ImportedObjectInfo
+from askbot.models.meta import SearchIndexUpdate, OutgoingEmail
 from askbot import auth
 from askbot.utils.decorators import auto_now_timestamp
 from askbot.utils.markup import URL_RE
@@ -69,6 +80,8 @@ from askbot.utils.html import sanitize_html
 from askbot.utils.html import site_url
 from askbot.utils.diff import textDiff as htmldiff
 from askbot.utils.url_utils import strip_path
+from askbot.utils import visit_recorder
+from askbot.utils import vote_engine
 from askbot import mail
 from askbot.models import signals
 
@@ -1381,6 +1394,9 @@ def user_mark_tags(
         else:
             if reason in ('good', 'bad'):#to maintain exclusivity of 'good' and 'bad'
                 marked_ts.update(reason=reason)
+                #update does not send the signals
+                if subscriber_index.is_enabled():
+                    subscriber_index.shared_index.update_user(self.id)
             cleaned_tagnames = tagnames
 
     return cleaned_tagnames, cleaned_wildcards
@@ -2034,18 +2050,10 @@ def user_visit_question(self, question = None, timestamp = None):
     if timestamp is None:
         timestamp = datetime.datetime.now()
 
-    try:
-        QuestionView.objects.filter(
-            who=self, question=question
-        ).update(
-            when = timestamp
-        )
-    except QuestionView.DoesNotExist:
-        QuestionView(
-            who=self,
-            question=question,
-            when = timestamp
-        ).save()
+    if visit_recorder.is_enabled():
+        visit_recorder.record_visit(self.id, question.id, timestamp)
+    else:
+        QuestionView.objects.record_views([(self.id, question.id, timestamp)])
 
     #filter memo objects on response activities directed to the qurrent user
     #that refer to the children of the currently
@@ -2603,10 +2611,7 @@ def _process_vote(user, post, timestamp=None, cancel=False, vote_type=None):
         elif vote.is_opposite(vote_type):
             return
         else:
-            #we would call vote.delete() here
-            #but for now all that is handled by the
-            #legacy askbot.auth functions
-            #vote.delete()
+            #the vote is deleted by the vote engine
             pass
     else:
         if vote == None:
@@ -2621,37 +2626,22 @@ def _process_vote(user, post, timestamp=None, cancel=False, vote_type=None):
         else:
             return
 
-    #do the actual work
-    if vote_type == Vote.VOTE_UP:
-        if cancel:
-            auth.onUpVotedCanceled(vote, post, user, timestamp)
-        else:
-            auth.onUpVoted(vote, post, user, timestamp)
-    elif vote_type == Vote.VOTE_DOWN:
-        if cancel:
-            auth.onDownVotedCanceled(vote, post, user, timestamp)
-        else:
-            auth.onDownVoted(vote, post, user, timestamp)
-
-    post.thread.invalidate_cached_data()
-
-    if post.post_type == 'question':
-        #denormalize the question post score on the thread
-        post.thread.points = post.points
-        post.thread.save()
-        post.thread.update_summary_html()
+    if cancel:
+        event = None
+    else:
+        event = VOTES_TO_EVENTS.get((vote_type, post.post_type), None)
+
+    #the cached data and the badges are updated after the commit
+    vote_engine.process_vote(
+                    vote, post, user,
+                    timestamp=timestamp,
+                    cancel=cancel,
+                    event=event
+                )
 
     if cancel:
         return None
 
-    event = VOTES_TO_EVENTS.get((vote_type, post.post_type), None)
-    if event:
-        award_badges_signal.send(None,
-                    event = event,
-                    actor = user,
-                    context_object = post,
-                    timestamp = timestamp
-                )
     return vote
 
 def user_fix_html_links(self, text):
@@ -3577,6 +3567,115 @@ def record_update_tags(thread, tags, user, timestamp, **kwargs):
                 )
     activity.save()
 
+def update_thread_listing(instance, **kwargs):
+    """updates the denormalized question list record
+    when thread is saved"""
+    if kwargs.get('raw', False):
+        return
+    if ThreadListing.objects.is_enabled():
+        ThreadListing.objects.update_for_thread(instance)
+
+def update_title_index(instance, **kwargs):
+    """updates the in-process title index
+    when thread is saved"""
+    if kwargs.get('raw', False):
+        return
+    if title_index.is_enabled():
+        title_index.shared_index.update_thread(instance)
+
+def update_thread_listing_tags(thread, **kwargs):
+    """updates tags of the question list record
+    upon the tags_updated signal"""
+    if ThreadListing.objects.is_enabled():
+        ThreadListing.objects.update_for_thread(thread)
+
+def invalidate_search_result_cache(**kwargs):
+    """invalidates cached anonymous question lists
+    upon changes in threads, posts and tags"""
+    if kwargs.get('raw', False):
+        return
+    if search_result_cache.is_enabled():
+        search_result_cache.bump_generation()
+
+def update_subscriber_index_for_tag_mark(instance, **kwargs):
+    """updates the in-process index of the instant
+    email subscribers when tag mark is saved or deleted"""
+    if kwargs.get('raw', False):
+        return
+    if subscriber_index.is_enabled():
+        subscriber_index.shared_index.update_user(instance.user_id)
+
+def update_subscriber_index_for_user(instance, **kwargs):
+    """updates the in-process index of the instant
+    email subscribers when user changes the tag filter
+    strategy or the wildcard tags"""
+    if kwargs.get('raw', False):
+        return
+    if subscriber_index.is_enabled():
+        state = (
+            instance.email_tag_filter_strategy,
+            instance.interesting_tags,
+            instance.ignored_tags,
+            instance.subscribed_tags
+        )
+        subscriber_index.shared_index.update_user_if_changed(
+                                                instance.id, 'user', state
+                                            )
+
+def update_subscriber_index_for_feed(instance, **kwargs):
+    """updates the in-process index of the instant
+    email subscribers when user changes the frequency
+    of the alerts about all questions"""
+    if kwargs.get('raw', False):
+        return
+    if instance.feed_type != 'q_all':
+        return
+    if subscriber_index.is_enabled():
+        if kwargs.get('signal') is django_signals.post_delete:
+            state = 'deleted'
+        else:
+            state = instance.frequency
+        subscriber_index.shared_index.update_user_if_changed(
+                                                instance.subscriber_id,
+                                                'feed',
+                                                state,
+                                                subscription_changed=True
+                                            )
+
+def update_tag_index(thread, **kwargs):
+    """updates the in-process tag index
+    upon the tags_updated signal, the index
+    is also used to calculate the similar threads"""
+    if tag_index.is_enabled() or SimilarThread.objects.is_enabled():
+        tag_index.shared_index.update_thread(thread)
+
+def update_similar_threads(thread, **kwargs):
+    """schedules recalculation of the similar threads
+    upon the tags_updated signal"""
+    if SimilarThread.objects.is_enabled():
+        from askbot import tasks
+        tasks.update_similar_threads_celery_task.delay(thread.id)
+
+def update_local_search_index(post=None, thread=None, **kwargs):
+    """schedules reindexing of the thread for the local
+    full text search upon the post_updated and tags_updated signals"""
+    if local_search.is_enabled():
+        if thread is not None:
+            thread_id = thread.id
+            language_code = thread.language_code
+        else:
+            thread_id = post.thread_id
+            language_code = post.language_code
+        if not thread_id:
+            return
+        if search_update_queue.is_enabled():
+            search_update_queue.enqueue(
+                    'askbot.thread', thread_id, language_code=language_code
+                )
+        else:
+            from askbot import tasks
+            tasks.update_thread_search_index_celery_task.delay(thread_id)
+
 def record_favorite_question(instance, created, **kwargs):
     """
     when user add the question in him favorite questions list.
@@ -3816,12 +3915,25 @@ django_signals.post_save.connect(add_missing_subscriptions, sender=User)
 django_signals.post_save.connect(add_user_to_global_group, sender=User)
 django_signals.post_save.connect(add_user_to_personal_group, sender=User)
 django_signals.post_save.connect(add_missing_tag_subscriptions, sender=User)
+django_signals.post_save.connect(update_subscriber_index_for_user, sender=User)
+django_signals.post_save.connect(update_subscriber_index_for_tag_mark, sender=MarkedTag)
+django_signals.post_delete.connect(update_subscriber_index_for_tag_mark, sender=MarkedTag)
+django_signals.post_save.connect(update_subscriber_index_for_feed, sender=EmailFeedSetting)
+django_signals.post_delete.connect(update_subscriber_index_for_feed, sender=EmailFeedSetting)
 django_signals.post_save.connect(record_award_event, sender=Award)
 django_signals.post_save.connect(notify_award_message, sender=Award)
 django_signals.post_save.connect(record_answer_accepted, sender=Post)
 django_signals.post_save.connect(record_vote, sender=Vote)
 django_signals.post_save.connect(record_favorite_question, sender=FavoriteQuestion)
 django_signals.post_save.connect(moderate_group_joining, sender=GroupMembership)
+django_signals.post_save.connect(update_thread_listing, sender=Thread)
+django_signals.post_save.connect(update_title_index, sender=Thread)
+django_signals.post_save.connect(invalidate_search_result_cache, sender=Thread)
+django_signals.post_save.connect(invalidate_search_result_cache, sender=Post)
+django_signals.post_save.connect(invalidate_search_result_cache, sender=Tag)
+django_signals.post_delete.connect(invalidate_search_result_cache, sender=Thread)
+django_signals.post_delete.connect(invalidate_search_result_cache, sender=Post)
+django_signals.post_delete.connect(invalidate_search_result_cache, sender=Tag)
 
 if 'avatar' in django_settings.INSTALLED_APPS:
     from avatar.models import Avatar
@@ -3835,6 +3947,11 @@ signals.delete_question_or_answer.connect(record_delete_question, sender=Post)
 signals.flag_offensive.connect(record_flag_offensive, sender=Post)
 signals.remove_flag_offensive.connect(remove_flag_offensive, sender=Post)
 signals.tags_updated.connect(record_update_tags)
+signals.tags_updated.connect(update_thread_listing_tags)
+signals.tags_updated.connect(invalidate_search_result_cache)
+signals.tags_updated.connect(update_tag_index)
+signals.tags_updated.connect(update_similar_threads)
+signals.tags_updated.connect(update_local_search_index)
 signals.user_registered.connect(greet_new_user)
 signals.user_registered.connect(make_admin_if_first_user)
 signals.user_updated.connect(record_user_full_updated, sender=User)
@@ -3842,6 +3959,7 @@ signals.user_logged_in.connect(complete_pending_tag_subscriptions)#todo: add thi
 signals.user_logged_in.connect(notify_punished_users)
 signals.user_logged_in.connect(post_anonymous_askbot_content)
 signals.post_updated.connect(record_post_update_activity)
+signals.post_updated.connect(update_local_search_index)
 signals.new_answer_posted.connect(tweet_new_post)
 signals.new_question_posted.connect(tweet_new_post)
 signals.reputation_received.connect(autoapprove_reputable_user)
@@ -3855,6 +3973,11 @@ __all__ = [
         'signals',
 
         'Thread',
+        'ThreadListing',
+        'SimilarThread',
+        'ThreadSearchDocument',
+        'ThreadSearchPosting',
+        'ThreadSummaryUpdate',
 
         'QuestionView',
         'FavoriteQuestion',
@@ -3890,6 +4013,8 @@ __all__ = [
         
         'ImportRun',
         'ImportedObjectInfo',
+        'SearchIndexUpdate',
+        'OutgoingEmail',
 
         'get_model',
 ]
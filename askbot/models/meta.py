@@ -2,6 +2,7 @@
 an askbot instance, but may be used in some cases.
 Data in these models can be erased without loss of function.
 """
+from django.conf import settings as django_settings
 from django.db import models
 from picklefield.fields import PickledObjectField
 
@@ -30,3 +31,64 @@ class ImportedObjectInfo(models.Model):
 
     class Meta:
         app_label = 'askbot'
+
+class SearchIndexUpdate(models.Model):
+    """pending update of the search index for an object,
+    repeated changes of the same object are merged into one record,
+    see :mod:`askbot.search.update_queue`
+    """
+    model_name = models.CharField(
+                        max_length=128,
+                        help_text='app label and model name, e.g. askbot.thread'
+                    )
+    object_id = models.PositiveIntegerField()
+    action = models.CharField(max_length=16, default='update')
+    #language of the search index to update
+    language_code = models.CharField(
+                        max_length=16,
+                        default=django_settings.LANGUAGE_CODE
+                    )
+    queued_at = models.DateTimeField(db_index=True)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        app_label = 'askbot'
+        unique_together = ('model_name', 'object_id', 'language_code')
+
+class OutgoingEmail(models.Model):
+    """email message to one recipient waiting to be sent,
+    see :mod:`askbot.mail.send_queue`
+    """
+    STATUS_CHOICES = (
+        ('queued', 'queued'),
+        ('sending', 'sending'),
+        ('dead', 'dead'),
+    )
+    from_email = models.CharField(max_length=256)
+    recipient = models.CharField(max_length=256)
+    domain = models.CharField(max_length=128, db_index=True)
+    subject = models.TextField()
+    body_text = models.TextField()
+    body_html = models.TextField(blank=True, default='')
+    headers = models.TextField(default='{}', help_text='json encoded dictionary')
+    status = models.CharField(
+                        max_length=16,
+                        choices=STATUS_CHOICES,
+                        default='queued',
+                        db_index=True
+                    )
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    claim = models.CharField(
+                        max_length=32,
+                        blank=True,
+                        default='',
+                        db_index=True,
+                        help_text='id of the drainer sending the message'
+                    )
+    queued_at = models.DateTimeField()
+    next_attempt_at = models.DateTimeField(db_index=True)
+    claimed_at = models.DateTimeField(null=True)
+
+    class Meta:
+        app_label = 'askbot'
@@ -29,6 +29,7 @@ from askbot.models.tag import Tag, MarkedTag
 from askbot.models.tag import tags_match_some_wildcard
 from askbot.conf import settings as askbot_settings
 from askbot import exceptions
+from askbot.mail import subscriber_index
 from askbot.utils import markup
 from askbot.utils.html import get_word_count
 from askbot.utils.html import sanitize_html
@@ -667,6 +668,9 @@ class Post(models.Model):
             for group in groups:
                 for comment in comments:
                     PostToGroup.objects.get_or_create(post=comment, group=group)
+        #cached post data depends on the groups
+        if askbot_settings.GROUPS_ENABLED and self.thread_id:
+            self.thread.invalidate_cached_post_data()
 
     def remove_from_groups(self, groups):
         PostToGroup.objects.filter(post=self, group__in=groups).delete()
@@ -676,6 +680,8 @@ class Post(models.Model):
                         post__id__in=comment_ids,
                         group__in=groups
                     ).delete()
+        if askbot_settings.GROUPS_ENABLED and self.thread_id:
+            self.thread.invalidate_cached_post_data()
 
 
     def issue_update_notifications(
@@ -1182,7 +1188,30 @@ class Post(models.Model):
         subscriber retrieval functions
         todo: retrieval of wildcard tag followers ignorers
               won't scale at all
+
+        with the ``ASKBOT_SUBSCRIBER_INDEX_ENABLED`` setting the
+        subscribers are found in the :mod:`askbot.mail.subscriber_index`
         """
+        if askbot_settings.SUBSCRIBED_TAG_SELECTOR_ENABLED:
+            good_mark_reason = 'subscribed'
+        else:
+            good_mark_reason = 'good'
+
+        if subscriber_index.is_enabled():
+            tag_names = self.get_tag_names()
+            tag_ids = Tag.objects.filter(
+                                name__in=tag_names,
+                                language_code=get_language()
+                            ).values_list('id', flat=True)
+            index = subscriber_index.shared_index.get()
+            user_ids = index.get_subscriber_ids(
+                                tag_ids,
+                                tag_names=tag_names,
+                                good_reason=good_mark_reason,
+                                use_wildcards=askbot_settings.USE_WILDCARD_TAGS
+                            )
+            return set(subscriber_index.load_users(user_ids))
+
         subscriber_set = set()
 
         from askbot.models.user import EmailFeedSetting
@@ -1202,10 +1231,6 @@ class Post(models.Model):
         subscriber_set.update(global_subscribers)
 
         #segment of users who want emails on selected questions only
-        if askbot_settings.SUBSCRIBED_TAG_SELECTOR_ENABLED:
-            good_mark_reason = 'subscribed'
-        else:
-            good_mark_reason = 'good'
         subscriber_set.update(
             self.get_global_tag_based_subscribers(
                 subscription_records = global_subscriptions,
@@ -1,16 +1,22 @@
+import array
 import datetime
 import operator
 import re
+import time
 
 from copy import copy
 from django.conf import settings as django_settings
 from django.db import models
+from django.db import connection
+from django.db import transaction
+from django.db import IntegrityError
 from django.db.models import F
 from django.contrib.auth.models import User
 from django.core import cache  # import cache, not from cache import cache, to be able to monkey-patch cache.cache in test cases
 from django.core import exceptions as django_exceptions
 from django.core.urlresolvers import reverse
 from django.template.loader import get_template
+from django.utils.http import urlquote as django_urlquote
 from django.utils.hashcompat import md5_constructor
 from django.utils.translation import ugettext as _
 from django.utils.translation import ungettext
@@ -35,6 +41,81 @@ from askbot.utils.lists import LazyList
 from askbot.search import mysql
 from askbot.utils.slug import slugify
 from askbot.search.state_manager import DummySearchState
+from askbot.search import tag_index
+from askbot.search import local_search
+from askbot.search import title_index
+from askbot.utils import summary_warmer
+
+
+QUESTION_ORDER_BY_MAP = {
+    'age-desc': '-added_at',
+    'age-asc': 'added_at',
+    'activity-desc': '-last_activity_at',
+    'activity-asc': 'last_activity_at',
+    'answers-desc': '-answer_count',
+    'answers-asc': 'answer_count',
+    'votes-desc': '-points',
+    'votes-asc': 'points',
+
+    'relevance-desc': '-relevance', # special Postgresql and local search ordering, 'relevance' quaso-column is added by get_for_query()
+}
+
+#fields of the Thread model loaded for the question lists
+THREAD_LIST_FIELDS = (
+    'id', 'title', 'view_count', 'answer_count', 'last_activity_at',
+    'last_activity_by', 'closed', 'tagnames', 'accepted_answer',
+    'added_at', 'points', 'question_post', 'deleted'
+)
+
+SUMMARY_CACHE_HITS_KEY = 'askbot-summary-cache-hits'
+SUMMARY_CACHE_MISSES_KEY = 'askbot-summary-cache-misses'
+
+#tag placeholders in the cached summary html are replaced with the
+#search urls, use `<<<` and `>>>` because they cannot be confused with
+#user input - if user accidentialy types <<<tag-name>>> into question
+#title or body, then in html it'll become escaped like this:
+#&lt;&lt;&lt;tag-name&gt;&gt;&gt;
+SUMMARY_TAG_RE = re.compile(r'<<<(%s)>>>' % const.TAG_REGEX_BARE, re.UNICODE)
+
+
+def split_summary_html(html):
+    """returns list of segments of the summary html, where
+    the odd items are the tag names in place of the placeholders,
+    summaries are cached in this form"""
+    return SUMMARY_TAG_RE.split(html)
+
+
+def get_summary_segments(cached_value):
+    """cache may also have summaries stored as html strings"""
+    if isinstance(cached_value, basestring):
+        return split_summary_html(cached_value)
+    return cached_value
+
+
+def join_summary_segments(segments, tag_url_formatter):
+    """returns summary html with the tag urls made by the formatter,
+    returned by the ``get_tag_url_formatter()`` of the search state"""
+    # todo: this work may be pushed onto javascript we post-process tag names
+    # in the snippet so that tag urls match the search state
+    parts = list(segments)
+    for position in xrange(1, len(parts), 2):
+        parts[position] = tag_url_formatter.get_url(parts[position])
+    return ''.join(parts)
+
+
+def get_tag_url_formatter(search_state=None):
+    if search_state is None:
+        search_state = DummySearchState()
+    return search_state.get_tag_url_formatter()
+
+
+def increment_cache_counter(key, delta):
+    if delta == 0:
+        return
+    try:
+        cache.cache.incr(key, delta)
+    except ValueError:
+        cache.cache.set(key, delta, const.LONG_TIME)
 
 
 def clean_tagnames(tagnames):
@@ -66,6 +147,55 @@ class ThreadQuerySet(models.query.QuerySet):
             groups = [Group.objects.get_global_group()]
         return self.filter(groups__in=groups).distinct()
 
+    def filter_by_all_tags(self, tag_names):
+        """returns threads tagged with all of the given tags,
+        uses one grouped subquery instead of a join per tag
+        """
+        tag_names = set(tag_names)
+        if len(tag_names) == 0:
+            return self
+
+        if tag_index.is_enabled():
+            thread_ids = self.get_thread_ids_from_tag_index(tag_names)
+            if len(thread_ids) <= tag_index.MAX_ID_LIST_SIZE:
+                return self.filter(id__in=thread_ids)
+
+        thread_tags = self.model.tags.through.objects.filter(
+                                                    tag__name__in=tag_names
+                                                )
+        thread_ids = thread_tags.values('thread').annotate(
+                                    tag_count=models.Count('tag')
+                                ).filter(
+                                    tag_count=len(tag_names)
+                                ).values('thread')
+        return self.filter(id__in=thread_ids)
+
+    def get_thread_ids_from_tag_index(self, tag_names):
+        """returns ids of threads having all of the given tags
+        (tags of the same name in different languages are OR-ed)
+        """
+        tag_ids = dict()
+        for tag_id, tag_name in Tag.objects.filter(
+                            name__in=tag_names
+                        ).values_list('id', 'name'):
+            tag_ids.setdefault(tag_name, list()).append(tag_id)
+
+        if len(tag_ids) < len(tag_names):
+            return list()
+
+        index = tag_index.shared_index.get()
+        if all([len(ids) == 1 for ids in tag_ids.values()]):
+            return index.intersect([ids[0] for ids in tag_ids.values()])
+
+        thread_ids = None
+        for ids in tag_ids.values():
+            name_thread_ids = set(index.union(ids))
+            if thread_ids is None:
+                thread_ids = name_thread_ids
+            else:
+                thread_ids &= name_thread_ids
+        return sorted(thread_ids)
+
     def get_for_title_query(self, search_query):
         """returns threads matching title query
         todo: possibly add tags
@@ -199,6 +329,10 @@ class ThreadManager(BaseQuerySetManager):
         #this call is rather heavy, we should split into several functions
         parse_results = question.parse_and_save(author=author, is_private=is_private)
 
+        thread.question_post = question
+        thread._question_cache = question
+        self.filter(id=thread.id).update(question_post=question)
+
         revision = question.add_revision(
             author=author,
             is_anonymous=is_anonymous,
@@ -248,6 +382,8 @@ class ThreadManager(BaseQuerySetManager):
         else:
             if not qs:
                 qs = self.all()
+            if local_search.is_enabled():
+                return local_search.run_thread_search(qs, search_query)
     #        if getattr(settings, 'USE_SPHINX_SEARCH', False):
     #            matching_questions = Question.sphinx_search.query(search_query)
     #            question_ids = [q.id for q in matching_questions]
@@ -270,6 +406,62 @@ class ThreadManager(BaseQuerySetManager):
                 )
 
 
+    def get_title_suggestions(self, query, count=10):
+        """returns list of up to ``count`` threads whose
+        titles have words starting with each word of the query,
+        looked up in the :mod:`askbot.search.title_index`,
+        with the question posts loaded in the same query
+        """
+        language_code = None
+        if getattr(django_settings, 'ASKBOT_MULTILINGUAL', False):
+            language_code = get_language()
+        index = title_index.shared_index.get()
+        #some candidates may turn out deleted or not approved
+        thread_ids = index.search(query, language_code, count * 2)
+        if len(thread_ids) == 0:
+            return list()
+
+        from askbot.models.post import Post
+        questions = Post.objects.filter(
+                                post_type='question',
+                                deleted=False,
+                                thread__id__in=thread_ids,
+                                thread__deleted=False
+                            ).select_related('thread')
+        if askbot_settings.CONTENT_MODERATION_MODE == 'premoderation':
+            questions = questions.filter(thread__approved=True)
+
+        threads = dict()
+        for question in questions:
+            thread = question.thread
+            thread._question_cache = question
+            threads[thread.id] = thread
+        threads = [threads[thread_id] for thread_id in thread_ids if thread_id in threads]
+        return threads[:count]
+
+    def get_search_tag_names(self, tags):
+        """returns a tuple: names of the search ``tags``
+        found in the database and a list of names
+        of tags that do not exist.
+        When tag search input is disabled, the tags are
+        used as is
+        """
+        if askbot_settings.TAG_SEARCH_INPUT_ENABLED:
+            #todo: this may be gone or disabled per option
+            #"tag_search_box_enabled"
+            existing_tags = set()
+            non_existing_tags = set()
+            name_map = Tag.objects.get_names_map_iexact(tags)
+            for tag in tags:
+                if tag.lower() in name_map:
+                    existing_tags.add(name_map[tag.lower()])
+                else:
+                    non_existing_tags.add(tag)
+
+            return existing_tags, list(non_existing_tags)
+        else:
+            return tags, list()
+
     def run_advanced_search(self, request_user, search_state):  # TODO: !! review, fix, and write tests for this
         """
         all parameters are guaranteed to be clean
@@ -279,6 +471,10 @@ class ThreadManager(BaseQuerySetManager):
         """
         from askbot.conf import settings as askbot_settings # Avoid circular import
 
+        #simple listings are served by the denormalized table, if enabled
+        if ThreadListing.objects.can_run_search(request_user, search_state):
+            return ThreadListing.objects.run_search(request_user, search_state)
+
         primary_filter = {
             'posts__post_type': 'question',
             'posts__deleted': False
@@ -331,30 +527,11 @@ class ThreadManager(BaseQuerySetManager):
         tags = search_state.unified_tags()
         if len(tags) > 0:
 
-            if askbot_settings.TAG_SEARCH_INPUT_ENABLED:
-                #todo: this may be gone or disabled per option
-                #"tag_search_box_enabled"
-                existing_tags = set()
-                non_existing_tags = set()
-                #we're using a one-by-one tag retreival, b/c
-                #we want to take advantage of case-insensitive search indexes
-                #in postgresql, plus it is most likely that there will be
-                #only one or two search tags anyway
-                for tag in tags:
-                    try:
-                        tag_record = Tag.objects.get(name__iexact=tag)
-                        existing_tags.add(tag_record.name)
-                    except Tag.DoesNotExist:
-                        non_existing_tags.add(tag)
-
-                meta_data['non_existing_tags'] = list(non_existing_tags)
-                tags = existing_tags
-            else:
-                meta_data['non_existing_tags'] = list()
+            tags, meta_data['non_existing_tags'] = \
+                                    self.get_search_tag_names(tags)
 
-            #construct filter for the tag search
-            for tag in tags:
-                qs = qs.filter(tags__name=tag) # Tags or AND-ed here, not OR-ed (i.e. we fetch only threads with all tags)
+            #tags are AND-ed here, not OR-ed (i.e. we fetch only threads with all tags)
+            qs = qs.filter_by_all_tags(tags)
         else:
             meta_data['non_existing_tags'] = list()
 
@@ -405,28 +582,11 @@ class ThreadManager(BaseQuerySetManager):
         if request_user and request_user.is_authenticated():
             #mark questions tagged with interesting tags
             #a kind of fancy annotation, would be nice to avoid it
-            lang = get_language()
-            interesting_tags = Tag.objects.filter(
-                user_selections__user=request_user,
-                user_selections__reason='good',
-                language_code=lang
+            tag_selections = self.get_tag_selections(request_user)
+            interesting_tags, ignored_tags, subscribed_tags = tag_selections
+            meta_data.update(
+                self.get_tag_selections_meta_data(request_user, tag_selections)
             )
-            ignored_tags = Tag.objects.filter(
-                user_selections__user = request_user,
-                user_selections__reason = 'bad',
-                language_code=lang
-            )
-            subscribed_tags = Tag.objects.none()
-            if askbot_settings.SUBSCRIBED_TAG_SELECTOR_ENABLED:
-                subscribed_tags = Tag.objects.filter(
-                    user_selections__user = request_user,
-                    user_selections__reason = 'subscribed',
-                    language_code=lang
-                )
-                meta_data['subscribed_tag_names'] = [tag.name for tag in subscribed_tags]
-
-            meta_data['interesting_tag_names'] = [tag.name for tag in interesting_tags]
-            meta_data['ignored_tag_names'] = [tag.name for tag in ignored_tags]
 
             if request_user.display_tag_filter_strategy == const.INCLUDE_INTERESTING and (interesting_tags or request_user.has_interesting_wildcard_tags()):
                 #filter by interesting tags only
@@ -450,26 +610,14 @@ class ThreadManager(BaseQuerySetManager):
                 and subscribed_tags:
                 qs = qs.filter(tags__in = subscribed_tags)
 
-            if askbot_settings.USE_WILDCARD_TAGS:
-                meta_data['interesting_tag_names'].extend(request_user.interesting_tags.split())
-                meta_data['ignored_tag_names'].extend(request_user.ignored_tags.split())
-
-        QUESTION_ORDER_BY_MAP = {
-            'age-desc': '-added_at',
-            'age-asc': 'added_at',
-            'activity-desc': '-last_activity_at',
-            'activity-asc': 'last_activity_at',
-            'answers-desc': '-answer_count',
-            'answers-asc': 'answer_count',
-            'votes-desc': '-points',
-            'votes-asc': 'points',
-
-            'relevance-desc': '-relevance', # special Postgresql-specific ordering, 'relevance' quaso-column is added by get_for_query()
-        }
-
         orderby = QUESTION_ORDER_BY_MAP[search_state.sort]
+        keyset_ordering = self.get_keyset_ordering(search_state)
+        meta_data['keyset_ordering'] = keyset_ordering
 
-        if not (
+        if keyset_ordering:
+            #thread id breaks ties in the sort column
+            qs = qs.extra(order_by=list(keyset_ordering))
+        elif not (
             getattr(django_settings, 'ENABLE_HAYSTACK_SEARCH', False) \
             and orderby=='-relevance'
         ):
@@ -484,12 +632,96 @@ class ThreadManager(BaseQuerySetManager):
         # qs = qs.extra(select={'ordering_key': orderby.lstrip('-')}, order_by=['-ordering_key' if orderby.startswith('-') else 'ordering_key'])
         # qs = qs.distinct()
 
-        qs = qs.only('id', 'title', 'view_count', 'answer_count', 'last_activity_at', 'last_activity_by', 'closed', 'tagnames', 'accepted_answer')
+        qs = qs.only(*THREAD_LIST_FIELDS)
 
         #print qs.query
 
         return qs.distinct(), meta_data
 
+    def get_keyset_ordering(self, search_state):
+        """returns ordering of threads usable for the keyset
+        pagination: the sort field and the thread id as a tie breaker,
+        or None, if the sort method does not allow that
+        """
+        orderby = QUESTION_ORDER_BY_MAP[search_state.sort]
+        if orderby.lstrip('-') == 'relevance':
+            return None
+        if orderby.startswith('-'):
+            return (orderby, '-id')
+        return (orderby, 'id')
+
+    def get_tag_selections(self, user):
+        """returns a tuple of query sets of tags
+        marked by the user in the current language:
+        interesting, ignored and subscribed
+        """
+        lang = get_language()
+        interesting_tags = Tag.objects.filter(
+            user_selections__user=user,
+            user_selections__reason='good',
+            language_code=lang
+        )
+        ignored_tags = Tag.objects.filter(
+            user_selections__user = user,
+            user_selections__reason = 'bad',
+            language_code=lang
+        )
+        subscribed_tags = Tag.objects.none()
+        if askbot_settings.SUBSCRIBED_TAG_SELECTOR_ENABLED:
+            subscribed_tags = Tag.objects.filter(
+                user_selections__user = user,
+                user_selections__reason = 'subscribed',
+                language_code=lang
+            )
+        return interesting_tags, ignored_tags, subscribed_tags
+
+    def get_tag_selections_meta_data(self, user, tag_selections=None):
+        """returns dictionary with names of the tags
+        marked by the user, as used in the search meta data
+        ``tag_selections`` is a value returned by the
+        :meth:`get_tag_selections`
+        """
+        if tag_selections is None:
+            tag_selections = self.get_tag_selections(user)
+        interesting_tags, ignored_tags, subscribed_tags = tag_selections
+
+        meta_data = dict()
+        if askbot_settings.SUBSCRIBED_TAG_SELECTOR_ENABLED:
+            meta_data['subscribed_tag_names'] = [tag.name for tag in subscribed_tags]
+
+        meta_data['interesting_tag_names'] = [tag.name for tag in interesting_tags]
+        meta_data['ignored_tag_names'] = [tag.name for tag in ignored_tags]
+
+        if askbot_settings.USE_WILDCARD_TAGS:
+            meta_data['interesting_tag_names'].extend(user.interesting_tags.split())
+            meta_data['ignored_tag_names'].extend(user.ignored_tags.split())
+        return meta_data
+
+    def fill_question_posts(self, batch_size=1000):
+        """sets the denormalized question post of the threads
+        where it is missing, with one query per ``batch_size``
+        consecutive thread ids"""
+        from askbot.models.post import Post
+        quote = connection.ops.quote_name
+        sql = 'UPDATE %(thread)s SET %(question_post_id)s = (' \
+                'SELECT MIN(%(post)s.%(id)s) FROM %(post)s ' \
+                'WHERE %(post)s.%(thread_id)s = %(thread)s.%(id)s ' \
+                'AND %(post)s.%(post_type)s = %%s' \
+            ') WHERE %(question_post_id)s IS NULL ' \
+            'AND %(thread)s.%(id)s > %%s AND %(thread)s.%(id)s <= %%s' % {
+                'thread': quote(self.model._meta.db_table),
+                'post': quote(Post._meta.db_table),
+                'question_post_id': quote('question_post_id'),
+                'thread_id': quote('thread_id'),
+                'post_type': quote('post_type'),
+                'id': quote('id')
+            }
+        max_id = self.aggregate(max_id=models.Max('id'))['max_id'] or 0
+        cursor = connection.cursor()
+        for start in range(0, max_id, batch_size):
+            cursor.execute(sql, ['question', start, start + batch_size])
+            transaction.commit_unless_managed()
+
     def precache_view_data_hack(self, threads):
         # TODO: Re-enable this when we have a good test cases to verify that it works properly.
         #
@@ -498,10 +730,13 @@ class ThreadManager(BaseQuerySetManager):
         # Precache data only for non-cached threads - only those will be rendered
         #threads = [thread for thread in threads if not thread.summary_html_cached()]
 
-        thread_ids = [obj.id for obj in threads]
+        question_ids = [obj.question_post_id for obj in threads if obj.question_post_id]
+        #threads without the denormalized question post id
+        thread_ids = [obj.id for obj in threads if not obj.question_post_id]
         from askbot.models.post import Post
         page_questions = Post.objects.filter(
-            post_type='question', thread__id__in = thread_ids
+            models.Q(id__in=question_ids) |
+            models.Q(post_type='question', thread__id__in=thread_ids)
         ).only(# pick only the used fields
             'id', 'thread', 'points', 'is_anonymous',
             'summary', 'post_type', 'deleted'
@@ -520,6 +755,89 @@ class ThreadManager(BaseQuerySetManager):
         for thread in threads:
             thread._last_activity_by_cache = user_map[thread.last_activity_by_id]
 
+        self.precache_cache_generations(threads)
+
+    def get_summaries_html(self, threads, search_state=None, visitor=None):
+        """returns list of the summary html snippets of the threads,
+        cached snippets are read with one cache query, the missing ones
+        are rendered with the question posts and the users preloaded by
+        :meth:`precache_view_data_hack` and stored in the cache at once
+        """
+        threads = list(threads)
+        if askbot_settings.GROUPS_ENABLED:
+            #summaries are not cached when the groups are enabled
+            return [
+                thread.get_summary_html(search_state=search_state, visitor=visitor) \
+                for thread in threads
+            ]
+
+        threads_without_generation = [
+            thread for thread in threads \
+                if getattr(thread, '_cache_generation', None) is None
+        ]
+        if threads_without_generation:
+            self.precache_cache_generations(threads_without_generation)
+
+        keys = [thread.get_summary_cache_key() for thread in threads]
+        cached_segments = cache.cache.get_many(keys)
+
+        template = None
+        tag_url_formatter = get_tag_url_formatter(search_state)
+        rendered_segments = dict()
+        summaries = list()
+        for thread, key in zip(threads, keys):
+            segments = cached_segments.get(key)
+            if segments is None:
+                if template is None:
+                    template = get_template('widgets/question_summary.html')
+                html = thread.render_summary_html(
+                                        visitor=visitor,
+                                        question=thread._question_post(),
+                                        template=template
+                                    )
+                segments = split_summary_html(html)
+                rendered_segments[key] = segments
+            else:
+                segments = get_summary_segments(segments)
+            summaries.append(join_summary_segments(segments, tag_url_formatter))
+
+        if rendered_segments:
+            cache.cache.set_many(rendered_segments, const.LONG_TIME)
+        increment_cache_counter(SUMMARY_CACHE_HITS_KEY, len(threads) - len(rendered_segments))
+        increment_cache_counter(SUMMARY_CACHE_MISSES_KEY, len(rendered_segments))
+        return summaries
+
+    def get_summary_cache_stats(self):
+        """returns dictionary with the numbers of summaries
+        found in the cache ("hits") and rendered ("misses")
+        by the :meth:`get_summaries_html`"""
+        counts = cache.cache.get_many(
+                            (SUMMARY_CACHE_HITS_KEY, SUMMARY_CACHE_MISSES_KEY)
+                        )
+        return {
+            'hits': counts.get(SUMMARY_CACHE_HITS_KEY, 0),
+            'misses': counts.get(SUMMARY_CACHE_MISSES_KEY, 0)
+        }
+
+    def precache_cache_generations(self, threads):
+        """loads cache generation numbers of the threads
+        with one cache query, so that the cache keys of all the
+        thread fragments on the page are known without more queries
+        """
+        keys = dict(
+            [(Thread.CACHE_GENERATION_KEY_TPL % thread.id, thread) for thread in threads]
+        )
+        generations = cache.cache.get_many(keys.keys())
+        for key, thread in keys.items():
+            generation = generations.get(key)
+            if generation is None:
+                generation = thread.get_cache_generation()
+            thread._cache_generation = generation
+
+    def invalidate_user_votes(self, thread_id, user_id):
+        """deletes the cached votes of the user
+        on the posts of the thread, see :meth:`Thread.get_user_votes`"""
+        cache.cache.delete(Thread.USER_VOTES_KEY_TPL % (thread_id, user_id))
 
     #todo: this function is similar to get_response_receivers - profile this function against the other one
     def get_thread_contributors(self, thread_list):
@@ -579,9 +897,350 @@ class ThreadToGroup(models.Model):
         app_label = 'askbot'
 
 
+class ThreadListingManager(BaseQuerySetManager):
+    """manager of the denormalized question list,
+    the records are kept in sync with the threads
+    by the signal handlers in the :mod:`askbot.models`
+    """
+    def is_enabled(self):
+        return getattr(django_settings, 'ASKBOT_THREAD_LISTING_ENABLED', False)
+
+    def update_for_thread(self, thread):
+        """creates, updates or deletes the listing record
+        so that it matches the current state of the ``thread``
+        """
+        if thread.deleted:
+            self.filter(thread__id=thread.id).delete()
+            return None
+
+        listing = self.model(
+            thread_id=thread.id,
+            language_code=thread.language_code,
+            answer_count=thread.answer_count,
+            points=thread.points,
+            last_activity_at=thread.last_activity_at,
+            added_at=thread.added_at,
+            closed=thread.closed,
+            approved=thread.approved,
+            has_accepted_answer=thread.has_accepted_answer(),
+            tag_ids=self.model.pack_tag_ids(
+                        thread.tags.values_list('id', flat=True)
+                    )
+        )
+        listing.save()
+        return listing
+
+    def can_run_search(self, request_user, search_state):
+        """True, if results for the search state
+        can be obtained from the listing table alone
+        """
+        if self.is_enabled() == False:
+            return False
+        if askbot_settings.GROUPS_ENABLED:
+            #thread visibility is not denormalized
+            return False
+        if search_state.stripped_query or search_state.query_title \
+            or search_state.query_users or search_state.author:
+            return False
+        if search_state.sort not in self.model.ORDER_BY_MAP:
+            return False
+        if search_state.scope == 'unanswered':
+            meaning = askbot_settings.UNANSWERED_QUESTION_MEANING
+            if meaning not in ('NO_ANSWERS', 'NO_ACCEPTED_ANSWERS'):
+                return False
+        elif search_state.scope != 'all':
+            return False
+        if request_user and request_user.is_authenticated():
+            #tag filters of the users are not supported here
+            strategy = request_user.display_tag_filter_strategy
+            return strategy == const.INCLUDE_ALL
+        return True
+
+    def run_search(self, request_user, search_state):
+        """same as :meth:`ThreadManager.run_advanced_search`,
+        but works only on the search states accepted by
+        the :meth:`can_run_search`.
+        Returns a sequence of threads (not a query set!)
+        and the search meta data
+        """
+        meta_data = {'non_existing_tags': list()}
+        qs = self.all()
+
+        if getattr(django_settings, 'ASKBOT_MULTILINGUAL', False):
+            qs = qs.filter(language_code=get_language())
+
+        if askbot_settings.CONTENT_MODERATION_MODE == 'premoderation':
+            qs = qs.filter(approved=True)
+
+        tags = search_state.unified_tags()
+        if len(tags) > 0:
+            tags, meta_data['non_existing_tags'] = \
+                            Thread.objects.get_search_tag_names(tags)
+            tag_ids = dict()
+            for tag_id, tag_name in Tag.objects.filter(
+                                name__in=tags
+                            ).values_list('id', 'name'):
+                tag_ids.setdefault(tag_name, list()).append(tag_id)
+
+            if len(tag_ids) < len(set(tags)):
+                qs = qs.none()
+            else:
+                #tags with the same name may exist in different languages
+                for ids in tag_ids.values():
+                    tag_filter = models.Q()
+                    for tag_id in ids:
+                        packed_id = self.model.pack_tag_ids([tag_id])
+                        tag_filter |= models.Q(tag_ids__contains=packed_id)
+                    qs = qs.filter(tag_filter)
+
+        if search_state.scope == 'unanswered':
+            qs = qs.filter(closed=False)
+            if askbot_settings.UNANSWERED_QUESTION_MEANING == 'NO_ANSWERS':
+                qs = qs.filter(answer_count=0)
+            else:
+                qs = qs.filter(has_accepted_answer=False)
+
+        if request_user and request_user.is_authenticated():
+            meta_data.update(
+                Thread.objects.get_tag_selections_meta_data(request_user)
+            )
+
+        ordering = self.model.ORDER_BY_MAP[search_state.sort]
+        meta_data['keyset_ordering'] = ordering
+        qs = qs.order_by(*ordering)
+        return ThreadListingSearchResults(qs), meta_data
+
+
+class ThreadListingSearchResults(object):
+    """ordered sequence of threads that are selected
+    via the :class:`ThreadListing` table.
+
+    Supports ``count()``, ``len()``, iteration, slicing,
+    ``filter()`` and ``order_by()``, which is sufficient
+    for the paginators, thread objects
+    are loaded with a single ``in_bulk`` call per slice.
+    """
+    def __init__(self, listing_qs):
+        self.listing_qs = listing_qs
+        self.model = listing_qs.model
+        self._count = None
+
+    def filter(self, *args, **kwargs):
+        """filters by the fields of :class:`ThreadListing`"""
+        return self.__class__(self.listing_qs.filter(*args, **kwargs))
+
+    def order_by(self, *fields):
+        return self.__class__(self.listing_qs.order_by(*fields))
+
+    def count(self):
+        if self._count is None:
+            self._count = self.listing_qs.count()
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, key):
+        thread_ids = self.listing_qs.values_list('thread', flat=True)
+        if isinstance(key, slice):
+            return self.get_threads(list(thread_ids[key]))
+        threads = self.get_threads(list(thread_ids[key:key + 1]))
+        if len(threads) == 0:
+            raise IndexError('thread list index out of range')
+        return threads[0]
+
+    def get_threads(self, thread_ids):
+        """returns list of threads in the order of ``thread_ids``"""
+        thread_map = Thread.objects.only(*THREAD_LIST_FIELDS).in_bulk(thread_ids)
+        return [thread_map[thread_id] for thread_id in thread_ids if thread_id in thread_map]
+
+
+class ThreadListing(models.Model):
+    """Denormalized record per visible thread, used
+    to run the question list queries without joins.
+
+    Tags are packed into a string of space separated ids,
+    with spaces at both ends, e.g. " 12 31 5 ",
+    so that tag filters are substring matches.
+    """
+    ORDER_BY_MAP = {
+        'age-desc': ('-added_at', '-thread'),
+        'age-asc': ('added_at', 'thread'),
+        'activity-desc': ('-last_activity_at', '-thread'),
+        'activity-asc': ('last_activity_at', 'thread'),
+        'answers-desc': ('-answer_count', '-thread'),
+        'answers-asc': ('answer_count', 'thread'),
+        'votes-desc': ('-points', '-thread'),
+        'votes-asc': ('points', 'thread'),
+    }
+
+    thread = models.OneToOneField('Thread', primary_key=True, related_name='listing')
+    language_code = models.CharField(max_length=16, db_index=True)
+    answer_count = models.PositiveIntegerField(default=0, db_index=True)
+    points = models.IntegerField(default=0, db_index=True)
+    last_activity_at = models.DateTimeField(db_index=True)
+    added_at = models.DateTimeField(db_index=True)
+    closed = models.BooleanField(default=False)
+    approved = models.BooleanField(default=True)
+    has_accepted_answer = models.BooleanField(default=False)
+    tag_ids = models.TextField(default=' ')
+
+    objects = ThreadListingManager()
+
+    class Meta:
+        app_label = 'askbot'
+
+    @classmethod
+    def pack_tag_ids(cls, tag_ids):
+        return ' ' + ''.join(['%d ' % tag_id for tag_id in tag_ids])
+
+    def get_tag_ids(self):
+        return [int(tag_id) for tag_id in self.tag_ids.split()]
+
+
+class SimilarThreadManager(BaseQuerySetManager):
+    """manager of the precomputed lists of similar threads"""
+
+    def is_enabled(self):
+        return getattr(
+                    django_settings,
+                    'ASKBOT_SIMILAR_THREADS_INDEX_ENABLED',
+                    False
+                )
+
+    def get_excluded_thread_ids(self):
+        """ids of threads that must not appear
+        in the lists of similar threads"""
+        deleted_threads = Thread.objects.filter(deleted=True)
+        return set(deleted_threads.values_list('id', flat=True))
+
+    def compute_for_thread(self, thread_id, index, excluded_ids=None):
+        """returns list of unsaved records of similar threads"""
+        similar_threads = index.get_similar_threads(
+                            thread_id,
+                            count=self.model.MAX_SIMILAR_THREADS,
+                            excluded_ids=excluded_ids,
+                            max_postings=self.model.MAX_POSTINGS_PER_TAG
+                        )
+        return [
+            self.model(
+                thread_id=thread_id,
+                similar_thread_id=similar_thread_id,
+                similarity=similarity
+            ) for similar_thread_id, similarity in similar_threads
+        ]
+
+    def update_for_thread(self, thread_id, index=None, excluded_ids=None):
+        """recalculates the list of similar threads
+        for the thread with id ``thread_id``"""
+        if index is None:
+            index = tag_index.shared_index.get()
+        if excluded_ids is None:
+            excluded_ids = self.get_excluded_thread_ids()
+        self.filter(thread__id=thread_id).delete()
+        if thread_id not in excluded_ids:
+            records = self.compute_for_thread(thread_id, index, excluded_ids)
+            self.bulk_create(records)
+        cache.cache.delete(Thread(id=thread_id).get_similar_threads_cache_key())
+
+    def update_for_retagged_thread(self, thread_id):
+        """recalculates lists of the thread and of those threads
+        whose lists may change because of the new tags of the thread
+        """
+        index = tag_index.shared_index.get()
+        excluded_ids = self.get_excluded_thread_ids()
+        self.update_for_thread(thread_id, index, excluded_ids)
+        affected_ids = set(
+            self.filter(
+                similar_thread__id=thread_id
+            ).values_list('thread', flat=True)
+        )
+        affected_ids.update(
+            self.filter(
+                thread__id=thread_id
+            ).values_list('similar_thread', flat=True)
+        )
+        for affected_id in affected_ids:
+            self.update_for_thread(affected_id, index, excluded_ids)
+
+    def get_similar_threads(self, thread):
+        """returns list of the visible similar threads,
+        the most similar first, with a single query"""
+        records = self.filter(
+                        thread=thread,
+                        similar_thread__deleted=False
+                    ).select_related(
+                        'similar_thread'
+                    ).order_by('-similarity', '-similar_thread')
+        return [record.similar_thread for record in records]
+
+
+class SimilarThread(models.Model):
+    """Precomputed list of similar threads, as measured
+    by the Jaccard index of the sets of tags,
+    built by the command ``build_similar_threads``
+    """
+    MAX_SIMILAR_THREADS = 10
+    MAX_POSTINGS_PER_TAG = 1000
+
+    thread = models.ForeignKey('Thread', related_name='similar_thread_records')
+    similar_thread = models.ForeignKey('Thread', related_name='+')
+    similarity = models.FloatField(default=0)
+
+    objects = SimilarThreadManager()
+
+    class Meta:
+        app_label = 'askbot'
+
+
+class ThreadSearchDocument(models.Model):
+    """length (in terms) of the indexed text of the thread,
+    used by the local full text search, see
+    :mod:`askbot.search.local_search`
+    """
+    thread = models.OneToOneField('Thread', primary_key=True, related_name='search_document')
+    length = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        app_label = 'askbot'
+
+
+class ThreadSearchPosting(models.Model):
+    """number of occurences of the term in the
+    indexed text of the thread, used by the
+    local full text search"""
+    term = models.CharField(max_length=64)
+    thread = models.ForeignKey('Thread', related_name='search_postings')
+    frequency = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        app_label = 'askbot'
+        unique_together = ('term', 'thread')
+
+
+class ThreadSummaryUpdate(models.Model):
+    """thread whose cached summary html is to be rendered
+    again in the background, see :mod:`askbot.utils.summary_warmer`"""
+    thread = models.OneToOneField(
+                        'Thread',
+                        related_name='summary_update',
+                        primary_key=True
+                    )
+    marked_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        app_label = 'askbot'
+
+
 class Thread(models.Model):
-    SUMMARY_CACHE_KEY_TPL = 'thread-question-summary-%d-%s'
+    SUMMARY_CACHE_KEY_TPL = 'thread-question-summary-%d-%s-%s'
+    SIMILAR_THREADS_CACHE_KEY_TPL = 'similar-threads-%s-%s'
     ANSWER_LIST_KEY_TPL = 'thread-answer-list-%d'
+    CACHE_GENERATION_KEY_TPL = 'thread-cache-generation-%d'
+    USER_VOTES_KEY_TPL = 'thread-user-votes-%d-%d'
 
     title = models.CharField(max_length=300)
 
@@ -623,6 +1282,11 @@ class Thread(models.Model):
 
     accepted_answer = models.ForeignKey('Post', null=True, blank=True, related_name='+')
     answer_accepted_at = models.DateTimeField(null=True, blank=True)
+    #denormalized, use ._question_post() to read it
+    question_post = models.ForeignKey(
+                            'Post', null=True, blank=True,
+                            related_name='+', on_delete=models.SET_NULL
+                        )
     added_at = models.DateTimeField(auto_now_add=True)
 
     #db_column will be removed later
@@ -643,14 +1307,29 @@ class Thread(models.Model):
             self.points = int(number)
 
     def _question_post(self, refresh=False):
-        if refresh and hasattr(self, '_question_cache'):
-            delattr(self, '_question_cache')
+        if refresh:
+            for attr in ('_question_cache', '_question_post_cache'):
+                if hasattr(self, attr):
+                    delattr(self, attr)
         post = getattr(self, '_question_cache', None)
         if post:
             return post
-        from askbot.models.post import Post
-        self._question_cache = Post.objects.get(post_type='question', thread=self)
-        return self._question_cache
+        if self.question_post_id:
+            #no query, if loaded with select_related
+            post = self.question_post
+        else:
+            #threads created before the question_post field
+            #was added, see command fix_thread_question_posts
+            from askbot.models.post import Post
+            post = Post.objects.get(post_type='question', thread=self)
+        if not hasattr(post, '_thread_cache'):
+            post._thread_cache = self
+        self._question_cache = post
+        return post
+
+    def get_question_post_id(self):
+        """returns id of the question post, without loading it"""
+        return self.question_post_id or self._question_post().id
 
     def apply_hinted_tags(self, hints=None, user=None, timestamp=None, silent=False):
         """match words in title and body with hints
@@ -711,9 +1390,19 @@ class Thread(models.Model):
 
 
     def get_absolute_url(self):
-        return self._question_post().get_absolute_url(thread = self)
-        #question_id = self._question_post().id
-        #return reverse('question', args = [question_id]) + slugify(self.title)
+        if hasattr(self, '_question_cache') or not self.question_post_id:
+            return self._question_post().get_absolute_url(thread = self)
+
+        #same as the url of the question post, built without loading it
+        is_multilingual = getattr(django_settings, 'ASKBOT_MULTILINGUAL', False)
+        if is_multilingual:
+            request_language = get_language()
+            activate_language(self.language_code)
+        url = reverse('question', args = [self.question_post_id])
+        url += django_urlquote(slugify(self.title)) + '/'
+        if is_multilingual:
+            activate_language(request_language)
+        return url
 
     def get_answer_count(self, user = None):
         """returns answer count depending on who the user is.
@@ -822,7 +1511,7 @@ class Thread(models.Model):
         qset.update(view_count=models.F('view_count') + increment)
         self.view_count = qset.values('view_count')[0]['view_count'] # get the new view_count back because other pieces of code relies on such behaviour
         ####################################################################
-        self.update_summary_html() # regenerate question/thread summary html
+        self.refresh_summary_html() # regenerate question/thread summary html
         ####################################################################
 
     def set_closed_status(self, closed, closed_by, closed_at, close_reason):
@@ -904,7 +1593,7 @@ class Thread(models.Model):
         self.last_activity_by = last_activity_by
         self.save()
         ####################################################################
-        self.update_summary_html() # regenerate question/thread summary html
+        self.refresh_summary_html() # regenerate question/thread summary html
         ####################################################################
 
     def get_last_activity_info(self):
@@ -1033,24 +1722,125 @@ class Thread(models.Model):
             #            )
 
     def invalidate_cached_thread_content_fragment(self):
-        cache.cache.delete(self.SUMMARY_CACHE_KEY_TPL % (self.id, get_language()))
+        self.bump_cache_generation()
+
+    def get_summary_cache_key(self):
+        return self.SUMMARY_CACHE_KEY_TPL % (
+                    self.id, self.get_cache_generation(), get_language()
+                )
+
+    def get_similar_threads_cache_key(self):
+        return self.SIMILAR_THREADS_CACHE_KEY_TPL % (
+                    self.id, self.get_cache_generation()
+                )
+
+    def get_cache_generation(self):
+        """returns number, which is part of the cache keys
+        of the thread data, changing the number
+        invalidates all these keys at once"""
+        generation = getattr(self, '_cache_generation', None)
+        if generation is not None:
+            #preloaded with ThreadManager.precache_cache_generations
+            return generation
+        key = self.CACHE_GENERATION_KEY_TPL % self.id
+        generation = cache.cache.get(key)
+        if generation is None:
+            #start from the current time, so that the
+            #numbers are not reused when the key is evicted
+            generation = int(time.time())
+            cache.cache.add(key, generation, const.LONG_TIME)
+        return generation
+
+    def bump_cache_generation(self):
+        self._cache_generation = None
+        key = self.CACHE_GENERATION_KEY_TPL % self.id
+        try:
+            cache.cache.incr(key)
+        except ValueError:
+            cache.cache.set(key, int(time.time()), const.LONG_TIME)
+
+    def get_user_votes(self, user):
+        """returns dictionary post id -> vote (1 or -1)
+        with the votes of the user on the posts of the thread.
+
+        The votes are cached as an array of the post ids
+        with the sign of the vote, until the user votes
+        in the thread again.
+        """
+        from askbot.models.repute import Vote
+        key = self.USER_VOTES_KEY_TPL % (self.id, user.id)
+        packed_votes = cache.cache.get(key)
+        if packed_votes is None:
+            votes = Vote.objects.filter(
+                            user=user, voted_post__thread=self
+                        ).values_list('voted_post_id', 'vote')
+            packed_votes = array.array(
+                        'i', [post_id * vote for post_id, vote in votes]
+                    ).tostring()
+            cache.cache.set(key, packed_votes, const.LONG_TIME)
+
+        signed_ids = array.array('i')
+        signed_ids.fromstring(packed_votes)
+        return dict([(abs(signed_id), cmp(signed_id, 0)) for signed_id in signed_ids])
+
+    def get_post_data_visibility_key(self, user=None):
+        """returns string identifying posts of the thread
+        visible to the user when groups are enabled,
+        users with the same key see the same post data.
+
+        Only the groups with which posts of this thread are shared
+        are counted, so that e.g. personal groups of the users
+        who did not post in the thread do not matter
+        """
+        if user is None or user.is_anonymous():
+            user_group_ids = (Group.objects.get_global_group().id,)
+        else:
+            user_group_ids = user.get_groups().values_list('id', flat=True)
 
-    def get_post_data_cache_key(self, sort_method = None):
-        return 'thread-data-%s-%s' % (self.id, sort_method)
+        from askbot.models.post import PostToGroup
+        thread_group_ids = PostToGroup.objects.filter(
+                                        post__thread=self
+                                    ).values_list('group_id', flat=True)
+        group_ids = set(thread_group_ids) & set(user_group_ids)
+        group_ids = ','.join([str(group_id) for group_id in sorted(group_ids)])
+        key = md5_constructor(group_ids).hexdigest()
+
+        #the enquirer of the moderated thread sees
+        #the answers in a different order
+        if user and user.is_authenticated() and self.is_moderated():
+            if self._question_post().author_id == user.id:
+                key += '-enquirer'
+        return key
+
+    def get_post_data_cache_key(self, sort_method=None, visibility_key=None):
+        return 'thread-data-%s-%s-%s-%s' % (
+                    self.id, self.get_cache_generation(),
+                    sort_method, visibility_key
+                )
 
     def invalidate_cached_post_data(self):
         """needs to be called when anything notable
         changes in the post data - on votes, adding,
         deleting, editing content"""
-        #we can call delete_many() here if using Django > 1.2
-        sort_methods = map(lambda v: v[0], const.ANSWER_SORT_METHODS)
-        for sort_method in sort_methods:
-            cache.cache.delete(self.get_post_data_cache_key(sort_method))
+        #post data of all sort methods and all group visibility
+        #variants, summaries and the similar threads
+        #are invalidated by the change of the cache generation
+        self.bump_cache_generation()
 
     def invalidate_cached_data(self, lazy=False):
-        self.invalidate_cached_post_data()
-        if lazy:
-            self.invalidate_cached_thread_content_fragment()
+        """invalidates all cached data of the thread,
+        unless ``lazy`` is ``True``, summary html is rendered again"""
+        self.bump_cache_generation()
+        if not lazy:
+            self.refresh_summary_html()
+
+    def refresh_summary_html(self):
+        """renders the summary html again, or if the summary warmer
+        is enabled - marks the thread for the warmer, then until the
+        warmer runs the pages show the old summary, if it is still valid
+        """
+        if summary_warmer.is_enabled():
+            summary_warmer.mark_dirty([self.id])
         else:
             self.update_summary_html()
 
@@ -1155,8 +1945,16 @@ class Thread(models.Model):
         sort_method = sort_method or askbot_settings.DEFAULT_ANSWER_SORT_METHOD
 
         if askbot_settings.GROUPS_ENABLED:
-            #temporary plug: bypass cache where groups are enabled
-            return self.get_post_data(sort_method=sort_method, user=user)
+            #users sharing the same relevant group memberships
+            #share the cached post data
+            visibility_key = self.get_post_data_visibility_key(user)
+            key = self.get_post_data_cache_key(sort_method, visibility_key)
+            post_data = cache.cache.get(key)
+            if not post_data:
+                post_data = self.get_post_data(sort_method=sort_method, user=user)
+                cache.cache.set(key, post_data, const.LONG_TIME)
+            return post_data
+
         key = self.get_post_data_cache_key(sort_method)
         post_data = cache.cache.get(key)
         if not post_data:
@@ -1263,7 +2061,7 @@ class Thread(models.Model):
                                         *order_by
                                     ).values_list('id', flat=True)
 
-            published_answer_ids = reversed(published_answer_ids)
+            published_answer_ids = list(reversed(published_answer_ids))
             #now put those answers first
             answer_map = dict([(answer.id, answer) for answer in answers])
             for answer_id in published_answer_ids:
@@ -1301,46 +2099,50 @@ class Thread(models.Model):
         """
 
         def get_data():
-            # todo: code in this function would be simpler if
-            # we had question post id denormalized on the thread
-            tags_list = self.get_tag_names()
-            similar_threads = Thread.objects.filter(
-                                        tags__name__in=tags_list,
-                                        language_code=self.language_code
-                                    ).exclude(
-                                        id = self.id
-                                    ).exclude(
-                                        posts__post_type='question',
-                                        posts__deleted = True
-                                    ).distinct()[:100]
-            similar_threads = list(similar_threads)
-
-            for thread in similar_threads:
-                thread.similarity = self.get_similarity(other_thread=thread)
-
-            similar_threads.sort(key=operator.attrgetter('similarity'), reverse=True)
-            similar_threads = similar_threads[:10]
-
-            # Denormalize questions to speed up template rendering
-            # todo: just denormalize question_post_id on the thread!
-            thread_map = dict([(thread.id, thread) for thread in similar_threads])
-            from askbot.models.post import Post
-            questions = Post.objects.get_questions()
-            questions = questions.select_related('thread').filter(thread__in=similar_threads)
-            for q in questions:
-                thread_map[q.thread_id].question_denorm = q
+            if SimilarThread.objects.is_enabled():
+                similar_threads = SimilarThread.objects.get_similar_threads(self)
+            else:
+                tags_list = self.get_tag_names()
+                similar_threads = Thread.objects.filter(
+                                            tags__name__in=tags_list,
+                                            language_code=self.language_code
+                                        ).exclude(
+                                            id = self.id
+                                        ).exclude(
+                                            posts__post_type='question',
+                                            posts__deleted = True
+                                        ).distinct()[:100]
+                similar_threads = list(similar_threads)
+
+                for thread in similar_threads:
+                    thread.similarity = self.get_similarity(other_thread=thread)
+
+                similar_threads.sort(key=operator.attrgetter('similarity'), reverse=True)
+                similar_threads = similar_threads[:10]
+
+            # urls are built from the denormalized question post ids,
+            # questions are loaded only for the threads without them
+            thread_map = dict([
+                (thread.id, thread) for thread in similar_threads \
+                    if not thread.question_post_id
+            ])
+            if thread_map:
+                from askbot.models.post import Post
+                questions = Post.objects.get_questions()
+                questions = questions.filter(thread__id__in=thread_map.keys())
+                for q in questions:
+                    thread_map[q.thread_id]._question_cache = q
 
             # Postprocess data for the final output
             result = list()
             for thread in similar_threads:
-                question_post = getattr(thread, 'question_denorm', None)
                 # unfortunately the if statement below is necessary due to
                 # a possible bug
                 # all this proves that it's wrong to reference threads by
                 # the question post id in the question page urls!!!
                 # this is a "legacy" problem inherited from the old models
-                if question_post:
-                    url = question_post.get_absolute_url()
+                if thread.question_post_id or hasattr(thread, '_question_cache'):
+                    url = thread.get_absolute_url()
                     title = thread.get_title()
                     result.append({'url': url, 'title': title})
 
@@ -1350,7 +2152,7 @@ class Thread(models.Model):
             """similar thread data will expire
             with the default expiration delay
             """
-            key = 'similar-threads-%s' % self.id
+            key = self.get_similar_threads_cache_key()
             data = cache.cache.get(key)
             if data is None:
                 data = get_data()
@@ -1408,6 +2210,8 @@ class Thread(models.Model):
                         post__id__in=post_ids,
                         tag__id__in=group_ids
                     ).delete()
+        if askbot_settings.GROUPS_ENABLED:
+            self.invalidate_cached_post_data()
 
     def add_to_groups(
         self, groups, visibility=ThreadToGroup.SHOW_ALL_RESPONSES, recursive=False
@@ -1596,7 +2400,7 @@ class Thread(models.Model):
             #2) todo: notify moderators about newly suggested tags
 
         ####################################################################
-        self.update_summary_html() # regenerate question/thread summary html
+        self.refresh_summary_html() # regenerate question/thread summary html
         ####################################################################
         #if there are any modified tags, update their use counts
         modified_tags = set(modified_tags)
@@ -1685,82 +2489,162 @@ class Thread(models.Model):
         return last_updated_at, last_updated_by
 
     def get_summary_html(self, search_state=None, visitor = None):
-        html = self.get_cached_summary_html(visitor)
-        if not html:
-            html = self.update_summary_html(visitor)
-
-        # todo: this work may be pushed onto javascript we post-process tag names
-        # in the snippet so that tag urls match the search state
-        # use `<<<` and `>>>` because they cannot be confused with user input
-        # - if user accidentialy types <<<tag-name>>> into question title or body,
-        # then in html it'll become escaped like this: &lt;&lt;&lt;tag-name&gt;&gt;&gt;
-        regex = re.compile(
-            r'<<<(%s)>>>' % const.TAG_REGEX_BARE,
-            re.UNICODE
-        )
-
-        if search_state is None:
-            search_state = DummySearchState()
-
-        while True:
-            match = regex.search(html)
-            if not match:
-                break
-            seq = match.group(0)  # e.g "<<<my-tag>>>"
-            tag = match.group(1)  # e.g "my-tag"
-            full_url = search_state.add_tag(tag).full_url()
-            html = html.replace(seq, full_url)
-
-        return html
-
-    def get_cached_summary_html(self, visitor = None):
+        segments = self.get_cached_summary_segments(visitor)
+        if not segments:
+            segments = split_summary_html(self.update_summary_html(visitor))
+        return join_summary_segments(segments, get_tag_url_formatter(search_state))
+
+    def get_cached_summary_segments(self, visitor = None):
+        """returns cached summary as the list made
+        by the :func:`split_summary_html` or ``None``"""
         #todo: remove this plug by adding cached foreign user group
         #parameter to the key. Now with groups on caching is turned off
         #parameter visitor is there to get summary out by the user groups
         if askbot_settings.GROUPS_ENABLED:
             return None
-        return cache.cache.get(self.SUMMARY_CACHE_KEY_TPL % (self.id, get_language()))
+        segments = cache.cache.get(self.get_summary_cache_key())
+        if segments is None:
+            return None
+        return get_summary_segments(segments)
 
-    def update_summary_html(self, visitor = None):
+    def get_cached_summary_html(self, visitor = None):
+        """returns cached summary html with the tag placeholders"""
+        segments = self.get_cached_summary_segments(visitor)
+        if segments is None:
+            return None
+        return join_summary_segments(segments, DummySearchState().get_tag_url_formatter())
+
+    def render_summary_html(self, visitor=None, question=None, template=None):
+        """renders summary html, without putting it into the cache"""
         #todo: it is quite wrong that visitor is an argument here
         #because we do not include any visitor-related info in the cache key
         #ideally cache should be shareable between users, so straight up
         #using the user id for cache is wrong, we could use group
         #memberships, but in that case we'd need to be more careful with
         #cache invalidation
+        if question is None:
+            #fetch new question post to make sure we're up-to-date
+            question = self._question_post(refresh=True)
         context = {
             'thread': self,
-            #fetch new question post to make sure we're up-to-date
-            'question': self._question_post(refresh=True),
+            'question': question,
             'search_state': DummySearchState(),
             'visitor': visitor
         }
         from askbot.views.context import get_extra as get_extra_context
         context.update(get_extra_context('ASKBOT_QUESTION_SUMMARY_EXTRA_CONTEXT', None, context))
+        if template is None:
+            template = get_template('widgets/question_summary.html')
+        return template.render(context)
+
+    def update_summary_html(self, visitor = None):
         activate_language(self.language_code)
-        html = get_template('widgets/question_summary.html').render(context)
+        html = self.render_summary_html(visitor)
         # INFO: Timeout is set to 30 days:
         # * timeout=0/None is not a reliable cross-backend way to set infinite timeout
         # * We probably don't need to pollute the cache with threads older than 30 days
         # * Additionally, Memcached treats timeouts > 30day as dates (https://code.djangoproject.com/browser/django/tags/releases/1.3/django/core/cache/backends/memcached.py#L36),
         #   which probably doesn't break anything but if we can stick to 30 days then let's stick to it
         cache.cache.set(
-            self.SUMMARY_CACHE_KEY_TPL % (self.id, get_language()),
-            html,
+            self.get_summary_cache_key(),
+            split_summary_html(html),
             timeout=const.LONG_TIME
         )
         return html
 
     def summary_html_cached(self):
-        return cache.cache.has_key(self.SUMMARY_CACHE_KEY_TPL % (self.id, get_language()))
+        return cache.cache.has_key(self.get_summary_cache_key())
+
+class QuestionViewManager(BaseQuerySetManager):
+
+    #number of rows in one insert statement
+    BATCH_SIZE = 500
+
+    def supports_upsert(self):
+        engine = askbot.get_database_engine_name()
+        if 'sqlite' in engine:
+            #insert ... on conflict is available since sqlite 3.24
+            import sqlite3
+            return sqlite3.sqlite_version_info >= (3, 24, 0)
+        if 'mysql' in engine:
+            return True
+        if 'postgresql' in engine:
+            #insert ... on conflict is available since postgresql 9.5
+            return getattr(connection, 'pg_version', 0) >= 90500
+        return False
+
+    def record_views(self, views):
+        """saves views given as tuples (user id, question id, time),
+        keeping the latest time for each user and question,
+        with one query per ``BATCH_SIZE`` views where the database
+        supports the "upsert" statements"""
+        latest = dict()
+        for user_id, question_id, timestamp in views:
+            key = (user_id, question_id)
+            if key not in latest or latest[key] < timestamp:
+                latest[key] = timestamp
+        rows = [key + (timestamp,) for key, timestamp in latest.items()]
+
+        if self.supports_upsert():
+            for start in range(0, len(rows), self.BATCH_SIZE):
+                self.upsert_rows(rows[start:start + self.BATCH_SIZE])
+        else:
+            for row in rows:
+                self.save_row(*row)
+
+    def upsert_rows(self, rows):
+        if len(rows) == 0:
+            return
+        quote = connection.ops.quote_name
+        table = quote(self.model._meta.db_table)
+        when = quote('when')
+        sql = 'INSERT INTO %s (%s, %s, %s) VALUES ' % \
+                (table, quote('who_id'), quote('question_id'), when)
+        sql += ', '.join(['(%s, %s, %s)'] * len(rows))
+        if 'mysql' in askbot.get_database_engine_name():
+            sql += ' ON DUPLICATE KEY UPDATE %s = GREATEST(%s, VALUES(%s))' % \
+                    (when, when, when)
+        else:
+            sql += ' ON CONFLICT (%s, %s) DO UPDATE SET %s = excluded.%s ' \
+                    'WHERE %s.%s < excluded.%s' % (
+                        quote('question_id'), quote('who_id'), when, when,
+                        table, when, when
+                    )
+        params = list()
+        for row in rows:
+            params.extend(row)
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        transaction.commit_unless_managed()
+
+    def save_row(self, user_id, question_id, timestamp):
+        views = self.filter(who__id=user_id, question__id=question_id)
+        if views.filter(when__lt=timestamp).update(when=timestamp):
+            return
+        if views.exists():
+            #a later view is already recorded
+            return
+
+        savepoint_id = transaction.savepoint()
+        try:
+            self.create(who_id=user_id, question_id=question_id, when=timestamp)
+            transaction.savepoint_commit(savepoint_id)
+        except IntegrityError:
+            #recorded by a concurrent request
+            transaction.savepoint_rollback(savepoint_id)
+            views.filter(when__lt=timestamp).update(when=timestamp)
+
 
 class QuestionView(models.Model):
     question = models.ForeignKey('Post', related_name='viewed')
     who = models.ForeignKey(User, related_name='question_views')
     when = models.DateTimeField()
 
+    objects = QuestionViewManager()
+
     class Meta:
         app_label = 'askbot'
+        unique_together = ('question', 'who')
 
 class FavoriteQuestion(models.Model):
     """A favorite Question of a User."""
@@ -9,6 +9,7 @@ from askbot.models.base import BaseQuerySetManager
 from askbot import const
 from askbot.conf import settings as askbot_settings
 from askbot.utils import category_tree
+from askbot.search import tag_index
 
 def delete_tags(tags):
     """deletes tags in the list"""
@@ -161,14 +162,55 @@ class TagQuerySet(models.query.QuerySet):
             tag_filter |= models.Q(name__startswith = next_tag[:-1])
         return self.filter(tag_filter & models.Q(language_code=get_language()))
 
+    def get_by_names_iexact(self, tag_names):
+        """returns tags whose names match any of the ``tag_names``
+        ignoring the case, the lookups are OR-ed into a single query,
+        so that case-insensitive indexes in postgresql are still used
+        """
+        if len(tag_names) == 0:
+            return self.none()
+        name_filter = models.Q()
+        for tag_name in tag_names:
+            name_filter |= models.Q(name__iexact=tag_name)
+        return self.filter(name_filter)
+
+    def get_names_map_iexact(self, tag_names):
+        """returns dictionary where keys are lowercased
+        ``tag_names`` and values - names of the matching
+        tags as stored in the database, names that
+        are not found are absent from the dictionary
+        """
+        found_names = self.get_by_names_iexact(tag_names).values_list('name', flat=True)
+        return dict([(name.lower(), name) for name in found_names])
+
     def get_related_to_search(self, threads, ignored_tag_names):
         """Returns at least tag names, along with use counts"""
+        if tag_index.is_enabled():
+            return self.get_related_to_search_from_index(
+                                            threads, ignored_tag_names
+                                        )
         tags = self.filter(threads__in=threads).annotate(local_used_count=models.Count('id')).order_by('-local_used_count', 'name')
         if ignored_tag_names:
             tags = tags.exclude(name__in=ignored_tag_names)
         tags = tags.exclude(deleted = True)
         return list(tags[:50])
 
+    def get_related_to_search_from_index(self, threads, ignored_tag_names):
+        """same as :meth:`get_related_to_search`, but the tags
+        are counted with the in-process tag index"""
+        index = tag_index.shared_index.get()
+        counts = index.count_tags([thread.id for thread in threads])
+        if len(counts) == 0:
+            return list()
+        tags = self.filter(id__in=counts.keys()).exclude(deleted=True)
+        if ignored_tag_names:
+            tags = tags.exclude(name__in=ignored_tag_names)
+        tags = list(tags)
+        for tag in tags:
+            tag.local_used_count = counts[tag.id]
+        tags.sort(key=lambda tag: (-tag.local_used_count, tag.name))
+        return tags[:50]
+
 
 class TagManager(BaseQuerySetManager):
     """chainable custom filter query set manager
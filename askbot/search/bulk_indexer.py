@@ -0,0 +1,176 @@
+"""Streaming bulk indexer for the haystack backends,
+used by the commands ``askbot_rebuild_index`` and ``askbot_update_index``.
+
+Objects are read from the database in chunks ordered by
+the primary key, each chunk starts after the last key of the
+previous one, so the memory use is bounded and the cost of the
+query does not grow with the position (no OFFSET).
+Related objects needed by the indexes are joined per chunk
+in the ``index_queryset`` methods of the indexes.
+
+After each chunk the last indexed key may be saved to the
+checkpoint file, so that the interrupted run can be resumed.
+Languages can be indexed in parallel - one worker process per language.
+"""
+import os
+import multiprocessing
+from django.db import connection
+from django.db import reset_queries
+from django.utils import simplejson
+from django.utils.translation import activate as activate_language
+
+DEFAULT_CHUNK_SIZE = 500
+
+def get_connection_alias(lang_code):
+    """name of the haystack connection for the language"""
+    return 'default_%s' % lang_code[:2]
+
+
+def get_checkpoint_path(checkpoint_path, lang_code):
+    """checkpoint files are separate per language"""
+    return '%s.%s' % (checkpoint_path, lang_code)
+
+
+def has_checkpoints(checkpoint_path, lang_codes):
+    """True if any of the languages has unfinished indexing"""
+    for lang_code in lang_codes:
+        if os.path.exists(get_checkpoint_path(checkpoint_path, lang_code)):
+            return True
+    return False
+
+
+def iterate_in_chunks(queryset, chunk_size=DEFAULT_CHUNK_SIZE, start_pk=None):
+    """yields lists of up to ``chunk_size`` objects of the query set,
+    ordered by the primary key, starting after the ``start_pk``
+    """
+    while True:
+        chunk = queryset.order_by('pk')
+        if start_pk is not None:
+            chunk = chunk.filter(pk__gt=start_pk)
+        chunk = list(chunk[:chunk_size])
+        if len(chunk) == 0:
+            return
+        yield chunk
+        start_pk = chunk[-1].pk
+
+
+class Checkpoint(object):
+    """last indexed primary keys per index,
+    stored in a json file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.data = dict()
+        if os.path.exists(path):
+            checkpoint_file = open(path)
+            try:
+                self.data = simplejson.load(checkpoint_file)
+            finally:
+                checkpoint_file.close()
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, pk):
+        """saves the key, the file is replaced
+        atomically, so it remains readable if the process is killed"""
+        self.data[key] = pk
+        temp_path = self.path + '.tmp'
+        checkpoint_file = open(temp_path, 'w')
+        try:
+            simplejson.dump(self.data, checkpoint_file)
+        finally:
+            checkpoint_file.close()
+        os.rename(temp_path, self.path)
+
+    def delete(self):
+        """removes the checkpoint file, to be
+        called when indexing is completed"""
+        self.data = dict()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def index_model(backend, index, queryset, chunk_size=DEFAULT_CHUNK_SIZE,
+                checkpoint=None, checkpoint_key=None):
+    """sends objects of the query set to the search backend
+    in chunks, returns number of the indexed objects"""
+    start_pk = None
+    if checkpoint:
+        start_pk = checkpoint.get(checkpoint_key)
+
+    count = 0
+    for chunk in iterate_in_chunks(queryset, chunk_size, start_pk):
+        backend.update(index, chunk)
+        count += len(chunk)
+        if checkpoint:
+            checkpoint.set(checkpoint_key, chunk[-1].pk)
+        #query log grows without limit when DEBUG is True
+        reset_queries()
+    return count
+
+
+def index_language(lang_code, chunk_size=DEFAULT_CHUNK_SIZE, checkpoint_path=None):
+    """indexes all the models registered with haystack
+    in the language ``lang_code``,
+    returns dictionary model name -> number of indexed objects
+    """
+    from haystack import connections
+    activate_language(lang_code)
+    alias = get_connection_alias(lang_code)
+    backend = connections[alias].get_backend()
+    unified_index = connections[alias].get_unified_index()
+
+    checkpoint = None
+    if checkpoint_path:
+        checkpoint = Checkpoint(checkpoint_path)
+
+    counts = dict()
+    for model in unified_index.get_indexed_models():
+        index = unified_index.get_index(model)
+        model_name = model._meta.object_name
+        counts[model_name] = index_model(
+                                    backend,
+                                    index,
+                                    index.index_queryset(using=alias),
+                                    chunk_size=chunk_size,
+                                    checkpoint=checkpoint,
+                                    checkpoint_key=alias + '-' + model_name
+                                )
+    if checkpoint:
+        checkpoint.delete()
+    return counts
+
+
+def _index_language(args):
+    """runs :func:`index_language` in the worker process"""
+    return args[0], index_language(*args)
+
+
+def index_languages(lang_codes, chunk_size=DEFAULT_CHUNK_SIZE,
+                    checkpoint_path=None, parallel=False):
+    """indexes all models in each of the languages,
+    optionally in parallel worker processes - one per language,
+    with separate checkpoint files per language.
+    Returns dictionary language code -> counts returned by
+    :func:`index_language`
+    """
+    jobs = list()
+    for lang_code in lang_codes:
+        lang_checkpoint_path = None
+        if checkpoint_path:
+            lang_checkpoint_path = get_checkpoint_path(checkpoint_path, lang_code)
+        jobs.append((lang_code, chunk_size, lang_checkpoint_path))
+
+    if parallel and len(jobs) > 1:
+        #forked workers must not share the database connection
+        connection.close()
+        pool = multiprocessing.Pool(len(jobs))
+        try:
+            results = pool.map(_index_language, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = map(_index_language, jobs)
+    return dict(results)
@@ -26,13 +26,14 @@ class ThreadIndex(indexes.SearchIndex, indexes.Indexable):
             return self.get_model().objects.filter(deleted=False)
 
     def prepare_tags(self, obj):
-        return [tag.name for tag in obj.tags.all()]
+        #denormalized tag names, to avoid a query per thread
+        return obj.get_tag_names()
 
 class PostIndex(indexes.SearchIndex, indexes.Indexable):
     text = indexes.CharField(document=True, use_template=True)
     post_text = indexes.CharField(model_attr='text')
     author = indexes.CharField()
-    thread_id = indexes.IntegerField(model_attr='thread__pk', null=True)
+    thread_id = indexes.IntegerField(model_attr='thread_id', null=True)
 
 
     def get_model(self):
@@ -42,18 +43,24 @@ class PostIndex(indexes.SearchIndex, indexes.Indexable):
     def index_queryset(self, using=None):
         ALLOWED_TYPES = ('question', 'answer', 'comment')
         model_cls = self.get_model()
+        #authors are joined, so that bulk indexing
+        #does not query them one by one
+        posts = model_cls.objects.select_related('author')
         if getattr(settings, 'ASKBOT_MULTILINGUAL', True):
             lang_code = get_language()[:2]
-            return model_cls.objects.filter(
-                                    language_code__startswith=lang_code,
-                                    deleted=False,
-                                    post_type__in=ALLOWED_TYPES
-                                )
+            return posts.filter(
+                            language_code__startswith=lang_code,
+                            deleted=False,
+                            post_type__in=ALLOWED_TYPES
+                        )
         else:
-            return model_cls.objects.filter(
-                                    deleted=False,
-                                    post_type__in=ALLOWED_TYPES
-                                )
+            return posts.filter(
+                            deleted=False,
+                            post_type__in=ALLOWED_TYPES
+                        )
+
+    def prepare_author(self, obj):
+        return obj.author.username
 
 class UserIndex(indexes.SearchIndex, indexes.Indexable):
     text = indexes.CharField(document=True, use_template=True)
@@ -1,7 +1,11 @@
 from django.db.models import signals as django_signals
 from django.contrib.auth.models import User
+from django.utils.translation import activate as activate_language
+from django.utils.translation import get_language
 
 from haystack.signals import BaseSignalProcessor
+from haystack.exceptions import NotHandled
+from askbot.search import update_queue
 
 class AskbotRealtimeSignalProcessor(BaseSignalProcessor):
     '''
@@ -29,8 +33,66 @@ class AskbotRealtimeSignalProcessor(BaseSignalProcessor):
         except ImportError:
             pass
 
+class AskbotQueuedSignalProcessor(AskbotRealtimeSignalProcessor):
+    '''
+    Records the changes in the :mod:`askbot.search.update_queue`,
+    the index is updated when the queue is flushed
+    '''
+
+    def setup(self):
+        super(AskbotQueuedSignalProcessor, self).setup()
+        update_queue.register_handler(self.handle_queued_updates)
+
+    def handle_save(self, sender, instance, **kwargs):
+        self.enqueue('update', sender, instance)
+
+    def handle_delete(self, sender, instance, **kwargs):
+        self.enqueue('delete', sender, instance)
+
+    def get_indexes(self, model, instance=None):
+        """yields tuples (backend, index) of the
+        connections handling the model"""
+        for using in self.connection_router.for_write(instance=instance):
+            try:
+                index = self.connections[using].get_unified_index().get_index(model)
+            except NotHandled:
+                continue
+            yield self.connections[using].get_backend(), index
+
+    def enqueue(self, action, sender, instance):
+        #posts and threads are indexed in the index of their language,
+        #the queue activates it when the update is flushed
+        language_code = getattr(instance, 'language_code', None)
+        if language_code:
+            old_language = get_language()
+            activate_language(language_code)
+        try:
+            for backend, index in self.get_indexes(sender, instance):
+                model_name = update_queue.get_model_name(sender)
+                update_queue.enqueue(
+                        model_name, instance.pk, action, language_code=language_code
+                    )
+                return
+        finally:
+            if language_code:
+                activate_language(old_language)
+
+    def handle_queued_updates(self, model_name, updated_ids, deleted_ids):
+        from django.db.models import get_model
+        model = get_model(*model_name.split('.'))
+        if model is None:
+            return
+        for backend, index in self.get_indexes(model):
+            objects = list(index.index_queryset().filter(pk__in=updated_ids))
+            backend.update(index, objects)
+            #objects excluded from the index, e.g. the soft-deleted posts
+            indexed_ids = set([obj.pk for obj in objects])
+            removed_ids = set(updated_ids + deleted_ids) - indexed_ids
+            for object_id in removed_ids:
+                backend.remove('%s.%d' % (model_name, object_id))
+
+
 try:
-    from haystack.exceptions import NotHandled
     from celery_haystack.signals import CelerySignalProcessor
     from celery_haystack.utils import enqueue_task
 
@@ -0,0 +1,226 @@
+"""Full text search with the inverted index stored
+in the database tables of askbot itself, for the database
+backends without the full text search (e.g. sqlite or mysql with InnoDB).
+
+Text of each thread (title, tags and the texts of
+non-deleted posts) is split into terms and for each term
+number of its occurences in the thread is stored in the table
+:class:`~askbot.models.ThreadSearchPosting`, length of the thread
+text - in the :class:`~askbot.models.ThreadSearchDocument`.
+
+Matching threads are ranked with the Okapi BM25 formula,
+all query terms are joined with the "OR" operator, like
+in the postgresql search.
+
+Threads are reindexed upon the ``post_updated`` and ``tags_updated``
+signals, or later, if the :mod:`askbot.search.update_queue` is enabled,
+the whole index is built with the command
+``python manage.py askbot_rebuild_index``.
+
+The search is enabled with ``ASKBOT_LOCAL_SEARCH_ENABLED = True``
+in the ``settings.py`` file.
+"""
+import math
+import re
+from django.conf import settings as django_settings
+from django.db.models import Avg, Count
+from django.utils.encoding import force_unicode
+from askbot.search import update_queue
+
+#bm25 parameters
+K1 = 1.2
+B = 0.75
+
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 64
+
+#title is counted twice, to rank matches in titles higher
+TITLE_WEIGHT = 2
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+def is_enabled():
+    return getattr(django_settings, 'ASKBOT_LOCAL_SEARCH_ENABLED', False)
+
+
+def tokenize(text):
+    """returns list of the terms in the text"""
+    terms = list()
+    for term in TERM_RE.findall(force_unicode(text).lower()):
+        if len(term) >= MIN_TERM_LENGTH:
+            terms.append(term[:MAX_TERM_LENGTH])
+    return terms
+
+
+def count_terms(terms):
+    """returns dictionary term -> number of occurences"""
+    frequencies = dict()
+    for term in terms:
+        frequencies[term] = frequencies.get(term, 0) + 1
+    return frequencies
+
+
+def get_thread_text(thread):
+    """returns list of the indexed texts of the thread"""
+    texts = [thread.title] * TITLE_WEIGHT
+    texts.append(thread.tagnames)
+    posts = thread.posts.filter(deleted=False)
+    texts.extend(posts.values_list('text', flat=True))
+    return texts
+
+
+def add_thread(thread):
+    """adds thread to the index, the thread must not be
+    in the index yet"""
+    from askbot.models import ThreadSearchDocument, ThreadSearchPosting
+    terms = list()
+    for text in get_thread_text(thread):
+        terms.extend(tokenize(text or ''))
+
+    ThreadSearchDocument.objects.create(thread=thread, length=len(terms))
+    postings = [
+        ThreadSearchPosting(term=term, thread=thread, frequency=frequency) \
+            for term, frequency in count_terms(terms).items()
+    ]
+    ThreadSearchPosting.objects.bulk_create(postings)
+
+
+def index_thread(thread_id):
+    """builds index of the thread with the id ``thread_id``,
+    replacing the old one"""
+    from askbot.models import Thread
+    from askbot.models import ThreadSearchDocument, ThreadSearchPosting
+    ThreadSearchPosting.objects.filter(thread__id=thread_id).delete()
+    ThreadSearchDocument.objects.filter(thread__id=thread_id).delete()
+    try:
+        thread = Thread.objects.get(id=thread_id)
+    except Thread.DoesNotExist:
+        return
+    add_thread(thread)
+
+
+def process_queued_updates(model_name, updated_ids, deleted_ids):
+    """handler of the :mod:`askbot.search.update_queue`"""
+    if model_name == 'askbot.thread' and is_enabled():
+        for thread_id in updated_ids + deleted_ids:
+            index_thread(thread_id)
+
+update_queue.register_handler(process_queued_updates)
+
+
+def clear_index():
+    from askbot.models import ThreadSearchDocument, ThreadSearchPosting
+    ThreadSearchPosting.objects.all().delete()
+    ThreadSearchDocument.objects.all().delete()
+
+
+def get_idf(document_count, document_frequency):
+    """inverse document frequency of the term"""
+    return math.log(
+            1 + (document_count - document_frequency + 0.5) / \
+                (document_frequency + 0.5)
+        )
+
+
+def get_scores(postings, document_lengths, document_count, average_length):
+    """returns dictionary thread id -> bm25 score,
+    same as the "relevance" column added by the :func:`run_thread_search`
+
+    ``postings`` - dictionary term -> list of (thread id, frequency)
+    ``document_lengths`` - dictionary thread id -> length of the thread
+    """
+    scores = dict()
+    for term_postings in postings.values():
+        idf = get_idf(document_count, len(term_postings))
+        for thread_id, frequency in term_postings:
+            length_ratio = document_lengths.get(thread_id, 0) / average_length
+            weight = frequency * (K1 + 1) / \
+                        (frequency + K1 * (1 - B + B * length_ratio))
+            scores[thread_id] = scores.get(thread_id, 0) + idf * weight
+    return scores
+
+
+def get_term_idfs(terms):
+    """returns tuple (dictionary term -> idf, average document length)
+    for the query terms found in the index, only the counts are read
+    from the database, not the postings"""
+    from askbot.models import ThreadSearchDocument, ThreadSearchPosting
+    stats = ThreadSearchDocument.objects.aggregate(
+                                    document_count=Count('thread'),
+                                    average_length=Avg('length')
+                                )
+    document_count = stats['document_count']
+    if document_count == 0:
+        return dict(), 1.0
+    average_length = float(stats['average_length'] or 1)
+
+    frequencies = ThreadSearchPosting.objects.filter(
+                                term__in=terms
+                            ).values(
+                                'term'
+                            ).annotate(
+                                document_frequency=Count('thread')
+                            ).order_by()
+    idfs = dict()
+    for row in frequencies:
+        idfs[row['term']] = get_idf(document_count, row['document_frequency'])
+    return idfs, average_length
+
+
+def run_thread_search(query_set, query):
+    """filters the thread query set by the search query
+    and adds the "relevance" column with the bm25 score,
+    so that the results can be sorted by relevance,
+    as with the postgresql search.
+
+    The score is computed by the database, for the threads
+    of the query set only, so its other filters and the sort order
+    apply to all matching threads"""
+    from askbot.models import ThreadSearchDocument, ThreadSearchPosting
+    idfs, average_length = get_term_idfs(set(tokenize(query)))
+    if len(idfs) == 0:
+        return query_set.none()
+
+    terms = list(idfs.keys())
+    placeholders = ', '.join(['%s'] * len(terms))
+    #the numbers computed here are inlined, the terms are parameters
+    idf_cases = ' '.join(['WHEN %%s THEN %.10f' % idfs[term] for term in terms])
+    relevance = \
+        '(SELECT SUM(CASE p.term %(idf_cases)s ELSE 0 END ' \
+        '* p.frequency * %(k1_plus_1).10f ' \
+        '/ (p.frequency + %(k1).10f * (%(one_minus_b).10f ' \
+        '+ %(b_over_avg).10f * d.length))) ' \
+        'FROM %(postings)s p INNER JOIN %(documents)s d ' \
+        'ON d.thread_id = p.thread_id ' \
+        'WHERE p.thread_id = %(threads)s.id AND p.term IN (%(placeholders)s))' % {
+            'idf_cases': idf_cases,
+            'k1_plus_1': K1 + 1,
+            'k1': K1,
+            'one_minus_b': 1 - B,
+            'b_over_avg': B / average_length,
+            'postings': ThreadSearchPosting._meta.db_table,
+            'documents': ThreadSearchDocument._meta.db_table,
+            'threads': query_set.model._meta.db_table,
+            'placeholders': placeholders,
+        }
+    matching_ids = ThreadSearchPosting.objects.filter(
+                                                term__in=terms
+                                            ).values('thread')
+    return query_set.filter(
+                    id__in=matching_ids
+                ).extra(
+                    select={'relevance': relevance},
+                    select_params=terms + terms
+                )
+
+
+def search(query, limit=None):
+    """returns list of (thread id, score) tuples
+    for the threads matching the query, the best matches first
+    """
+    from askbot.models import Thread
+    threads = run_thread_search(Thread.objects.all(), query)
+    threads = threads.extra(order_by=['-relevance', '-id'])
+    if limit:
+        threads = threads[:limit]
+    return [(thread.id, thread.relevance) for thread in threads.only('id')]
@@ -0,0 +1,240 @@
+"""Keyset (a.k.a. cursor) paginator for the question lists.
+
+Unlike the ``django.core.paginator.Paginator``, pages are
+located by the values of the sort column and the unique key
+of the last (or first) item shown, rather than by the OFFSET,
+so the cost of the query does not grow with the page depth.
+Positions are passed around as opaque url-safe tokens.
+"""
+import base64
+from django.conf import settings as django_settings
+from django.core import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils import simplejson
+from django.utils.encoding import smart_str
+from django.utils.hashcompat import md5_constructor
+from django.utils.translation import get_language
+
+def is_enabled():
+    return getattr(django_settings, 'ASKBOT_KEYSET_PAGINATION_ENABLED', False)
+
+def get_count_cache_timeout():
+    """timeout for the cached question counts,
+    zero means that counts are not cached"""
+    return getattr(django_settings, 'ASKBOT_QUESTION_COUNT_CACHE_TIMEOUT', 0)
+
+def get_count_cache_key(search_state, user):
+    """key for the cached total count of questions
+    matching the search state, the count does not depend
+    on the position in the list, but may depend
+    on the tag selections of the user"""
+    search_state = search_state.change_page(1)
+    if user.is_authenticated():
+        user_key = str(user.id)
+    else:
+        user_key = 'anon'
+    key = '%s-%s-%s' % (smart_str(search_state.query_string()), get_language(), user_key)
+    return 'askbot-question-count-' + md5_constructor(key).hexdigest()
+
+
+def encode_cursor(direction, values):
+    """returns opaque token for the position in the list
+    ``direction`` is either 'next' or 'previous',
+    ``values`` - values of the ordering fields
+    """
+    data = [direction] + [unicode(value) for value in values]
+    token = base64.urlsafe_b64encode(simplejson.dumps(data))
+    return token.rstrip('=')
+
+
+def decode_cursor(token):
+    """returns tuple (direction, values) or None
+    if the token is not valid"""
+    try:
+        token = str(token)
+        token += '=' * (-len(token) % 4)
+        data = simplejson.loads(base64.urlsafe_b64decode(token))
+    except (TypeError, ValueError, UnicodeError):
+        return None
+    if not isinstance(data, list) or len(data) < 2:
+        return None
+    if data[0] not in ('next', 'previous'):
+        return None
+    return data[0], data[1:]
+
+
+class KeysetPage(object):
+    """page of the :class:`KeysetPaginator`,
+    has same interface as the django page, where used in askbot,
+    page numbers replaced with the cursor tokens"""
+    def __init__(self, object_list, paginator,
+                has_next=False, has_previous=False,
+                next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<Keyset page of %d items>' % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return list(self.object_list)[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+
+class KeysetPaginator(object):
+    """Paginator for the ordered lists of model objects
+
+    ``object_list`` - a query set or an object supporting
+    ``model``, ``filter()``, ``order_by()`` and slicing, like
+    :class:`askbot.models.question.ThreadListingSearchResults`
+
+    ``ordering`` - a tuple of two field names as passed to the
+    ``order_by``: the sort field and the unique tie breaker,
+    for example ``('-last_activity_at', '-id')``. Value of the tie
+    breaker is read from the ``pk`` of the objects in the list.
+    """
+    def __init__(self, object_list, per_page, ordering,
+                count_cache_key=None, count_cache_timeout=0):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.count_cache_key = count_cache_key
+        self.count_cache_timeout = count_cache_timeout
+        self._count = None
+
+    def _get_count(self):
+        """total number of objects, possibly cached,
+        therefore approximate, when the cache key is given"""
+        if self._count is None:
+            if self.count_cache_key and self.count_cache_timeout:
+                count = cache.cache.get(self.count_cache_key)
+                if count is None:
+                    count = self.object_list.count()
+                    cache.cache.set(
+                        self.count_cache_key,
+                        count,
+                        self.count_cache_timeout
+                    )
+                self._count = count
+            else:
+                self._count = self.object_list.count()
+        return self._count
+    count = property(_get_count)
+
+    def get_field_names(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    def get_values(self, obj):
+        """values of the ordering fields of the object"""
+        sort_field = self.get_field_names()[0]
+        return getattr(obj, sort_field), obj.pk
+
+    def get_typed_values(self, values):
+        """converts values decoded from the cursor
+        into the python values of the ordering fields"""
+        if len(values) != len(self.ordering):
+            raise ValueError('wrong number of cursor values')
+        meta = self.object_list.model._meta
+        typed_values = list()
+        for field_name, value in zip(self.get_field_names(), values):
+            field = meta.get_field(field_name)
+            if field.rel:
+                field = field.rel.get_related_field()
+            typed_values.append(field.to_python(value))
+        return typed_values
+
+    def get_filter(self, values, reverse):
+        """returns Q object selecting items after the
+        given position, or before it, if ``reverse`` is True"""
+        sort_field, key_field = self.ordering
+        sort_value, key_value = values
+
+        def get_lookup(field):
+            descending = field.startswith('-')
+            if descending != reverse:
+                return field.lstrip('-') + '__lt'
+            else:
+                return field.lstrip('-') + '__gt'
+
+        sort_name = sort_field.lstrip('-')
+        return Q(**{get_lookup(sort_field): sort_value}) | \
+            Q(**{sort_name: sort_value, get_lookup(key_field): key_value})
+
+    def get_reverse_ordering(self):
+        reverse_ordering = list()
+        for field in self.ordering:
+            if field.startswith('-'):
+                reverse_ordering.append(field[1:])
+            else:
+                reverse_ordering.append('-' + field)
+        return reverse_ordering
+
+    def page(self, cursor=None):
+        """returns the page that starts after the position
+        of the cursor (or ends before it, for the "previous" cursors),
+        invalid cursors give the first page"""
+        position = None
+        if cursor:
+            position = decode_cursor(cursor)
+        if position:
+            direction, values = position
+            try:
+                values = self.get_typed_values(values)
+            except (ValueError, ValidationError):
+                position = None
+
+        object_list = self.object_list
+        if position is None:
+            items = list(object_list.order_by(*self.ordering)[:self.per_page + 1])
+            has_next = len(items) > self.per_page
+            items = items[:self.per_page]
+            has_previous = False
+        elif direction == 'next':
+            object_list = object_list.filter(self.get_filter(values, False))
+            items = list(object_list.order_by(*self.ordering)[:self.per_page + 1])
+            has_next = len(items) > self.per_page
+            items = items[:self.per_page]
+            has_previous = True
+        else:
+            object_list = object_list.filter(self.get_filter(values, True))
+            ordering = self.get_reverse_ordering()
+            items = list(object_list.order_by(*ordering)[:self.per_page + 1])
+            has_previous = len(items) > self.per_page
+            items = items[:self.per_page]
+            items.reverse()
+            has_next = True
+
+        next_cursor = previous_cursor = None
+        if items:
+            if has_next:
+                next_cursor = encode_cursor('next', self.get_values(items[-1]))
+            if has_previous:
+                previous_cursor = encode_cursor('previous', self.get_values(items[0]))
+
+        return KeysetPage(
+                    items,
+                    self,
+                    has_next=has_next,
+                    has_previous=has_previous,
+                    next_cursor=next_cursor,
+                    previous_cursor=previous_cursor
+                )
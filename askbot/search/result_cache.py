@@ -0,0 +1,159 @@
+"""Cache of the question list pages shown to the anonymous visitors.
+
+Anonymous traffic produces a small number of distinct search states
+(scope, sort, tags, page and page size), so the data for each page of the list
+is stored in the cache keyed on the normalized search state and language:
+ordered ids of the threads on the page, counts, paginator data,
+related tags and contributors. Threads are then loaded with a single
+``in_bulk`` query.
+
+All cached pages are invalidated at once by bumping the generation
+number, which is a part of the cache key, see :func:`bump_generation`,
+called from the signal handlers on the changes of threads, posts and tags.
+"""
+import time
+from django.conf import settings as django_settings
+from django.core import cache
+from django.utils.encoding import smart_str
+from django.utils.hashcompat import md5_constructor
+from django.utils.translation import get_language
+from askbot import const
+
+GENERATION_CACHE_KEY = 'askbot-search-results-generation'
+
+def is_enabled():
+    return getattr(django_settings, 'ASKBOT_SEARCH_RESULT_CACHE_ENABLED', False)
+
+def get_timeout():
+    return getattr(
+                django_settings,
+                'ASKBOT_SEARCH_RESULT_CACHE_TIMEOUT',
+                const.LONG_TIME
+            )
+
+def can_use(user, search_state):
+    """True if the results of the search can
+    be cached, only the anonymous searches without
+    the text query are cached"""
+    if is_enabled() == False:
+        return False
+    if user.is_authenticated():
+        return False
+    return not search_state.query
+
+def get_generation():
+    """returns current generation of the cached results,
+    if the counter is lost, it is restarted from the timestamp,
+    so that the old entries are not picked up again"""
+    generation = cache.cache.get(GENERATION_CACHE_KEY)
+    if generation is None:
+        generation = int(time.time())
+        cache.cache.set(GENERATION_CACHE_KEY, generation, const.LONG_TIME)
+    return generation
+
+def bump_generation():
+    """invalidates all cached search results"""
+    try:
+        cache.cache.incr(GENERATION_CACHE_KEY)
+    except ValueError:
+        #no counter in the cache
+        cache.cache.set(GENERATION_CACHE_KEY, int(time.time()), const.LONG_TIME)
+
+def get_cache_key(search_state):
+    #query string includes the keyset cursor, but not the page size
+    key = '%s-%s-%s' % (
+                    smart_str(search_state.query_string()),
+                    search_state.page_size,
+                    get_language()
+                )
+    return 'askbot-search-results-%d-%s' % (
+                                get_generation(),
+                                md5_constructor(key).hexdigest()
+                            )
+
+
+class CachedPage(object):
+    """page of threads that can be stored in the cache,
+    keeps ids of the threads and page navigation data of
+    the original page - either django page or the keyset page
+    """
+    def __init__(self, page):
+        self.thread_ids = [thread.id for thread in page.object_list]
+        self._has_next = page.has_next()
+        self._has_previous = page.has_previous()
+        self._next_page_number = None
+        self._previous_page_number = None
+        if hasattr(page, 'next_page_number'):
+            if self._has_next:
+                self._next_page_number = page.next_page_number()
+            if self._has_previous:
+                self._previous_page_number = page.previous_page_number()
+        self.next_cursor = getattr(page, 'next_cursor', None)
+        self.previous_cursor = getattr(page, 'previous_cursor', None)
+        self.object_list = list()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['object_list']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.object_list = list()
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+    def next_page_number(self):
+        return self._next_page_number
+
+    def previous_page_number(self):
+        return self._previous_page_number
+
+    def load_threads(self):
+        """loads threads of the page with one query"""
+        from askbot.models import Thread
+        from askbot.models.question import THREAD_LIST_FIELDS
+        threads = Thread.objects.only(*THREAD_LIST_FIELDS).in_bulk(self.thread_ids)
+        self.object_list = [
+            threads[thread_id] for thread_id in self.thread_ids \
+                                            if thread_id in threads
+        ]
+
+
+def get_page_data(search_state):
+    """returns data of the page cached by the :func:`set_page_data`,
+    with the threads loaded, or None"""
+    data = cache.cache.get(get_cache_key(search_state))
+    if data is None:
+        return None
+    page = data['page']
+    page.load_threads()
+    data['paginator_context']['page_object'] = page
+    return data
+
+def set_page_data(search_state, data):
+    """caches data of the question list page,
+    ``data`` is a dictionary with the page object
+    under the key "page" and the "paginator_context",
+    other values must be picklable"""
+    data = data.copy()
+    data['page'] = CachedPage(data['page'])
+    data['paginator_context'] = data['paginator_context'].copy()
+    del data['paginator_context']['page_object']
+    cache.cache.set(get_cache_key(search_state), data, get_timeout())
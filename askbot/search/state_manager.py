@@ -86,11 +86,12 @@ class SearchState(object):
 
     @classmethod
     def get_empty(cls):
-        return cls(scope=None, sort=None, query=None, tags=None, author=None, page=None, page_size=None, user_logged_in=None)
+        return cls(scope=None, sort=None, query=None, tags=None, author=None, page=None, page_size=None, cursor=None, user_logged_in=None)
 
     def __init__(self, 
         scope=None, sort=None, query=None, tags=None,
-        author=None, page=None, page_size=None, user_logged_in=False
+        author=None, page=None, page_size=None, cursor=None,
+        user_logged_in=False
     ):
         # INFO: zip(*[('a', 1), ('b', 2)])[0] == ('a', 'b')
         if (scope not in zip(*const.POST_SCOPE_LIST)[0]) or (scope == 'followed' and not user_logged_in):
@@ -142,6 +143,9 @@ class SearchState(object):
         default_page_size = int(askbot_settings.DEFAULT_QUESTIONS_PAGE_SIZE)
         self.page_size = int(page_size) if page_size else default_page_size
 
+        #opaque position token for the keyset pagination
+        self.cursor = cursor or None
+
         self._questions_url = urlresolvers.reverse('questions')
 
     def __str__(self):
@@ -196,6 +200,8 @@ class SearchState(object):
             r'(%s)?' % r'/tags:(?P<tags>[\w+.#,-]+)' + # Should match: const.TAG_CHARS + ','; TODO: Is `#` char decoded by the time URLs are processed ??
             r'(%s)?' % r'/author:(?P<author>\d+)' +
             r'(%s)?' % r'/page:(?P<page>\d+)' +
+            r'(%s)?' % r'/page-size:(?P<page_size>\d+)' +
+            r'(%s)?' % r'/cursor:(?P<cursor>[\w\-]+)' +
             r'(%s)?' % r'/query:(?P<query>.+)' +  # INFO: query is last, b/c it can contain slash!!!
         """
 
@@ -206,6 +212,8 @@ class SearchState(object):
             lst.append('author:' + str(self.author))
         if self.page:
             lst.append('page:' + str(self.page))
+        if self.cursor:
+            lst.append('cursor:' + self.cursor)
         if self.query:
             lst.append('query:' + urllib.quote(smart_str(self.query), safe=self.SAFE_CHARS))
         return '/'.join(lst) + '/'
@@ -238,12 +246,14 @@ class SearchState(object):
         if tag not in ss.tags:
             ss.tags.append(tag)
             ss.page = 1 # state change causes page reset
+            ss.cursor = None
         return ss
 
     def remove_author(self):
         ss = self.deepcopy()
         ss.author = None
         ss.page = 1
+        ss.cursor = None
         return ss
 
     def remove_tags(self, tags = None):
@@ -255,25 +265,70 @@ class SearchState(object):
         else:
             ss.tags = []
         ss.page = 1
+        ss.cursor = None
         return ss
 
     def change_scope(self, new_scope):
         ss = self.deepcopy()
         ss.scope = new_scope
         ss.page = 1
+        ss.cursor = None
         return ss
 
     def change_sort(self, new_sort):
         ss = self.deepcopy()
         ss.sort = new_sort
         ss.page = 1
+        ss.cursor = None
         return ss
 
     def change_page(self, new_page):
         ss = self.deepcopy()
         ss.page = new_page
+        ss.cursor = None
+        return ss
+
+    def change_cursor(self, new_cursor):
+        """used in the keyset pagination mode"""
+        ss = self.deepcopy()
+        ss.cursor = new_cursor
         return ss
 
+    def get_tag_url_formatter(self):
+        return TagUrlFormatter(self)
+
+
+class TagUrlFormatter(object):
+    """returns urls of the search state with one more tag,
+    the same as ``search_state.add_tag(tag).full_url()``,
+    but the parts of the url around the tag are computed only once
+    """
+    #cannot be a part of the tag name and is quoted as "%01"
+    TAG_MARKER = '\x01'
+
+    def __init__(self, search_state):
+        self.tags = set(search_state.tags)
+        self.current_url = search_state.full_url()
+        marker_url = search_state.add_tag(self.TAG_MARKER).full_url()
+        quoted_marker = urllib.quote(self.TAG_MARKER)
+        self.prefix, self.suffix = marker_url.split(quoted_marker, 1)
+        self.urls = dict()
+
+    def get_url(self, tag):
+        url = self.urls.get(tag)
+        if url is None:
+            if tag in self.tags:
+                #adding tag that is already there does not reset the page
+                url = self.current_url
+            else:
+                quoted_tag = urllib.quote(
+                                    smart_str(tag),
+                                    safe=SearchState.SAFE_CHARS
+                                )
+                url = self.prefix + quoted_tag + self.suffix
+            self.urls[tag] = url
+        return url
+
 
 class DummySearchState(object): # Used for caching question/thread summaries
 
@@ -286,3 +341,13 @@ class DummySearchState(object): # Used for caching question/thread summaries
 
     def full_url(self):
         return '<<<%s>>>' % self.tag
+
+    def get_tag_url_formatter(self):
+        return DummyTagUrlFormatter()
+
+
+class DummyTagUrlFormatter(object):
+    """returns tag placeholders of the cached summaries"""
+
+    def get_url(self, tag):
+        return '<<<%s>>>' % tag
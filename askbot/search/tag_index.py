@@ -0,0 +1,209 @@
+"""In-process index of the tags on the threads ("posting lists").
+
+For each tag the index keeps a sorted compact array of the ids of the
+threads with that tag, and for each thread - the array of its tag ids.
+This allows intersections and unions of the tags and counting of
+the co-occurring tags without hitting the database.
+
+Deleted threads are not removed from the index, so the callers
+must still filter the threads by the deleted flag and visibility.
+
+The index lives in the memory of each worker process, it is built on
+the first use and then updated incrementally: the signal handlers publish
+the new tags of the retagged threads in the cache, and the workers apply
+them to their copies, see :mod:`askbot.utils.shared_index`.
+
+The index is enabled with ``ASKBOT_TAG_INDEX_ENABLED = True``
+in the ``settings.py`` file.
+"""
+import bisect
+import heapq
+from array import array
+from django.conf import settings as django_settings
+from askbot.utils.shared_index import SharedIndex
+
+CACHE_KEY = 'askbot-tag-index'
+
+#longer lists of thread ids are not passed to the
+#database queries, some backends limit number of parameters
+MAX_ID_LIST_SIZE = 900
+
+def is_enabled():
+    return getattr(django_settings, 'ASKBOT_TAG_INDEX_ENABLED', False)
+
+
+def make_array(values=None):
+    """returns compact sorted array of unique integers"""
+    return array('l', sorted(set(values or ())))
+
+
+def array_insert(values, value):
+    """inserts value into the sorted array unless it is there"""
+    position = bisect.bisect_left(values, value)
+    if position == len(values) or values[position] != value:
+        values.insert(position, value)
+
+
+def array_remove(values, value):
+    """removes value from the sorted array, if it is there"""
+    position = bisect.bisect_left(values, value)
+    if position < len(values) and values[position] == value:
+        values.pop(position)
+
+
+def array_contains(values, value):
+    position = bisect.bisect_left(values, value)
+    return position < len(values) and values[position] == value
+
+
+class TagIndex(object):
+    """posting lists tag id -> thread ids
+    and the reverse thread id -> tag ids"""
+
+    def __init__(self):
+        self.postings = dict()
+        self.thread_tags = dict()
+
+    def load(self, thread_tag_pairs):
+        """builds the index from the iterable of
+        (thread id, tag id) pairs"""
+        postings = dict()
+        thread_tags = dict()
+        for thread_id, tag_id in thread_tag_pairs:
+            postings.setdefault(tag_id, list()).append(thread_id)
+            thread_tags.setdefault(thread_id, list()).append(tag_id)
+        self.postings = dict(
+            [(tag_id, make_array(ids)) for tag_id, ids in postings.items()]
+        )
+        self.thread_tags = dict(
+            [(thread_id, make_array(ids)) for thread_id, ids in thread_tags.items()]
+        )
+
+    def get_thread_ids(self, tag_id):
+        return self.postings.get(tag_id, array('l'))
+
+    def get_tag_ids(self, thread_id):
+        return self.thread_tags.get(thread_id, array('l'))
+
+    def update_thread(self, thread_id, tag_ids):
+        """sets tags of the thread"""
+        new_tag_ids = make_array(tag_ids)
+        old_tag_ids = self.get_tag_ids(thread_id)
+        for tag_id in set(old_tag_ids) - set(new_tag_ids):
+            thread_ids = self.postings[tag_id]
+            array_remove(thread_ids, thread_id)
+            if len(thread_ids) == 0:
+                del self.postings[tag_id]
+        for tag_id in set(new_tag_ids) - set(old_tag_ids):
+            thread_ids = self.postings.setdefault(tag_id, array('l'))
+            array_insert(thread_ids, thread_id)
+        if len(new_tag_ids):
+            self.thread_tags[thread_id] = new_tag_ids
+        else:
+            self.thread_tags.pop(thread_id, None)
+
+    def remove_thread(self, thread_id):
+        self.update_thread(thread_id, ())
+
+    def intersect(self, tag_ids):
+        """returns sorted list of ids of threads
+        that have all of the given tags"""
+        postings = [self.get_thread_ids(tag_id) for tag_id in set(tag_ids)]
+        if len(postings) == 0:
+            return list()
+        postings.sort(key=len)
+        shortest, others = postings[0], postings[1:]
+        return [
+            thread_id for thread_id in shortest \
+                if all(array_contains(other, thread_id) for other in others)
+        ]
+
+    def union(self, tag_ids):
+        """returns sorted list of ids of threads
+        that have any of the given tags"""
+        postings = [self.get_thread_ids(tag_id) for tag_id in set(tag_ids)]
+        thread_ids = list()
+        for thread_id in heapq.merge(*postings):
+            if len(thread_ids) == 0 or thread_ids[-1] != thread_id:
+                thread_ids.append(thread_id)
+        return thread_ids
+
+    def count_tags(self, thread_ids):
+        """returns dictionary tag id -> number of
+        the given threads with that tag"""
+        counts = dict()
+        for thread_id in thread_ids:
+            for tag_id in self.get_tag_ids(thread_id):
+                counts[tag_id] = counts.get(tag_id, 0) + 1
+        return counts
+
+    def count_cooccurring_tags(self, tag_ids):
+        """returns dictionary tag id -> number of threads
+        where that tag is used together with all of the given tags,
+        the given tags themselves are not included"""
+        counts = self.count_tags(self.intersect(tag_ids))
+        for tag_id in tag_ids:
+            counts.pop(tag_id, None)
+        return counts
+
+
+    def get_similar_threads(self, thread_id, count=10,
+                            excluded_ids=None, max_postings=None):
+        """returns list of up to ``count`` tuples (thread id, similarity)
+        for the threads with the most similar sets of tags,
+        similarity is the Jaccard index of the tag sets.
+        Only the last ``max_postings`` (i.e. the most recent) threads
+        are considered per tag, to limit the cost of the popular tags
+        """
+        tag_ids = self.get_tag_ids(thread_id)
+        if len(tag_ids) == 0:
+            return list()
+        excluded_ids = excluded_ids or set()
+
+        overlaps = dict()
+        for tag_id in tag_ids:
+            thread_ids = self.get_thread_ids(tag_id)
+            if max_postings:
+                thread_ids = thread_ids[-max_postings:]
+            for other_id in thread_ids:
+                overlaps[other_id] = overlaps.get(other_id, 0) + 1
+        overlaps.pop(thread_id, None)
+
+        scores = list()
+        for other_id, overlap in overlaps.items():
+            if other_id in excluded_ids:
+                continue
+            union_size = len(tag_ids) + len(self.get_tag_ids(other_id)) - overlap
+            scores.append((float(overlap) / union_size, other_id))
+        #ties go to the newer threads
+        return [
+            (other_id, score) for score, other_id in heapq.nlargest(count, scores)
+        ]
+
+
+class SharedTagIndex(SharedIndex):
+    """per process instance of the :class:`TagIndex`,
+    built from the database on the first use and then
+    updated from the log of the retagged threads
+    """
+    cache_key = CACHE_KEY
+
+    def load(self):
+        from askbot.models import Thread
+        thread_tags = Thread.tags.through.objects.values_list('thread_id', 'tag_id')
+        index = TagIndex()
+        index.load(thread_tags.iterator())
+        return index
+
+    def apply_change(self, index, change):
+        thread_id, tag_ids = change
+        index.update_thread(thread_id, tag_ids)
+
+    def update_thread(self, thread):
+        """publishes the new tags of the thread,
+        so that all processes update their copies of the index"""
+        tag_ids = list(thread.tags.values_list('id', flat=True))
+        self.publish((thread.id, tag_ids))
+
+
+shared_index = SharedTagIndex()
@@ -0,0 +1,216 @@
+"""In-process prefix index of the thread titles,
+used for the title suggestions shown while the question is typed.
+
+Words of the titles are kept in a sorted list, for each word -
+sorted compact array of the ids of the threads with that word
+in the title, so all words starting with the typed prefix are
+found with a binary search. Every word of the query is matched
+as a prefix, matching threads are ranked by the score (votes),
+then by the last activity time.
+
+Like the :mod:`askbot.search.tag_index`, the index is built in each
+process on the first use and is updated from the signal handlers
+in the process where the thread was saved. The other processes pick up
+the changes by re-reading the recently active threads, at most once
+in ``ASKBOT_TITLE_INDEX_REFRESH_INTERVAL`` seconds.
+
+Results are only candidate thread ids, the caller loads
+the threads from the database and checks their visibility.
+
+The index is enabled with ``ASKBOT_TITLE_INDEX_ENABLED = True``
+in the ``settings.py`` file.
+"""
+import bisect
+import datetime
+import heapq
+import threading
+import time
+from django.conf import settings as django_settings
+from askbot.search.local_search import TERM_RE
+from askbot.search.tag_index import make_array, array_insert, array_remove
+
+MAX_SUGGESTIONS = 30
+#threads active shortly before the last refresh are re-read,
+#to allow for the transactions committed late
+REFRESH_OVERLAP = 60
+
+def is_enabled():
+    return getattr(django_settings, 'ASKBOT_TITLE_INDEX_ENABLED', False)
+
+
+def get_refresh_interval():
+    return getattr(django_settings, 'ASKBOT_TITLE_INDEX_REFRESH_INTERVAL', 30)
+
+
+def get_words(title):
+    """returns set of the lowercased words of the title"""
+    return set(TERM_RE.findall(title.lower()))
+
+
+def get_timestamp(date_time):
+    return time.mktime(date_time.timetuple()) + date_time.microsecond / 1000000.0
+
+
+class TitleIndex(object):
+    """word prefix -> thread ids"""
+
+    def __init__(self):
+        self.words = list()
+        self.postings = dict()
+        self.thread_words = dict()
+        #thread id -> (points, last activity timestamp)
+        self.ranks = dict()
+        self.languages = dict()
+
+    def load(self, threads):
+        """builds the index from the iterable of tuples
+        (thread id, title, language code, points, last activity time)"""
+        postings = dict()
+        for thread_id, title, language_code, points, last_activity_at in threads:
+            words = get_words(title)
+            self.thread_words[thread_id] = words
+            self.ranks[thread_id] = (points, get_timestamp(last_activity_at))
+            self.languages[thread_id] = language_code
+            for word in words:
+                postings.setdefault(word, list()).append(thread_id)
+        self.postings = dict(
+            [(word, make_array(ids)) for word, ids in postings.items()]
+        )
+        self.words = sorted(self.postings.keys())
+
+    def update_thread(self, thread_id, title, language_code, points, last_activity_at):
+        self.remove_thread(thread_id)
+        words = get_words(title)
+        for word in words:
+            if word not in self.postings:
+                bisect.insort(self.words, word)
+                self.postings[word] = make_array()
+            array_insert(self.postings[word], thread_id)
+        self.thread_words[thread_id] = words
+        self.ranks[thread_id] = (points, get_timestamp(last_activity_at))
+        self.languages[thread_id] = language_code
+
+    def remove_thread(self, thread_id):
+        for word in self.thread_words.pop(thread_id, ()):
+            thread_ids = self.postings[word]
+            array_remove(thread_ids, thread_id)
+            if len(thread_ids) == 0:
+                del self.postings[word]
+                del self.words[bisect.bisect_left(self.words, word)]
+        self.ranks.pop(thread_id, None)
+        self.languages.pop(thread_id, None)
+
+    def get_prefix_thread_ids(self, prefix):
+        """returns set of ids of threads with words
+        starting with the prefix"""
+        thread_ids = set()
+        position = bisect.bisect_left(self.words, prefix)
+        while position < len(self.words):
+            word = self.words[position]
+            if not word.startswith(prefix):
+                break
+            thread_ids.update(self.postings[word])
+            position += 1
+        return thread_ids
+
+    def search(self, query, language_code=None, count=10):
+        """returns list of ids of up to ``count`` best threads
+        whose titles have words starting with each word of the query
+        """
+        prefixes = get_words(query)
+        if len(prefixes) == 0:
+            return list()
+        #longer prefixes match fewer words, start with them
+        prefixes = sorted(prefixes, key=len, reverse=True)
+        thread_ids = self.get_prefix_thread_ids(prefixes[0])
+        for prefix in prefixes[1:]:
+            if len(thread_ids) == 0:
+                break
+            thread_ids &= self.get_prefix_thread_ids(prefix)
+
+        if language_code:
+            thread_ids = [
+                thread_id for thread_id in thread_ids \
+                    if self.languages.get(thread_id) == language_code
+            ]
+        #ties go to the newer threads
+        def get_rank(thread_id):
+            return self.ranks[thread_id] + (thread_id,)
+        return heapq.nlargest(count, thread_ids, key=get_rank)
+
+
+class SharedTitleIndex(object):
+    """per process instance of the :class:`TitleIndex`"""
+
+    def __init__(self):
+        self.index = None
+        self.refreshed_at = None
+        self.lock = threading.RLock()
+
+    def get_threads(self, since=None):
+        from askbot.models import Thread
+        threads = Thread.objects.filter(deleted=False)
+        if since:
+            threads = threads.filter(last_activity_at__gte=since)
+        return threads.values_list(
+                            'id', 'title', 'language_code',
+                            'points', 'last_activity_at'
+                        )
+
+    def load(self):
+        index = TitleIndex()
+        index.load(self.get_threads().iterator())
+        return index
+
+    def refresh(self):
+        """re-reads the recently active threads"""
+        since = datetime.datetime.fromtimestamp(
+                                self.refreshed_at - REFRESH_OVERLAP
+                            )
+        for thread_data in self.get_threads(since):
+            self.index.update_thread(*thread_data)
+
+    def get(self):
+        """returns up to date index"""
+        self.lock.acquire()
+        try:
+            now = time.time()
+            if self.index is None:
+                self.index = self.load()
+                self.refreshed_at = now
+            elif now - self.refreshed_at > get_refresh_interval():
+                self.refresh()
+                self.refreshed_at = now
+            return self.index
+        finally:
+            self.lock.release()
+
+    def update_thread(self, thread):
+        """applies changes of the thread to the
+        local copy of the index, if it is loaded"""
+        self.lock.acquire()
+        try:
+            if self.index is None:
+                return
+            if thread.deleted:
+                self.index.remove_thread(thread.id)
+            else:
+                self.index.update_thread(
+                                thread.id,
+                                thread.title,
+                                thread.language_code,
+                                thread.points,
+                                thread.last_activity_at
+                            )
+        finally:
+            self.lock.release()
+
+    def invalidate(self):
+        self.lock.acquire()
+        try:
+            self.index = None
+        finally:
+            self.lock.release()
+
+
+shared_index = SharedTitleIndex()
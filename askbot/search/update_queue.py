@@ -0,0 +1,195 @@
+"""Queue of the pending updates of the search indexes.
+
+Instead of updating the index inline with every save,
+the changed objects are recorded in the table
+:class:`~askbot.models.SearchIndexUpdate`. Repeated changes
+of the same object are merged into one record, which keeps
+the time of the first change. Records older than
+``ASKBOT_SEARCH_UPDATE_DELAY`` seconds are passed in batches
+to the registered handlers by the :func:`flush`, called from
+the celery task ``flush_search_index_queue_celery_task``
+or the command ``python manage.py flush_search_index_queue``.
+Records changed again while their batch is processed are queued
+anew, so they wait for the delay again and a flush always ends.
+
+Handlers are callables accepting the model name
+(e.g. "askbot.thread") and the lists of ids of the updated
+and of the deleted objects, they are registered with the
+:func:`register_handler` by the search backends.
+Each change is recorded with the language of the index to update,
+the handlers are called with that language activated, so that
+the multilingual backends update the index of the right language.
+
+The queue is enabled with ``ASKBOT_SEARCH_UPDATE_QUEUE_ENABLED = True``
+in the ``settings.py`` file.
+"""
+import datetime
+import logging
+from django.conf import settings as django_settings
+from django.core import cache
+from django.db import transaction
+from django.db import IntegrityError
+from django.db.models import Count, Min
+from django.utils.translation import activate as activate_language
+from django.utils.translation import get_language
+from askbot import const
+
+STATS_CACHE_KEY = 'askbot-search-update-queue-stats'
+BATCH_SIZE = 500
+
+HANDLERS = list()
+
+def is_enabled():
+    return getattr(django_settings, 'ASKBOT_SEARCH_UPDATE_QUEUE_ENABLED', False)
+
+
+def get_delay():
+    """number of seconds to wait for more
+    changes of the object before updating the index"""
+    return getattr(django_settings, 'ASKBOT_SEARCH_UPDATE_DELAY', 30)
+
+
+def register_handler(handler):
+    if handler not in HANDLERS:
+        HANDLERS.append(handler)
+
+
+def get_model_name(model):
+    return '%s.%s' % (model._meta.app_label, model._meta.module_name)
+
+
+def get_seconds(timedelta):
+    return timedelta.days * 86400 + timedelta.seconds
+
+
+def enqueue(model_name, object_id, action='update', language_code=None):
+    """records the change of the object, ``action`` is
+    "update" or "delete", the last action wins.
+    ``language_code`` - language of the index to update,
+    by default the active language"""
+    from askbot.models import SearchIndexUpdate
+    language_code = language_code or get_language() \
+                                  or django_settings.LANGUAGE_CODE
+    now = datetime.datetime.now()
+    updates = SearchIndexUpdate.objects.filter(
+                                model_name=model_name,
+                                object_id=object_id,
+                                language_code=language_code
+                            )
+    if updates.update(action=action, updated_at=now):
+        return
+
+    savepoint_id = transaction.savepoint()
+    try:
+        SearchIndexUpdate.objects.create(
+                                model_name=model_name,
+                                object_id=object_id,
+                                action=action,
+                                language_code=language_code,
+                                queued_at=now,
+                                updated_at=now
+                            )
+        transaction.savepoint_commit(savepoint_id)
+    except IntegrityError:
+        #created by a concurrent request
+        transaction.savepoint_rollback(savepoint_id)
+        updates.update(action=action, updated_at=now)
+
+
+def flush_batch(due_time, batch_size=BATCH_SIZE):
+    """passes one batch of the queued updates
+    to the handlers, returns number of the processed records"""
+    from askbot.models import SearchIndexUpdate
+    started_at = datetime.datetime.now()
+    records = SearchIndexUpdate.objects.filter(
+                                    queued_at__lte=due_time
+                                ).order_by(
+                                    'queued_at'
+                                ).values_list(
+                                    'id', 'model_name', 'object_id',
+                                    'action', 'language_code'
+                                )[:batch_size]
+    records = list(records)
+    if len(records) == 0:
+        return 0
+
+    changes = dict()
+    for record_id, model_name, object_id, action, language_code in records:
+        updated_ids, deleted_ids = changes.setdefault(
+                                        (model_name, language_code),
+                                        (list(), list())
+                                    )
+        if action == 'delete':
+            deleted_ids.append(object_id)
+        else:
+            updated_ids.append(object_id)
+
+    old_language = get_language()
+    try:
+        for (model_name, language_code), (updated_ids, deleted_ids) in changes.items():
+            activate_language(language_code)
+            for handler in HANDLERS:
+                handler(model_name, updated_ids, deleted_ids)
+    finally:
+        activate_language(old_language or django_settings.LANGUAGE_CODE)
+
+    #records changed again while the batch was processed stay in the queue,
+    #as if queued now, so that they are not picked up again by this flush
+    record_ids = [record[0] for record in records]
+    SearchIndexUpdate.objects.filter(
+                            id__in=record_ids,
+                            updated_at__lte=started_at
+                        ).delete()
+    SearchIndexUpdate.objects.filter(
+                            id__in=record_ids
+                        ).update(queued_at=datetime.datetime.now())
+    return len(records)
+
+
+def flush(delay=None, batch_size=BATCH_SIZE):
+    """processes all updates queued at least ``delay``
+    seconds ago, returns number of the processed records"""
+    if delay is None:
+        delay = get_delay()
+    stats = get_stats()
+    due_time = datetime.datetime.now() - datetime.timedelta(seconds=delay)
+
+    count = 0
+    while True:
+        batch_count = flush_batch(due_time, batch_size)
+        count += batch_count
+        if batch_count < batch_size:
+            break
+
+    flush_stats = {
+        'flushed_at': datetime.datetime.now(),
+        'flushed_count': count,
+        'lag': stats['lag']
+    }
+    cache.cache.set(STATS_CACHE_KEY, flush_stats, const.LONG_TIME)
+    logging.info(
+        'flushed %d search index updates, queue depth was %d, lag %d seconds' % \
+        (count, stats['depth'], stats['lag'])
+    )
+    return count
+
+
+def get_stats():
+    """returns dictionary with the number of queued
+    updates ("depth") and the age of the oldest one in
+    seconds ("lag"), and under the key "last_flush", if available -
+    dictionary with "flushed_at", "flushed_count" and the "lag" at that time
+    """
+    from askbot.models import SearchIndexUpdate
+    data = SearchIndexUpdate.objects.aggregate(
+                                    depth=Count('id'),
+                                    oldest=Min('queued_at')
+                                )
+    stats = {'depth': data['depth'], 'lag': 0}
+    if data['oldest']:
+        stats['lag'] = get_seconds(datetime.datetime.now() - data['oldest'])
+
+    last_flush = cache.cache.get(STATS_CACHE_KEY)
+    if last_flush:
+        stats['last_flush'] = last_flush
+    return stats
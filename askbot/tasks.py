@@ -32,10 +32,19 @@ from celery.decorators import task
 from askbot.conf import settings as askbot_settings
 from askbot import const
 from askbot import mail
+from askbot.mail import digest
+from askbot.mail import send_queue
 from askbot.models import Post, Thread, User, ReplyAddress
+from askbot.models import SimilarThread
 from askbot.models.badges import award_badges_signal
 from askbot.models import get_reply_to_addresses, format_instant_notification_email
 from askbot import exceptions as askbot_exceptions
+from askbot.search import local_search
+from askbot.search import update_queue as search_update_queue
+from askbot.utils import summary_warmer
+from askbot.utils import view_counter
+from askbot.utils import visit_recorder
+from askbot.utils import vote_engine
 from askbot.utils.twitter import Twitter
 
 # TODO: Make exceptions raised inside record_post_update_celery_task() ...
@@ -70,6 +79,74 @@ def tweet_new_post_task(post_id):
         twitter.tweet(tweet_text, access_token=token)
         
 
+@task(ignore_result = True)
+def update_similar_threads_celery_task(thread_id):
+    """recalculates precomputed similar threads
+    after the thread was retagged"""
+    SimilarThread.objects.update_for_retagged_thread(thread_id)
+
+
+@task(ignore_result = True)
+def update_thread_search_index_celery_task(thread_id):
+    """reindexes the thread for the local full text search"""
+    local_search.index_thread(thread_id)
+
+
+@task(ignore_result = True)
+def flush_search_index_queue_celery_task():
+    """applies the queued search index updates,
+    to be run periodically, e.g. with the celerybeat"""
+    search_update_queue.flush()
+
+
+@task(ignore_result = True)
+def warm_summary_cache_celery_task():
+    """renders the question summaries marked by the
+    summary warmer, to be run periodically, e.g. with the celerybeat"""
+    summary_warmer.warm()
+
+
+@task(ignore_result = True)
+def flush_view_counts_celery_task():
+    """writes the buffered question view counts to the database,
+    to be run periodically, e.g. with the celerybeat"""
+    view_counter.flush()
+
+
+@task(ignore_result = True)
+def flush_question_visits_celery_task():
+    """saves the buffered question visits to the database,
+    to be run periodically, e.g. with the celerybeat"""
+    visit_recorder.flush()
+
+
+@task(ignore_result = True)
+def drain_mail_queue_celery_task():
+    """sends the queued email messages,
+    to be run periodically, e.g. with the celerybeat"""
+    send_queue.drain()
+
+
+@task(ignore_result = True)
+def send_email_alerts_celery_task(start_id, end_id, batch_size, checkpoint_path=None):
+    """sends the delayed email alerts to one shard of the users - with the ids
+    from ``start_id`` up to, but not including ``end_id``,
+    the shards are queued by ``python manage.py send_email_alerts --celery``"""
+    digest.send_digests(
+                    batch_size=batch_size,
+                    start_id=start_id,
+                    end_id=end_id,
+                    checkpoint_path=checkpoint_path
+                )
+
+
+@task(ignore_result = True)
+def apply_vote_effects_celery_task(post_id, voter_id, event, timestamp):
+    """updates the cached data of the thread
+    and awards the badges after the vote"""
+    vote_engine.apply_vote_effects(post_id, voter_id, event, timestamp)
+
+
 @task(ignore_result = True)
 def notify_author_of_published_revision_celery_task(revision):
     #todo: move this to ``askbot.mail`` module
@@ -198,6 +275,10 @@ def record_question_visit(
         #get response notifications
         user.visit_question(question_post)
 
+    if view_counter.is_enabled():
+        #badges are considered when the view counts are flushed
+        return
+
     #3) send award badges signal for any badges
     #that are awarded for question views
     award_badges_signal.send(None,
@@ -244,6 +325,7 @@ def send_instant_notifications_about_activity_in_post(
         log_id = None
 
 
+    messages = list()
     for user in recipients:
         if user.is_blocked():
             continue
@@ -262,19 +344,19 @@ def send_instant_notifications_about_activity_in_post(
                         )
 
         headers['Reply-To'] = reply_address
-        try:
-            mail.send_mail(
+        messages.append(
+            mail.make_message(
                 subject_line=subject_line,
                 body_text=body_text,
                 recipient_list=[user.email],
-                related_object=origin_post,
-                activity_type=const.TYPE_ACTIVITY_EMAIL_UPDATE_SENT,
-                headers=headers,
-                raise_on_failure=True
+                headers=headers
             )
-        except askbot_exceptions.EmailNotSent, error:
-            logger.debug(
-                '%s, error=%s, logId=%s' % (user.email, error, log_id)
-            )
-        else:
-            logger.debug('success %s, logId=%s' % (user.email, log_id))
+        )
+
+    #all messages are sent over one connection
+    try:
+        sent_count = mail.send_messages(messages, raise_on_failure=True)
+    except askbot_exceptions.EmailNotSent, error:
+        logger.debug('error=%s, logId=%s' % (error, log_id))
+    else:
+        logger.debug('success %d emails, logId=%s' % (sent_count, log_id))
@@ -53,6 +53,17 @@ def as_js_bool(some_object):
 def as_json(data):
     return simplejson.dumps(data)
 
+@register.filter
+def summaries_html(threads, search_state=None, visitor=None):
+    """returns summary html snippets of the threads,
+    loaded from the cache with one query"""
+    from askbot.models import Thread
+    return Thread.objects.get_summaries_html(
+                                threads,
+                                search_state=search_state,
+                                visitor=visitor
+                            )
+
 @register.filter
 def is_current_language(lang):
     return lang == django_get_language()
@@ -8,6 +8,17 @@ from askbot.tests.skin_tests import *
 from askbot.tests.badge_tests import *
 from askbot.tests.management_command_tests import *
 from askbot.tests.search_state_tests import *
+from askbot.tests.paginator_tests import *
+from askbot.tests.tag_index_tests import *
+from askbot.tests.local_search_tests import *
+from askbot.tests.title_index_tests import *
+from askbot.tests.subscriber_index_tests import *
+from askbot.tests.summary_warmer_tests import *
+from askbot.tests.view_counter_tests import *
+from askbot.tests.visit_recorder_tests import *
+from askbot.tests.thread_question_post_tests import *
+from askbot.tests.vote_engine_tests import *
+from askbot.tests.mail_transport_tests import *
 from askbot.tests.form_tests import *
 from askbot.tests.follow_tests import *
 from askbot.tests.markup_test import *
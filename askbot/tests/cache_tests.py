@@ -2,6 +2,8 @@ from django.db import connection
 from django.core.urlresolvers import reverse
 from django.conf import settings
 from askbot.tests.utils import AskbotTestCase
+from askbot.search.state_manager import SearchState
+from askbot.search import result_cache as search_result_cache
 
 
 class CacheTests(AskbotTestCase):
@@ -27,3 +29,61 @@ class CacheTests(AskbotTestCase):
         self.assertTrue(before_count > after_count,
                 ('Expected fewer queries after calling visit_question. ' +
                  'Before visit: %d. After visit: %d.') % (before_count, after_count))
+
+
+class SearchResultCacheTests(AskbotTestCase):
+    def setUp(self):
+        self.user = self.create_user('other_user')
+        self.question = self.post_question(user=self.user, tags='one two')
+        self.url = SearchState.get_empty().full_url()
+        self.enabled_backup = getattr(
+                            settings, 'ASKBOT_SEARCH_RESULT_CACHE_ENABLED', False
+                        )
+        settings.ASKBOT_SEARCH_RESULT_CACHE_ENABLED = True
+        settings.DEBUG = True
+
+    def tearDown(self):
+        settings.ASKBOT_SEARCH_RESULT_CACHE_ENABLED = self.enabled_backup
+        settings.DEBUG = False
+
+    def get_thread_ids(self, response):
+        return [thread.id for thread in response.context['threads']]
+
+    def test_cached_page_content(self):
+        self.client.get(self.url)
+        response = self.client.get(self.url)
+        self.assertEqual(self.get_thread_ids(response), [self.question.thread_id])
+        tag_names = [tag.name for tag in response.context['tags']]
+        self.assertEqual(set(tag_names), set(['one', 'two']))
+
+    def test_cache_hit_gives_fewer_queries(self):
+        search_result_cache.bump_generation()
+        before_count = len(connection.queries)
+        self.client.get(self.url)
+        miss_count = len(connection.queries) - before_count
+        before_count = len(connection.queries)
+        self.client.get(self.url)
+        hit_count = len(connection.queries) - before_count
+        self.assertTrue(hit_count < miss_count)
+
+    def test_new_question_invalidates_cache(self):
+        self.client.get(self.url)
+        question = self.post_question(user=self.user)
+        response = self.client.get(self.url)
+        self.assertEqual(
+            self.get_thread_ids(response),
+            [question.thread_id, self.question.thread_id]
+        )
+
+    def test_page_sizes_are_cached_separately(self):
+        question = self.post_question(user=self.user)
+        url = self.url + 'page-size:1/'
+        response = self.client.get(url)
+        self.assertEqual(self.get_thread_ids(response), [question.thread_id])
+        response = self.client.get(self.url)
+        self.assertEqual(
+            self.get_thread_ids(response),
+            [question.thread_id, self.question.thread_id]
+        )
+        response = self.client.get(url)
+        self.assertEqual(self.get_thread_ids(response), [question.thread_id])
@@ -1149,3 +1149,222 @@ class MailMessagesTests(utils.AskbotTestCase):
         user = self.create_user('user')
         message = messages.ask_for_signature(user, footer_code = 'nothing')
         self.assertTrue(user.username in message)
+
+
+class DigestTests(utils.AskbotTestCase):
+    """tests for the set-based builder of the delayed alerts"""
+
+    def setUp(self):
+        joined_at = datetime.datetime.now() - datetime.timedelta(14)
+        schedule = copy.deepcopy(models.EmailFeedSetting.NO_EMAIL_SCHEDULE)
+        schedule['q_all'] = 'w'
+        self.subscribers = list()
+        for number in range(4):
+            subscriber = self.create_user(
+                                username='subscriber%d' % number,
+                                notification_schedule=schedule,
+                                date_joined=joined_at
+                            )
+            self.subscribers.append(subscriber)
+        self.create_user(username='author', date_joined=joined_at)
+        for number in range(2):
+            self.post_question(
+                        user=self.author,
+                        title='test question title %d' % number,
+                        timestamp=joined_at + datetime.timedelta(1)
+                    )
+        django.core.mail.outbox = list()
+
+    def get_digests(self, users):
+        from django.db import connection
+        from askbot.mail import digest
+        now = datetime.datetime.now()
+        feeds = models.EmailFeedSetting.objects.filter(
+                                    subscriber__in=users,
+                                    frequency='w'
+                                )
+        debug_cursor_backup = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        try:
+            query_count = len(connection.queries)
+            batch = digest.DigestBatch(users, list(feeds), now)
+            digests = batch.get_digests()
+            query_count = len(connection.queries) - query_count
+        finally:
+            connection.use_debug_cursor = debug_cursor_backup
+        return digests, query_count
+
+    def test_query_count_does_not_depend_on_number_of_users(self):
+        digests, query_count = self.get_digests(self.subscribers[:1])
+        self.assertEqual(len(digests), 1)
+        digests, all_users_query_count = self.get_digests(self.subscribers)
+        self.assertEqual(len(digests), 4)
+        self.assertEqual(query_count, all_users_query_count)
+        for user, threads in digests:
+            self.assertEqual(len(threads), 2)
+            for news in threads.values():
+                self.assertTrue(news['new_q'])
+
+    def test_threads_are_shared_by_batches(self):
+        from askbot.mail import digest
+        now = datetime.datetime.now()
+        thread_data = digest.DigestThreads(now - digest.MAX_REPORT_AGE)
+        self.assertEqual(len(thread_data.threads), 2)
+        feeds = models.EmailFeedSetting.objects.filter(frequency='w')
+        for user in self.subscribers:
+            batch = digest.DigestBatch(
+                        [user], list(feeds.filter(subscriber=user)), now, thread_data
+                    )
+            self.assertTrue(batch.threads is thread_data.threads)
+            digests = batch.get_digests()
+            self.assertEqual(len(digests), 1)
+            self.assertEqual(len(digests[0][1]), 2)
+
+    def test_all_questions_stop_at_max_alerts(self):
+        from askbot.mail import digest
+        now = datetime.datetime.now()
+        user = self.subscribers[0]
+        feeds = list(models.EmailFeedSetting.objects.filter(subscriber=user))
+        batch = digest.DigestBatch([user], feeds, now)
+        max_alerts_backup = askbot_settings.MAX_ALERTS_PER_EMAIL
+        askbot_settings.update('MAX_ALERTS_PER_EMAIL', 1)
+        try:
+            threads, selected = batch.get_all_questions_threads(
+                                            user, batch.start_time, None
+                                        )
+        finally:
+            askbot_settings.update('MAX_ALERTS_PER_EMAIL', max_alerts_backup)
+        self.assertEqual(threads, batch.thread_data.get_sorted_threads()[:1])
+        self.assertFalse(selected)
+
+    def test_report_age_is_limited(self):
+        from askbot.mail import digest
+        now = datetime.datetime.now()
+        user = self.subscribers[0]
+        user.date_joined = now - datetime.timedelta(365)
+        user.save()
+        feeds = list(models.EmailFeedSetting.objects.filter(subscriber=user))
+        batch = digest.DigestBatch([user], feeds, now)
+        self.assertEqual(batch.start_time, now - digest.MAX_REPORT_AGE)
+        due_feeds = models.EmailFeedSetting.objects.filter(subscriber=user)
+        self.assertEqual(
+            digest.get_run_start_time(due_feeds, now),
+            now - digest.MAX_REPORT_AGE
+        )
+
+    def test_subscriptions_are_reported_once(self):
+        from askbot.mail import digest
+        progress = digest.send_digests(batch_size=3)
+        self.assertEqual(progress['users'], 4)
+        self.assertEqual(progress['emails'], 4)
+        outbox = django.core.mail.outbox
+        self.assertEqual(
+            sorted([message.recipients()[0] for message in outbox]),
+            sorted([user.email for user in self.subscribers])
+        )
+        self.assertTrue(outbox[0].subject.startswith('2 updates'))
+        progress = digest.send_digests()
+        self.assertEqual(progress['users'], 0)
+        self.assertEqual(len(django.core.mail.outbox), 4)
+
+    def test_command_reports_progress(self):
+        from StringIO import StringIO
+        output = StringIO()
+        management.call_command(
+            'send_email_alerts', report=True, batch_size=3, stdout=output
+        )
+        lines = output.getvalue().split('\n')
+        self.assertTrue(lines[0].startswith('Users: 3/4, emails: 3,'))
+        self.assertTrue(lines[1].startswith('Users: 4/4, emails: 4,'))
+        self.assertTrue(lines[2].startswith('Sent 4 emails to 4 users'))
+
+    def test_shards_send_each_digest_once(self):
+        from askbot.mail import digest
+        user_count = 0
+        for start_id, end_id in digest.get_shard_ranges(3):
+            progress = digest.send_digests(start_id=start_id, end_id=end_id)
+            user_count += progress['users']
+        self.assertEqual(user_count, 4)
+        self.assertEqual(
+            sorted([message.recipients()[0] for message in django.core.mail.outbox]),
+            sorted([user.email for user in self.subscribers])
+        )
+
+    def test_interrupted_run_is_resumed(self):
+        import os
+        import tempfile
+        from askbot.mail import digest
+        checkpoint_path = tempfile.mktemp()
+        send_digest = digest.send_digest
+        def send_two_digests(user, *args):
+            if len(django.core.mail.outbox) == 2:
+                raise IOError('connection lost')
+            send_digest(user, *args)
+
+        digest.send_digest = send_two_digests
+        try:
+            self.assertRaises(
+                IOError, digest.send_digests, checkpoint_path=checkpoint_path
+            )
+        finally:
+            digest.send_digest = send_digest
+        self.assertTrue(os.path.exists(checkpoint_path))
+
+        progress = digest.send_digests(checkpoint_path=checkpoint_path)
+        self.assertEqual(progress['users'], 4)
+        self.assertEqual(
+            sorted([message.recipients()[0] for message in django.core.mail.outbox]),
+            sorted([user.email for user in self.subscribers])
+        )
+        self.assertFalse(os.path.exists(checkpoint_path))
+        self.assertEqual(digest.send_digests()['users'], 0)
+
+    def test_resumed_run_keeps_user_range(self):
+        import os
+        import tempfile
+        from askbot.mail import digest
+        checkpoint_path = tempfile.mktemp()
+        end_id = self.subscribers[2].id
+        send_digest = digest.send_digest
+        def send_one_digest(user, *args):
+            if len(django.core.mail.outbox) == 1:
+                raise IOError('connection lost')
+            send_digest(user, *args)
+
+        digest.send_digest = send_one_digest
+        try:
+            self.assertRaises(
+                IOError, digest.send_digests,
+                end_id=end_id, checkpoint_path=checkpoint_path
+            )
+        finally:
+            digest.send_digest = send_digest
+        self.assertEqual(digest.Checkpoint(checkpoint_path).get('end_id'), end_id)
+
+        #range is read from the checkpoint
+        progress = digest.send_digests(checkpoint_path=checkpoint_path)
+        self.assertEqual(progress['users'], 2)
+        self.assertEqual(
+            sorted([message.recipients()[0] for message in django.core.mail.outbox]),
+            sorted([user.email for user in self.subscribers[:2]])
+        )
+        self.assertFalse(os.path.exists(checkpoint_path))
+
+    def test_command_parses_shard(self):
+        from django.core.management.base import CommandError
+        from askbot.management.commands.send_email_alerts import parse_shard
+        self.assertEqual(parse_shard('1/2'), (0, 2))
+        self.assertRaises(CommandError, parse_shard, '3/2')
+        self.assertRaises(CommandError, parse_shard, '1-2')
+
+    def test_command_sends_all_shards(self):
+        from StringIO import StringIO
+        output = StringIO()
+        management.call_command(
+            'send_email_alerts', report=True, shards=2, stdout=output
+        )
+        lines = output.getvalue().strip().split('\n')
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith('Shard 1/2: Sent'))
+        self.assertTrue(lines[2].startswith('Sent 4 emails to 4 users'))
+        self.assertEqual(len(django.core.mail.outbox), 4)
@@ -4,7 +4,9 @@ from django.conf import settings
 from django.contrib.auth.models import User
 from askbot.tests.utils import AskbotTestCase, skipIf
 from askbot import models
+from askbot.search import bulk_indexer
 import datetime
+import tempfile
 
 class HaystackSearchTests(AskbotTestCase):
     """tests methods on User object,
@@ -102,3 +104,142 @@ class HaystackSearchTests(AskbotTestCase):
         qs = AskbotSearchQuerySet().filter(content='gepeto').get_django_queryset(models.Thread)
         for instance in qs:
            self.assertTrue(isinstance(instance, models.Thread))
+
+
+class FakeSearchBackend(object):
+    """collects chunks sent to the index, fails
+    after the given number of chunks"""
+    def __init__(self, fail_after=None):
+        self.chunks = list()
+        self.fail_after = fail_after
+
+    def update(self, index, iterable):
+        if self.fail_after is not None and len(self.chunks) == self.fail_after:
+            raise RuntimeError('backend failure')
+        self.chunks.append([obj.pk for obj in iterable])
+
+
+class BulkIndexerTests(AskbotTestCase):
+
+    def setUp(self):
+        self.user = self.create_user()
+        for number in range(5):
+            self.post_question(user=self.user, title='question %d' % number)
+        self.thread_ids = list(
+            models.Thread.objects.order_by('id').values_list('id', flat=True)
+        )
+        self.checkpoint_path = tempfile.mktemp()
+
+    def tearDown(self):
+        bulk_indexer.Checkpoint(self.checkpoint_path).delete()
+
+    def test_iterate_in_chunks(self):
+        chunks = bulk_indexer.iterate_in_chunks(models.Thread.objects.all(), 2)
+        self.assertEqual(
+            [[thread.id for thread in chunk] for chunk in chunks],
+            [self.thread_ids[:2], self.thread_ids[2:4], self.thread_ids[4:]]
+        )
+
+    def test_interrupted_indexing_is_resumed(self):
+        threads = models.Thread.objects.all()
+        checkpoint = bulk_indexer.Checkpoint(self.checkpoint_path)
+        backend = FakeSearchBackend(fail_after=1)
+        self.assertRaises(
+            RuntimeError,
+            bulk_indexer.index_model,
+            backend, None, threads,
+            chunk_size=2, checkpoint=checkpoint, checkpoint_key='threads'
+        )
+        self.assertEqual(backend.chunks, [self.thread_ids[:2]])
+
+        #new process reads the saved checkpoint
+        checkpoint = bulk_indexer.Checkpoint(self.checkpoint_path)
+        backend = FakeSearchBackend()
+        count = bulk_indexer.index_model(
+                        backend, None, threads,
+                        chunk_size=2, checkpoint=checkpoint, checkpoint_key='threads'
+                    )
+        self.assertEqual(count, 3)
+        self.assertEqual(backend.chunks, [self.thread_ids[2:4], self.thread_ids[4:]])
+
+
+class FakeUnifiedIndex(object):
+    def __init__(self, index):
+        self.index = index
+
+    def get_index(self, model):
+        return self.index
+
+
+class FakeConnection(object):
+    """search connection of one language with the real askbot index"""
+    def __init__(self, index):
+        self.index = index
+        self.backend = FakeSearchBackend()
+        self.backend.removed = list()
+        self.backend.remove = self.backend.removed.append
+
+    def get_unified_index(self):
+        return FakeUnifiedIndex(self.index)
+
+    def get_backend(self):
+        return self.backend
+
+
+class FakeLanguageRouter(object):
+    def for_write(self, **hints):
+        from django.utils.translation import get_language
+        return ['default_' + get_language()[:2]]
+
+
+class QueuedSignalProcessorTests(AskbotTestCase):
+
+    def setUp(self):
+        self.settings_backup = (
+            getattr(settings, 'ASKBOT_MULTILINGUAL', False),
+            getattr(settings, 'ASKBOT_SEARCH_UPDATE_QUEUE_ENABLED', False)
+        )
+        settings.ASKBOT_MULTILINGUAL = True
+        settings.ASKBOT_SEARCH_UPDATE_QUEUE_ENABLED = True
+        self.user = self.create_user()
+
+    def tearDown(self):
+        settings.ASKBOT_MULTILINGUAL = self.settings_backup[0]
+        settings.ASKBOT_SEARCH_UPDATE_QUEUE_ENABLED = self.settings_backup[1]
+
+    @skipIf('haystack' not in settings.INSTALLED_APPS,
+        'Haystack not setup')
+    def test_updates_go_to_index_of_their_language(self):
+        from django.utils.translation import activate
+        from askbot.search import update_queue
+        from askbot.search.haystack import ThreadIndex
+        from askbot.search.haystack.signals import AskbotQueuedSignalProcessor
+        connections = {
+            'default_en': FakeConnection(ThreadIndex()),
+            'default_de': FakeConnection(ThreadIndex()),
+        }
+        activate('en')
+        english = self.user.post_question(
+                        title='english question', body_text='text',
+                        tags='test', language='en'
+                    )
+        german = self.user.post_question(
+                        title='german question', body_text='text',
+                        tags='test', language='de'
+                    )
+        models.SearchIndexUpdate.objects.all().delete()
+        processor = AskbotQueuedSignalProcessor(connections, FakeLanguageRouter())
+        try:
+            for thread in (english.thread, german.thread):
+                processor.handle_save(models.Thread, thread)
+            update_queue.flush(delay=0)
+        finally:
+            processor.teardown()
+            update_queue.HANDLERS.remove(processor.handle_queued_updates)
+            activate('en')
+        english_backend = connections['default_en'].backend
+        german_backend = connections['default_de'].backend
+        self.assertEqual(english_backend.chunks, [[english.thread.id]])
+        self.assertEqual(german_backend.chunks, [[german.thread.id]])
+        self.assertEqual(english_backend.removed, [])
+        self.assertEqual(german_backend.removed, [])
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+import datetime
+from django.conf import settings as django_settings
+from django.core import management
+from django.test import TestCase
+from askbot.tests.utils import AskbotTestCase
+from askbot.models import Thread, ThreadSearchDocument, ThreadSearchPosting
+from askbot.models import SearchIndexUpdate
+from askbot.search import local_search
+from askbot.search import update_queue
+from askbot.search.state_manager import SearchState
+
+
+class LocalSearchScoringTests(TestCase):
+
+    def test_tokenize(self):
+        self.assertEqual(
+            local_search.tokenize(u'How to install Askbot? (a 2nd time)'),
+            [u'how', u'to', u'install', u'askbot', u'2nd', u'time']
+        )
+        self.assertEqual(local_search.tokenize(u'Привет'), [u'привет'])
+
+    def test_rare_terms_and_short_documents_rank_higher(self):
+        postings = {
+            'common': [(1, 1), (2, 1), (3, 1)],
+            'rare': [(2, 1)],
+        }
+        lengths = {1: 10, 2: 10, 3: 100}
+        scores = local_search.get_scores(postings, lengths, 3, 40.0)
+        self.assertTrue(scores[2] > scores[1] > scores[3])
+
+
+class LocalSearchTests(AskbotTestCase):
+
+    def setUp(self):
+        self.enabled_backup = getattr(django_settings, 'ASKBOT_LOCAL_SEARCH_ENABLED', False)
+        django_settings.ASKBOT_LOCAL_SEARCH_ENABLED = True
+        self.create_user()
+        self.q1 = self.post_question(
+                        title='installing on windows',
+                        body_text='steps to install on windows',
+                        tags='windows'
+                    )
+        self.q2 = self.post_question(
+                        title='upgrade problem',
+                        body_text='after the upgrade the site is broken',
+                        tags='upgrade'
+                    )
+        self.q3 = self.post_question(
+                        title='installing on linux',
+                        body_text='what packages are needed',
+                        tags='linux'
+                    )
+
+    def tearDown(self):
+        django_settings.ASKBOT_LOCAL_SEARCH_ENABLED = self.enabled_backup
+
+    def get_thread_ids(self, query, sort='relevance-desc'):
+        search_state = SearchState(query=query, sort=sort)
+        threads, meta_data = Thread.objects.run_advanced_search(
+                                        request_user=self.user,
+                                        search_state=search_state
+                                    )
+        return [thread.id for thread in threads]
+
+    def test_search_ranks_by_relevance(self):
+        self.assertEqual(
+            self.get_thread_ids('windows install'),
+            [self.q1.thread_id]
+        )
+        thread_ids = self.get_thread_ids('installing windows')
+        self.assertEqual(thread_ids, [self.q1.thread_id, self.q3.thread_id])
+        self.assertEqual(self.get_thread_ids('nonexistent'), [])
+
+    def test_other_sort_orders(self):
+        thread_ids = self.get_thread_ids('installing', sort='age-asc')
+        self.assertEqual(thread_ids, [self.q1.thread_id, self.q3.thread_id])
+
+    def test_answers_and_edits_are_indexed(self):
+        self.post_answer(question=self.q2, body_text='try the mysql database')
+        self.assertEqual(self.get_thread_ids('mysql'), [self.q2.thread_id])
+        self.edit_question(
+                user=self.user,
+                question=self.q3,
+                body_text='which mysql version'
+            )
+        self.assertEqual(
+            set(self.get_thread_ids('mysql')),
+            set([self.q2.thread_id, self.q3.thread_id])
+        )
+        self.assertEqual(self.get_thread_ids('packages'), [])
+
+    def test_database_scores_match_bm25(self):
+        postings = dict()
+        for term in ('installing', 'windows'):
+            rows = ThreadSearchPosting.objects.filter(term=term)
+            postings[term] = list(rows.values_list('thread', 'frequency'))
+        lengths = dict(ThreadSearchDocument.objects.values_list('thread', 'length'))
+        average_length = float(sum(lengths.values())) / len(lengths)
+        expected = local_search.get_scores(postings, lengths, len(lengths), average_length)
+        for thread_id, score in local_search.search('installing windows'):
+            self.assertAlmostEqual(score, expected[thread_id])
+
+    def test_search_is_limited_to_query_set(self):
+        threads = Thread.objects.filter(tags__name='linux')
+        threads = local_search.run_thread_search(threads, 'installing')
+        self.assertEqual([thread.id for thread in threads], [self.q3.thread_id])
+
+    def test_rebuild_index(self):
+        ThreadSearchPosting.objects.all().delete()
+        ThreadSearchDocument.objects.all().delete()
+        management.call_command('askbot_rebuild_index')
+        self.assertEqual(ThreadSearchDocument.objects.count(), 3)
+        self.assertEqual(self.get_thread_ids('upgrade'), [self.q2.thread_id])
+
+
+class SearchUpdateQueueTests(AskbotTestCase):
+
+    def setUp(self):
+        self.settings_backup = (
+            getattr(django_settings, 'ASKBOT_LOCAL_SEARCH_ENABLED', False),
+            getattr(django_settings, 'ASKBOT_SEARCH_UPDATE_QUEUE_ENABLED', False)
+        )
+        django_settings.ASKBOT_LOCAL_SEARCH_ENABLED = True
+        django_settings.ASKBOT_SEARCH_UPDATE_QUEUE_ENABLED = True
+        self.create_user()
+        self.question = self.post_question(title='queued question')
+        self.handled = list()
+        update_queue.register_handler(self.record_updates)
+
+    def tearDown(self):
+        django_settings.ASKBOT_LOCAL_SEARCH_ENABLED = self.settings_backup[0]
+        django_settings.ASKBOT_SEARCH_UPDATE_QUEUE_ENABLED = self.settings_backup[1]
+        update_queue.HANDLERS.remove(self.record_updates)
+
+    def record_updates(self, model_name, updated_ids, deleted_ids):
+        self.handled.append((model_name, sorted(updated_ids), sorted(deleted_ids)))
+
+    def get_thread_ids(self, query):
+        return [thread_id for thread_id, score in local_search.search(query)]
+
+    def test_updates_are_coalesced(self):
+        thread_id = self.question.thread_id
+        self.edit_question(user=self.user, question=self.question, body_text='first edit')
+        self.edit_question(user=self.user, question=self.question, body_text='second edit')
+        self.assertEqual(SearchIndexUpdate.objects.count(), 1)
+        self.assertEqual(
+            SearchIndexUpdate.objects.get().language_code,
+            self.question.thread.language_code
+        )
+        self.assertEqual(self.get_thread_ids('queued'), [])
+
+        self.assertEqual(update_queue.get_stats()['depth'], 1)
+        self.assertEqual(update_queue.flush(delay=0), 1)
+        self.assertEqual(self.handled, [('askbot.thread', [thread_id], [])])
+        self.assertEqual(self.get_thread_ids('second'), [thread_id])
+        self.assertEqual(update_queue.get_stats()['depth'], 0)
+
+    def test_updates_during_flush_are_requeued(self):
+        def update_again(model_name, updated_ids, deleted_ids):
+            for object_id in updated_ids:
+                update_queue.enqueue(model_name, object_id)
+        update_queue.register_handler(update_again)
+        try:
+            self.assertEqual(update_queue.flush(delay=0, batch_size=1), 1)
+        finally:
+            update_queue.HANDLERS.remove(update_again)
+        self.assertEqual(len(self.handled), 1)
+        record = SearchIndexUpdate.objects.get()
+        self.assertTrue(record.queued_at >= record.updated_at)
+
+    def test_updates_are_flushed_in_their_language(self):
+        from django.utils.translation import get_language
+        languages = list()
+        def record_language(model_name, updated_ids, deleted_ids):
+            languages.append((get_language(), updated_ids))
+        SearchIndexUpdate.objects.all().delete()
+        update_queue.enqueue('askbot.thread', 1000, language_code='en')
+        update_queue.enqueue('askbot.thread', 1000, language_code='de')
+        update_queue.enqueue('askbot.thread', 1001, language_code='de')
+        self.assertEqual(SearchIndexUpdate.objects.count(), 3)
+        update_queue.register_handler(record_language)
+        try:
+            update_queue.flush(delay=0)
+        finally:
+            update_queue.HANDLERS.remove(record_language)
+        self.assertEqual(
+            sorted([(language, sorted(ids)) for language, ids in languages]),
+            [('de', [1000, 1001]), ('en', [1000])]
+        )
+
+    def test_delay(self):
+        update_queue.enqueue('askbot.thread', 1000)
+        self.assertEqual(update_queue.flush(delay=60), 0)
+        update_queue.enqueue('askbot.thread', 1000, action='delete')
+        SearchIndexUpdate.objects.update(
+            queued_at=datetime.datetime.now() - datetime.timedelta(minutes=5)
+        )
+        self.assertTrue(update_queue.get_stats()['lag'] >= 300)
+        management.call_command('flush_search_index_queue', delay=60)
+        self.assertEqual(
+            self.handled[-1],
+            ('askbot.thread', [self.question.thread_id], [1000])
+        )
+        self.assertEqual(SearchIndexUpdate.objects.count(), 0)
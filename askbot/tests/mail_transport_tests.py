@@ -0,0 +1,241 @@
+import datetime
+import smtplib
+from StringIO import StringIO
+from django.conf import settings as django_settings
+from django.core import cache
+from django.core import mail as django_mail
+from django.core.cache.backends.locmem import LocMemCache
+from django.core import management
+from django.core.mail.backends.locmem import EmailBackend as LocMemBackend
+from django.test import TestCase
+from askbot import mail
+from askbot.mail import send_queue
+from askbot.mail import transport
+from askbot.models import OutgoingEmail
+
+BACKEND_PATH = 'askbot.tests.mail_transport_tests.FlakyEmailBackend'
+
+class FlakyEmailBackend(LocMemBackend):
+    """in-memory backend, which counts the opened connections
+    and raises the errors from the list ``failures``"""
+    opened = 0
+    failures = list()
+
+    def open(self):
+        FlakyEmailBackend.opened += 1
+
+    def send_messages(self, messages):
+        if FlakyEmailBackend.failures:
+            raise FlakyEmailBackend.failures.pop(0)
+        return super(FlakyEmailBackend, self).send_messages(messages)
+
+
+class MailTransportTests(TestCase):
+
+    def setUp(self):
+        transport.close_connection(BACKEND_PATH)
+        FlakyEmailBackend.opened = 0
+        FlakyEmailBackend.failures = list()
+        django_mail.outbox = list()
+
+    def tearDown(self):
+        transport.close_connection(BACKEND_PATH)
+
+    def make_messages(self, number):
+        return [
+            mail.make_message(
+                subject_line='message %d' % message_number,
+                body_text='message body',
+                recipient_list=['user%d@example.com' % message_number]
+            ) for message_number in range(number)
+        ]
+
+    def send(self, messages, **kwargs):
+        return transport.send_messages(
+                            messages, BACKEND_PATH, retry_delay=0, **kwargs
+                        )
+
+    def test_connection_is_reused(self):
+        self.assertEqual(self.send(self.make_messages(3)), 3)
+        self.assertEqual(self.send(self.make_messages(2)), 2)
+        self.assertEqual(FlakyEmailBackend.opened, 1)
+        self.assertEqual(len(django_mail.outbox), 5)
+
+    def test_transient_failures_are_retried(self):
+        FlakyEmailBackend.failures = [
+            smtplib.SMTPServerDisconnected('connection lost'),
+            smtplib.SMTPResponseException(421, 'try again later')
+        ]
+        self.assertEqual(self.send(self.make_messages(3)), 3)
+        #new connection after each error
+        self.assertEqual(FlakyEmailBackend.opened, 3)
+        self.assertEqual(
+            [message.subject for message in django_mail.outbox],
+            ['message 0', 'message 1', 'message 2']
+        )
+
+    def test_permanent_failure_is_not_retried(self):
+        error = smtplib.SMTPResponseException(550, 'no such user')
+        FlakyEmailBackend.failures = [error]
+        self.assertRaises(
+            smtplib.SMTPResponseException, self.send, self.make_messages(2)
+        )
+        self.assertEqual(len(django_mail.outbox), 0)
+
+        FlakyEmailBackend.failures = [error]
+        errors = list()
+        messages = self.make_messages(2)
+        self.assertEqual(self.send(messages, errors=errors), 1)
+        self.assertEqual(errors, [(messages[0], error)])
+        self.assertEqual(django_mail.outbox[0].subject, 'message 1')
+
+    def test_retries_are_limited(self):
+        FlakyEmailBackend.failures = [
+            smtplib.SMTPServerDisconnected('connection lost') for attempt in range(3)
+        ]
+        self.assertRaises(
+            smtplib.SMTPServerDisconnected,
+            self.send, self.make_messages(1), max_retries=2
+        )
+
+    def test_benchmark_command(self):
+        output = StringIO()
+        management.call_command('benchmark_mail', messages=5, stdout=output)
+        lines = output.getvalue().split('\n')
+        self.assertTrue(lines[0].startswith('Pooled connection: 5 messages,'))
+        self.assertTrue(lines[1].startswith('Connection per message: 5 messages,'))
+        self.assertEqual(django_mail.outbox, [])
+
+
+class MailQueueTests(TestCase):
+
+    def setUp(self):
+        self.enabled_backup = getattr(django_settings, 'ASKBOT_MAIL_QUEUE_ENABLED', False)
+        django_settings.ASKBOT_MAIL_QUEUE_ENABLED = True
+        self.backend_backup = django_settings.EMAIL_BACKEND
+        django_settings.EMAIL_BACKEND = BACKEND_PATH
+        self.old_cache = cache.cache
+        cache.cache = LocMemCache('mail-queue-tests', {})
+        FlakyEmailBackend.failures = list()
+        django_mail.outbox = list()
+
+    def tearDown(self):
+        django_settings.ASKBOT_MAIL_QUEUE_ENABLED = self.enabled_backup
+        transport.close_connection()
+        django_settings.EMAIL_BACKEND = self.backend_backup
+        cache.cache = self.old_cache
+
+    def test_send_mail_enqueues_message_per_recipient(self):
+        mail.send_mail(
+            subject_line='subject',
+            body_text='<p>message body</p>',
+            recipient_list=['user1@example.com', 'user2@Example.org'],
+            headers={'Reply-To': 'reply@example.com'}
+        )
+        self.assertEqual(len(django_mail.outbox), 0)
+        self.assertEqual(
+            sorted(OutgoingEmail.objects.values_list('domain', flat=True)),
+            ['example.com', 'example.org']
+        )
+
+        stats = send_queue.drain()
+        self.assertEqual(stats['sent'], 2)
+        self.assertEqual(OutgoingEmail.objects.count(), 0)
+        self.assertEqual(
+            sorted([message.to[0] for message in django_mail.outbox]),
+            ['user1@example.com', 'user2@Example.org']
+        )
+        message = django_mail.outbox[0]
+        self.assertEqual(message.subject, mail.prefix_the_subject_line('subject'))
+        self.assertEqual(message.extra_headers['Reply-To'], 'reply@example.com')
+
+    def test_failed_messages_are_retried_then_dead(self):
+        mail.send_messages([
+            mail.make_message(
+                subject_line='message %d' % number,
+                body_text='message body',
+                recipient_list=['user%d@example.com' % number]
+            ) for number in range(2)
+        ])
+        FlakyEmailBackend.failures = [
+            smtplib.SMTPServerDisconnected('connection lost'),
+            smtplib.SMTPResponseException(550, 'no such user')
+        ]
+        stats = send_queue.drain()
+        self.assertEqual((stats['sent'], stats['failed'], stats['dead']), (0, 2, 1))
+        retried = OutgoingEmail.objects.get(status='queued')
+        self.assertEqual(retried.attempts, 1)
+        self.assertTrue(retried.next_attempt_at > datetime.datetime.now())
+        dead = OutgoingEmail.objects.get(status='dead')
+        self.assertTrue('no such user' in dead.last_error)
+
+        #retry is not due yet
+        self.assertEqual(send_queue.drain()['sent'], 0)
+        OutgoingEmail.objects.update(next_attempt_at=datetime.datetime.now())
+        self.assertEqual(send_queue.drain()['sent'], 1)
+        self.assertEqual(send_queue.requeue_dead(), 1)
+        self.assertEqual(send_queue.drain()['sent'], 1)
+        self.assertEqual(len(django_mail.outbox), 2)
+
+    def test_stale_claims_are_released(self):
+        mail.send_mail(
+            subject_line='subject',
+            body_text='message body',
+            recipient_list=['user@example.com']
+        )
+        records = send_queue.claim_batch()
+        self.assertEqual(len(records), 1)
+        self.assertEqual(send_queue.claim_batch(), [])
+        claimed_at = datetime.datetime.now() - datetime.timedelta(
+                                                seconds=send_queue.CLAIM_TIMEOUT + 1
+                                            )
+        OutgoingEmail.objects.update(claimed_at=claimed_at)
+        self.assertEqual(send_queue.drain()['sent'], 1)
+
+    def test_rate_limit_paces_domain(self):
+        rates_backup = getattr(django_settings, 'ASKBOT_MAIL_QUEUE_DOMAIN_RATES', {})
+        django_settings.ASKBOT_MAIL_QUEUE_DOMAIN_RATES = {'slow.com': 20}
+        try:
+            limiter = send_queue.RateLimiter()
+            started_at = datetime.datetime.now()
+            for number in range(3):
+                limiter.wait('slow.com')
+                limiter.wait('example.com')
+            elapsed = send_queue.get_seconds(datetime.datetime.now() - started_at)
+        finally:
+            django_settings.ASKBOT_MAIL_QUEUE_DOMAIN_RATES = rates_backup
+        self.assertTrue(elapsed >= 0.1)
+
+    def test_claim_fits_rate_limit_in_timeout(self):
+        rates_backup = getattr(django_settings, 'ASKBOT_MAIL_QUEUE_DOMAIN_RATES', {})
+        #each message takes a third of the claim timeout
+        rate = 3.0 / send_queue.CLAIM_TIMEOUT
+        django_settings.ASKBOT_MAIL_QUEUE_DOMAIN_RATES = {'slow.com': rate}
+        try:
+            mail.send_mail(
+                subject_line='subject',
+                body_text='message body',
+                recipient_list=['user%d@slow.com' % number for number in range(3)] + \
+                               ['user@example.com']
+            )
+            records = send_queue.claim_batch()
+        finally:
+            django_settings.ASKBOT_MAIL_QUEUE_DOMAIN_RATES = rates_backup
+        self.assertEqual(
+            sorted([record.domain for record in records]),
+            ['example.com', 'slow.com']
+        )
+        self.assertEqual(OutgoingEmail.objects.filter(status='queued').count(), 2)
+
+    def test_command_prints_stats(self):
+        mail.send_mail(
+            subject_line='subject',
+            body_text='message body',
+            recipient_list=['user@example.com']
+        )
+        output = StringIO()
+        management.call_command('drain_mail_queue', stdout=output)
+        lines = output.getvalue().split('\n')
+        self.assertEqual(lines[0], 'Queued: 0')
+        self.assertEqual(lines[2], 'Dead: 0')
+        self.assertTrue(lines[4].startswith('Last run: 1 sent, 0 failed, 0 dead'))
@@ -0,0 +1,140 @@
+from django.conf import settings as django_settings
+from django.core.urlresolvers import reverse
+from django.utils import simplejson
+from askbot.tests.utils import AskbotTestCase
+from askbot.tests.utils import with_settings
+from askbot.models import Thread
+from askbot.search.state_manager import SearchState
+from askbot.search.paginator import KeysetPaginator
+from askbot.search.paginator import encode_cursor, decode_cursor
+
+
+class KeysetPaginatorTests(AskbotTestCase):
+
+    def setUp(self):
+        self.create_user()
+        self.questions = list()
+        for number in range(5):
+            title = 'question %d' % number
+            self.questions.append(self.post_question(title=title))
+        #two questions with same activity timestamp
+        #must still be separated by the thread id
+        Thread.objects.filter(
+                id=self.questions[2].thread_id
+            ).update(
+                last_activity_at=self.questions[3].thread.last_activity_at
+            )
+
+    def get_search_results(self, sort='activity-desc'):
+        search_state = SearchState.get_empty().change_sort(sort)
+        return Thread.objects.run_advanced_search(
+                                request_user=self.user,
+                                search_state=search_state
+                            )
+
+    def get_all_thread_ids(self, qs, ordering):
+        thread_ids = list()
+        paginator = KeysetPaginator(qs, 2, ordering)
+        page = paginator.page()
+        thread_ids.extend([thread.id for thread in page])
+        while page.has_next():
+            page = paginator.page(page.next_cursor)
+            thread_ids.extend([thread.id for thread in page])
+        return thread_ids, page
+
+    def test_cursor_roundtrip(self):
+        cursor = encode_cursor('next', [u'2013-01-01 10:00:00', 5])
+        self.assertEqual(
+            decode_cursor(cursor),
+            ('next', [u'2013-01-01 10:00:00', u'5'])
+        )
+        self.assertEqual(decode_cursor('garbage'), None)
+
+    def test_pages_follow_sort_order(self):
+        for sort in ('activity-desc', 'activity-asc', 'votes-desc', 'age-asc'):
+            qs, meta_data = self.get_search_results(sort)
+            expected_ids = [thread.id for thread in qs]
+            thread_ids, last_page = self.get_all_thread_ids(
+                                        qs, meta_data['keyset_ordering']
+                                    )
+            self.assertEqual(thread_ids, expected_ids)
+
+    def test_previous_page(self):
+        qs, meta_data = self.get_search_results()
+        paginator = KeysetPaginator(qs, 2, meta_data['keyset_ordering'])
+        first_page = paginator.page()
+        self.assertFalse(first_page.has_previous())
+        second_page = paginator.page(first_page.next_cursor)
+        self.assertTrue(second_page.has_previous())
+        page = paginator.page(second_page.previous_cursor)
+        self.assertEqual(list(page), list(first_page))
+        self.assertFalse(page.has_previous())
+        self.assertTrue(page.has_next())
+
+    def test_invalid_cursor_gives_first_page(self):
+        qs, meta_data = self.get_search_results()
+        paginator = KeysetPaginator(qs, 2, meta_data['keyset_ordering'])
+        page = paginator.page(encode_cursor('next', ['not a date', 1]))
+        self.assertEqual(list(page), list(paginator.page()))
+
+    def test_thread_listing_pages(self):
+        backup = getattr(django_settings, 'ASKBOT_THREAD_LISTING_ENABLED', False)
+        django_settings.ASKBOT_THREAD_LISTING_ENABLED = True
+        try:
+            for question in self.questions:
+                Thread.objects.get(id=question.thread_id).save()
+            expected_qs, meta_data = self.get_search_results()
+            expected_ids = [thread.id for thread in expected_qs]
+        finally:
+            django_settings.ASKBOT_THREAD_LISTING_ENABLED = backup
+
+        self.assertEqual(meta_data['keyset_ordering'], ('-last_activity_at', '-thread'))
+        thread_ids, last_page = self.get_all_thread_ids(
+                                    expected_qs, meta_data['keyset_ordering']
+                                )
+        self.assertEqual(thread_ids, expected_ids)
+
+    def test_search_state_cursor(self):
+        ss = SearchState.get_empty().change_cursor('abc-_1')
+        self.assertEqual(
+            ss.query_string(),
+            'scope:all/sort:activity-desc/page:1/cursor:abc-_1/'
+        )
+        self.assertEqual(ss.change_sort('age-desc').cursor, None)
+        self.assertEqual(ss.add_tag('tag').cursor, None)
+
+    def test_api_questions(self):
+        backup = getattr(django_settings, 'ASKBOT_KEYSET_PAGINATION_ENABLED', False)
+        django_settings.ASKBOT_KEYSET_PAGINATION_ENABLED = True
+        try:
+            response = self.client.get(reverse('api_v1_questions'))
+            data = simplejson.loads(response.content)
+            self.assertEqual(set(data.keys()), set(['count', 'next', 'previous', 'questions']))
+            self.assertEqual(data['count'], 5)
+            self.assertEqual(data['next'], None)
+        finally:
+            django_settings.ASKBOT_KEYSET_PAGINATION_ENABLED = backup
+
+    @with_settings(DEFAULT_QUESTIONS_PAGE_SIZE=2)
+    def test_main_page_loads(self):
+        backup = getattr(django_settings, 'ASKBOT_KEYSET_PAGINATION_ENABLED', False)
+        django_settings.ASKBOT_KEYSET_PAGINATION_ENABLED = True
+        try:
+            search_state = SearchState.get_empty().change_sort('age-desc')
+            response = self.client.get(search_state.full_url())
+            self.assertEqual(response.status_code, 200)
+            page = response.context['threads']
+            self.assertEqual(len(page), 2)
+            self.assertTrue(page.has_next())
+            next_url = search_state.change_cursor(page.next_cursor).full_url()
+            self.assertContains(response, next_url)
+
+            response = self.client.get(next_url)
+            self.assertEqual(response.status_code, 200)
+            page = response.context['threads']
+            self.assertEqual(
+                [thread.id for thread in page],
+                [self.questions[2].thread_id, self.questions[1].thread_id]
+            )
+        finally:
+            django_settings.ASKBOT_KEYSET_PAGINATION_ENABLED = backup
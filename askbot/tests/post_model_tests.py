@@ -8,12 +8,15 @@ from django.core import cache, urlresolvers
 from django.core.cache.backends.dummy import DummyCache
 from django.core.cache.backends.locmem import LocMemCache
 
+from django.conf import settings as django_settings
 from django.core.exceptions import ValidationError
 from django.template.loader import get_template
 from askbot.tests.utils import AskbotTestCase
+from askbot.tests.utils import with_settings
 from askbot.models import Post
 from askbot.models import PostRevision
 from askbot.models import Thread
+from askbot.models import ThreadListing
 from askbot.models import Tag
 from askbot.models import Group
 from askbot.search.state_manager import DummySearchState
@@ -286,6 +289,32 @@ class ThreadTagModelsTests(AskbotTestCase):
             self.assertEqual(post, thread._question_cache)
             self.assertTrue(thread._question_post() is thread._question_cache)
 
+    def test_filter_by_all_tags(self):
+        threads = Thread.objects.filter_by_all_tags(['tag1', 'tag3'])
+        self.assertEqual(
+            set(threads.values_list('id', flat=True)),
+            set([self.q1.thread_id, self.q4.thread_id])
+        )
+        threads = Thread.objects.filter_by_all_tags(['tag3', 'tag4', 'tag6'])
+        self.assertEqual(list(threads), [self.q4.thread])
+
+    @with_settings(TAG_SEARCH_INPUT_ENABLED=True)
+    def test_search_tag_names_are_resolved_ignoring_case(self):
+        self.assertEqual(
+            Tag.objects.get_names_map_iexact(['TAG1', 'Tag2', 'nosuchtag']),
+            {'tag1': 'tag1', 'tag2': 'tag2'}
+        )
+        ss = SearchState.get_empty().add_tag('TAG1').add_tag('nosuchtag')
+        qs, meta_data = Thread.objects.run_advanced_search(
+                                    request_user=self.user, search_state=ss
+                                )
+        self.assertEqual(meta_data['non_existing_tags'], ['nosuchtag'])
+        ss = SearchState.get_empty().add_tag('TAG1').add_tag('tag4')
+        qs, meta_data = Thread.objects.run_advanced_search(
+                                    request_user=self.user, search_state=ss
+                                )
+        self.assertEqual([thread.id for thread in qs], [self.q4.thread_id])
+
     def test_thread_caching_2_precache_view_data_hack(self):
         ss = SearchState.get_empty()
         qs, meta_data = Thread.objects.run_advanced_search(request_user=self.user, search_state=ss)
@@ -304,6 +333,73 @@ class ThreadTagModelsTests(AskbotTestCase):
             self.assertTrue(thread.last_activity_by is thread._last_activity_by_cache)
 
 
+class ThreadListingSearchTests(AskbotTestCase):
+
+    def setUp(self):
+        self.listing_enabled_backup = getattr(
+                            django_settings,
+                            'ASKBOT_THREAD_LISTING_ENABLED',
+                            False
+                        )
+        django_settings.ASKBOT_THREAD_LISTING_ENABLED = True
+        self.create_user()
+        user2 = self.create_user(username='user2')
+        self.q1 = self.post_question(tags='tag1 tag2 tag3')
+        self.q2 = self.post_question(tags='tag3 tag4')
+        self.q3 = self.post_question(tags='tag1', user=user2)
+        self.post_answer(user=user2, question=self.q2)
+
+    def tearDown(self):
+        django_settings.ASKBOT_THREAD_LISTING_ENABLED = self.listing_enabled_backup
+
+    def run_search(self, search_state):
+        return Thread.objects.run_advanced_search(
+                            request_user=self.user,
+                            search_state=search_state
+                        )
+
+    def test_listing_is_maintained(self):
+        self.assertEqual(ThreadListing.objects.count(), 3)
+        listing = ThreadListing.objects.get(thread=self.q2.thread)
+        tag_ids = Tag.objects.filter(
+                            name__in=('tag3', 'tag4')
+                        ).values_list('id', flat=True)
+        self.assertEqual(set(listing.get_tag_ids()), set(tag_ids))
+        self.assertEqual(listing.answer_count, 1)
+
+        self.user.delete_question(self.q1)
+        self.assertEqual(ThreadListing.objects.count(), 2)
+
+    def test_search_is_served_by_listing(self):
+        ss = SearchState.get_empty().change_sort('age-desc')
+        self.assertTrue(
+            ThreadListing.objects.can_run_search(self.user, ss)
+        )
+        threads, meta_data = self.run_search(ss)
+        self.assertEqual(threads.count(), 3)
+        self.assertEqual(
+            [thread.id for thread in threads],
+            [self.q3.thread_id, self.q2.thread_id, self.q1.thread_id]
+        )
+
+    def test_tags_are_and_ed(self):
+        ss = SearchState.get_empty()
+        threads, meta_data = self.run_search(ss.add_tag('tag1'))
+        self.assertEqual(len(threads), 2)
+        threads, meta_data = self.run_search(ss.add_tag('tag1').add_tag('tag3'))
+        self.assertEqual(len(threads), 1)
+        self.assertEqual(threads[0].id, self.q1.thread_id)
+
+    @with_settings(UNANSWERED_QUESTION_MEANING='NO_ANSWERS')
+    def test_unanswered_scope(self):
+        ss = SearchState.get_empty().change_scope('unanswered')
+        threads, meta_data = self.run_search(ss)
+        self.assertEqual(
+            set([thread.id for thread in threads]),
+            set([self.q1.thread_id, self.q3.thread_id])
+        )
+
+
 class ThreadRenderLowLevelCachingTests(AskbotTestCase):
     def setUp(self):
         self.create_user()
@@ -368,7 +464,7 @@ class ThreadRenderLowLevelCachingTests(AskbotTestCase):
         cache.cache = LocMemCache('', {})  # Enable local caching
 
         thread = self.q.thread
-        key = Thread.SUMMARY_CACHE_KEY_TPL % (thread.id, 'en')
+        key = thread.get_summary_cache_key()
 
         self.assertTrue(thread.summary_html_cached())
         self.assertIsNotNone(thread.get_cached_summary_html())
@@ -424,6 +520,59 @@ class ThreadRenderLowLevelCachingTests(AskbotTestCase):
             thread.get_summary_html(search_state=SearchState.get_empty())
         )
 
+    def test_cache_generation_invalidates_thread_fragments(self):
+        cache.cache = LocMemCache('thread-render-cache-tests', {})
+        cache.cache.clear()
+
+        thread = self.q.thread
+        thread.update_summary_html()
+        thread.get_cached_post_data()
+        self.assertTrue(thread.summary_html_cached())
+        self.assertTrue(cache.cache.has_key(thread.get_post_data_cache_key(
+            askbot_settings.DEFAULT_ANSWER_SORT_METHOD
+        )))
+
+        thread.invalidate_cached_data(lazy=True)
+        self.assertFalse(thread.summary_html_cached())
+        self.assertFalse(cache.cache.has_key(thread.get_post_data_cache_key(
+            askbot_settings.DEFAULT_ANSWER_SORT_METHOD
+        )))
+
+        #generations of the page of threads are read at once
+        thread = Thread.objects.get(id=thread.id)
+        generation = thread.get_cache_generation()
+        thread = Thread.objects.get(id=thread.id)
+        Thread.objects.precache_cache_generations([thread])
+        self.assertEqual(thread._cache_generation, generation)
+        thread.bump_cache_generation()
+        self.assertEqual(thread.get_cache_generation(), generation + 1)
+
+    def test_get_summaries_html(self):
+        cache.cache = LocMemCache('thread-render-cache-tests', {})
+        cache.cache.clear()
+        other_question = self.post_question(title='other question', tags='tag4')
+        threads = [self.q.thread, other_question.thread]
+        for thread in threads:
+            thread.invalidate_cached_data(lazy=True)
+
+        ss = SearchState.get_empty()
+        threads = list(Thread.objects.filter(id__in=[t.id for t in threads]))
+        Thread.objects.precache_view_data_hack(threads=threads)
+        stats = Thread.objects.get_summary_cache_stats()
+        summaries = Thread.objects.get_summaries_html(threads, search_state=ss)
+        self.assertEqual(
+            summaries,
+            [thread.get_summary_html(search_state=ss) for thread in threads]
+        )
+        self.assertFalse('<<<tag1>>>' in summaries[0] + summaries[1])
+        self.assertTrue(ss.add_tag('tag4').full_url() in ''.join(summaries))
+
+        #the second page load is served from the cache
+        Thread.objects.get_summaries_html(threads, search_state=ss)
+        new_stats = Thread.objects.get_summary_cache_stats()
+        self.assertEqual(new_stats['misses'] - stats['misses'], 2)
+        self.assertEqual(new_stats['hits'] - stats['hits'], 2)
+
 
 
 class ThreadRenderCacheUpdateTests(AskbotTestCase):
@@ -439,7 +588,11 @@ class ThreadRenderCacheUpdateTests(AskbotTestCase):
         self.user2.save()
 
         self.old_cache = cache.cache
-        cache.cache = LocMemCache('', {})  # Enable local caching
+        # Enable local caching, with separate storage - locmem caches
+        # with the same name share it, and the default cache is filled
+        # by the livesettings, so the entries get culled at random
+        cache.cache = LocMemCache('thread-render-cache-tests', {})
+        cache.cache.clear()
 
     def tearDown(self):
         cache.cache = self.old_cache  # Restore caching
@@ -291,3 +291,17 @@ class SearchStateTests(AskbotTestCase):
         )
 
 
+
+    def test_tag_url_formatter(self):
+        states = (
+            SearchState.get_empty(),
+            SearchState(
+                scope='unanswered', sort='votes-desc', query='some [tag:qtag] query',
+                tags='one,two', author='5', page='3', cursor='abc',
+                user_logged_in=False
+            ),
+        )
+        for ss in states:
+            formatter = ss.get_tag_url_formatter()
+            for tag in ('one', 'new-tag', u'\u0442\u0435\u0433', 'c++', 'c#'):
+                self.assertEqual(formatter.get_url(tag), ss.add_tag(tag).full_url())
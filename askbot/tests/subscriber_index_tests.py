@@ -0,0 +1,174 @@
+from django.conf import settings as django_settings
+from django.core import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import TestCase
+from askbot import const
+from askbot.conf import settings as askbot_settings
+from askbot.mail import subscriber_index
+from askbot.tests.utils import AskbotTestCase
+
+
+class SubscriberIndexTests(TestCase):
+
+    def setUp(self):
+        self.index = subscriber_index.SubscriberIndex()
+        self.index.load(
+            [
+                (1, const.INCLUDE_ALL, '', '', ''),
+                (2, const.INCLUDE_INTERESTING, 'py*', '', ''),
+                (3, const.INCLUDE_INTERESTING, '', '', ''),
+                (4, const.EXCLUDE_IGNORED, '', 'java*', ''),
+                (5, const.EXCLUDE_IGNORED, '', '', ''),
+            ],
+            #user id, tag id, reason
+            [(3, 10, 'good'), (5, 20, 'bad'), (1, 20, 'bad')]
+        )
+
+    def get_ids(self, reason, tag_names, tag_ids):
+        return self.index.get_tag_based_subscriber_ids(
+                                reason,
+                                tag_ids,
+                                tag_names=tag_names,
+                                use_wildcards=True
+                            )
+
+    def test_wildcard_trie(self):
+        trie = subscriber_index.WildcardTrie()
+        trie.add('py', 1)
+        trie.add('python', 2)
+        trie.add('ja', 3)
+        self.assertEqual(trie.match('python3'), set([1, 2]))
+        self.assertEqual(trie.match('pyramid'), set([1]))
+        self.assertEqual(trie.match('p'), set())
+        trie.remove('python', 2)
+        self.assertEqual(trie.match('python3'), set([1]))
+        self.assertFalse('t' in trie.root['p']['y'])
+        trie.remove('ja', 3)
+        self.assertFalse('j' in trie.root)
+
+    def test_get_tag_based_subscriber_ids(self):
+        self.assertEqual(self.get_ids('good', ['django'], [10]), set([3]))
+        self.assertEqual(self.get_ids('good', ['python'], [30]), set([2]))
+        self.assertEqual(self.get_ids('good', ['python'], [10]), set([2, 3]))
+        #user 1 does not use the tag filter
+        self.assertEqual(self.get_ids('bad', ['python'], [30]), set([4, 5]))
+        self.assertEqual(self.get_ids('bad', ['javascript'], [20]), set())
+        self.assertEqual(
+            self.index.get_subscriber_ids(
+                            [20], tag_names=['javascript'], use_wildcards=True
+                        ),
+            set([1])
+        )
+
+    def test_update_user(self):
+        self.index.add_user(4, const.INCLUDE_INTERESTING, 'ja*', '', '')
+        self.assertEqual(self.get_ids('bad', ['javascript'], [30]), set([5]))
+        self.assertEqual(self.get_ids('good', ['javascript'], [30]), set([4]))
+        self.index.remove_user(3)
+        self.assertEqual(self.get_ids('good', ['django'], [10]), set())
+        self.assertFalse(10 in self.index.tag_subscribers['good'])
+
+
+class SubscriberIndexQueryTests(AskbotTestCase):
+
+    def setUp(self):
+        self.enabled_backup = getattr(
+                    django_settings, 'ASKBOT_SUBSCRIBER_INDEX_ENABLED', False
+                )
+        django_settings.ASKBOT_SUBSCRIBER_INDEX_ENABLED = True
+        self.old_cache = cache.cache
+        cache.cache = LocMemCache('subscriber-index-tests', {})
+        subscriber_index.shared_index.invalidate()
+        self.wildcards_backup = askbot_settings.USE_WILDCARD_TAGS
+        askbot_settings.update('USE_WILDCARD_TAGS', True)
+
+        schedule = {'q_all': 'i'}
+        self.author = self.create_user('author', notification_schedule={'q_all': 'n'})
+        self.u1 = self.create_user('user1', notification_schedule=schedule)
+        self.u2 = self.create_user('user2', notification_schedule=schedule)
+        self.u3 = self.create_user('user3', notification_schedule=schedule)
+        self.question = self.post_question(user=self.author, tags='python django')
+
+    def tearDown(self):
+        django_settings.ASKBOT_SUBSCRIBER_INDEX_ENABLED = self.enabled_backup
+        askbot_settings.update('USE_WILDCARD_TAGS', self.wildcards_backup)
+        subscriber_index.shared_index.invalidate()
+        cache.cache = self.old_cache
+
+    def set_strategy(self, user, strategy):
+        user.email_tag_filter_strategy = strategy
+        user.save()
+
+    def assert_subscribers_match_database(self, expected_subscribers):
+        subscribers = self.question.get_global_instant_notification_subscribers()
+        django_settings.ASKBOT_SUBSCRIBER_INDEX_ENABLED = False
+        try:
+            database_subscribers = \
+                self.question.get_global_instant_notification_subscribers()
+        finally:
+            django_settings.ASKBOT_SUBSCRIBER_INDEX_ENABLED = True
+        self.assertEqual(subscribers, database_subscribers)
+        self.assertEqual(subscribers, set(expected_subscribers))
+
+    def test_subscribers(self):
+        self.set_strategy(self.u1, const.INCLUDE_ALL)
+        self.set_strategy(self.u2, const.INCLUDE_INTERESTING)
+        self.set_strategy(self.u3, const.EXCLUDE_IGNORED)
+        self.assert_subscribers_match_database([self.u1, self.u3])
+
+        index = subscriber_index.shared_index.get()
+        self.u2.mark_tags(tagnames=('django',), reason='good', action='add')
+        self.u3.mark_tags(wildcards=('py*',), reason='bad', action='add')
+        self.assert_subscribers_match_database([self.u1, self.u2])
+        #changes are applied to the local copy of the index
+        self.assertTrue(subscriber_index.shared_index.get() is index)
+
+        self.u3.mark_tags(wildcards=('py*',), reason='bad', action='remove')
+        self.u2.mark_tags(tagnames=('django',), reason='good', action='remove')
+        self.u2.mark_tags(wildcards=('dj*',), reason='good', action='add')
+        self.assert_subscribers_match_database([self.u1, self.u2, self.u3])
+
+        self.u1.notification_subscriptions.filter(
+                                    feed_type='q_all'
+                                ).update(frequency='d')
+        #update does not send the signals
+        subscriber_index.shared_index.invalidate()
+        self.assert_subscribers_match_database([self.u2, self.u3])
+
+    def test_subscription_change(self):
+        self.set_strategy(self.u2, const.INCLUDE_INTERESTING)
+        self.u2.mark_tags(tagnames=('python',), reason='good', action='add')
+        self.assert_subscribers_match_database([self.u1, self.u2, self.u3])
+
+        feed = self.u2.notification_subscriptions.get(feed_type='q_all')
+        feed.frequency = 'w'
+        feed.save()
+        self.assert_subscribers_match_database([self.u1, self.u3])
+        feed.frequency = 'i'
+        feed.save()
+        self.assert_subscribers_match_database([self.u1, self.u2, self.u3])
+
+    def test_changes_from_other_process(self):
+        #index of another process
+        peer = subscriber_index.SharedSubscriberIndex()
+        peer_index = peer.get()
+        self.set_strategy(self.u2, const.INCLUDE_INTERESTING)
+        self.u2.mark_tags(tagnames=('python',), reason='good', action='add')
+        self.assertTrue(peer.get() is peer_index)
+        self.assertEqual(peer_index.users[self.u2.id].strategy, const.INCLUDE_INTERESTING)
+        self.assertEqual(len(peer_index.users[self.u2.id].marks), 1)
+
+        feed = self.u2.notification_subscriptions.get(feed_type='q_all')
+        feed.frequency = 'd'
+        feed.save()
+        self.assertTrue(peer.get() is peer_index)
+        self.assertFalse(self.u2.id in peer_index.users)
+
+    def test_changes_of_non_subscribers_are_not_published(self):
+        generation = subscriber_index.shared_index.get_cached_generation()
+        self.set_strategy(self.author, const.INCLUDE_INTERESTING)
+        self.author.mark_tags(tagnames=('python',), reason='good', action='add')
+        self.assertEqual(
+            subscriber_index.shared_index.get_cached_generation(),
+            generation
+        )
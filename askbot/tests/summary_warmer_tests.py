@@ -0,0 +1,97 @@
+import datetime
+from StringIO import StringIO
+from django.conf import settings as django_settings
+from django.core import cache
+from django.core import management
+from django.core.cache.backends.locmem import LocMemCache
+from askbot.tests.utils import AskbotTestCase
+from askbot.tests.utils import with_settings
+from askbot.models import Thread
+from askbot.models import ThreadSummaryUpdate
+from askbot.utils import summary_warmer
+
+
+class SummaryWarmerTests(AskbotTestCase):
+
+    def setUp(self):
+        self.enabled_backup = getattr(django_settings, 'ASKBOT_SUMMARY_WARMER_ENABLED', False)
+        django_settings.ASKBOT_SUMMARY_WARMER_ENABLED = True
+        self.old_cache = cache.cache
+        cache.cache = LocMemCache('summary-warmer-tests', {})
+        cache.cache.clear()
+        self.create_user()
+        self.create_user(username='voter')
+        self.voter.reputation = 10000
+        self.voter.save()
+        self.q1 = self.post_question(title='first question')
+        self.q2 = self.post_question(title='second question')
+        ThreadSummaryUpdate.objects.all().delete()
+        cache.cache.clear()
+
+    def tearDown(self):
+        django_settings.ASKBOT_SUMMARY_WARMER_ENABLED = self.enabled_backup
+        cache.cache = self.old_cache
+
+    def reload_thread(self, question):
+        return Thread.objects.get(id=question.thread_id)
+
+    def test_vote_marks_thread(self):
+        self.voter.upvote(self.q1)
+        thread = self.reload_thread(self.q1)
+        self.assertFalse(thread.summary_html_cached())
+        self.assertEqual(
+            list(ThreadSummaryUpdate.objects.values_list('thread__id', flat=True)),
+            [thread.id]
+        )
+        #repeated marks are merged
+        self.voter.downvote(self.q1)
+        self.assertEqual(ThreadSummaryUpdate.objects.count(), 1)
+
+    def test_warm_renders_marked_summaries(self):
+        summary_warmer.mark_dirty([self.q1.thread_id, self.q2.thread_id])
+        self.assertEqual(summary_warmer.get_stats()['depth'], 2)
+        self.assertEqual(summary_warmer.warm(), 2)
+        self.assertEqual(ThreadSummaryUpdate.objects.count(), 0)
+        self.assertEqual(summary_warmer.get_stats(), {'depth': 0, 'lag': 0})
+        for question in (self.q1, self.q2):
+            thread = self.reload_thread(question)
+            self.assertTrue(thread.summary_html_cached())
+            self.assertTrue(thread.title in thread.get_cached_summary_html())
+
+    def test_priority_order(self):
+        now = datetime.datetime.now()
+        week_ago = now - datetime.timedelta(days=7)
+        Thread.objects.filter(id=self.q1.thread_id).update(
+                                last_activity_at=week_ago, view_count=1000
+                            )
+        Thread.objects.filter(id=self.q2.thread_id).update(
+                                last_activity_at=now, view_count=0
+                            )
+        summary_warmer.mark_dirty([self.q1.thread_id, self.q2.thread_id])
+        self.assertEqual(
+            [thread_id for language, thread_id in summary_warmer.get_dirty_threads()],
+            [self.q2.thread_id, self.q1.thread_id]
+        )
+        summary_warmer.warm(limit=1)
+        self.assertEqual(
+            list(ThreadSummaryUpdate.objects.values_list('thread__id', flat=True)),
+            [self.q1.thread_id]
+        )
+        self.assertTrue(
+            summary_warmer.get_priority(now, 10, now) > \
+            summary_warmer.get_priority(now, 1, now)
+        )
+
+    @with_settings(GROUPS_ENABLED=False)
+    def test_warm_command(self):
+        summary_warmer.mark_dirty([self.q1.thread_id])
+        output = StringIO()
+        management.call_command('warm_summary_cache', stdout=output)
+        self.assertTrue('Rendered 1 summaries' in output.getvalue())
+        self.assertTrue('Marked questions: 0' in output.getvalue())
+
+    def test_build_command(self):
+        output = StringIO()
+        management.call_command('build_thread_summary_cache', stdout=output)
+        self.assertTrue('Rendered 2 summaries' in output.getvalue())
+        self.assertTrue(self.reload_thread(self.q2).summary_html_cached())
@@ -0,0 +1,186 @@
+from django.conf import settings as django_settings
+from django.core import management
+from django.test import TestCase
+from askbot.tests.utils import AskbotTestCase
+from askbot.models import SimilarThread, Tag, Thread
+from askbot.search import tag_index
+
+
+class TagIndexTests(TestCase):
+
+    def setUp(self):
+        self.index = tag_index.TagIndex()
+        #thread id, tag id
+        self.index.load([
+            (1, 10), (1, 20), (1, 30),
+            (2, 20), (2, 30),
+            (3, 30),
+            (4, 10), (4, 30),
+        ])
+
+    def test_intersect(self):
+        self.assertEqual(self.index.intersect([30]), [1, 2, 3, 4])
+        self.assertEqual(self.index.intersect([10, 30]), [1, 4])
+        self.assertEqual(self.index.intersect([10, 20, 30]), [1])
+        self.assertEqual(self.index.intersect([10, 99]), [])
+        self.assertEqual(self.index.intersect([]), [])
+
+    def test_union(self):
+        self.assertEqual(self.index.union([10, 20]), [1, 2, 4])
+        self.assertEqual(self.index.union([99]), [])
+
+    def test_count_tags(self):
+        self.assertEqual(
+            self.index.count_tags([1, 2]),
+            {10: 1, 20: 2, 30: 2}
+        )
+        self.assertEqual(
+            self.index.count_cooccurring_tags([10]),
+            {20: 1, 30: 2}
+        )
+
+    def test_update_thread(self):
+        self.index.update_thread(3, [10, 40])
+        self.assertEqual(list(self.index.get_thread_ids(10)), [1, 3, 4])
+        self.assertEqual(list(self.index.get_thread_ids(30)), [1, 2, 4])
+        self.assertEqual(list(self.index.get_thread_ids(40)), [3])
+        self.index.update_thread(5, [40])
+        self.assertEqual(list(self.index.get_thread_ids(40)), [3, 5])
+        self.index.remove_thread(3)
+        self.assertEqual(list(self.index.get_tag_ids(3)), [])
+        self.assertEqual(list(self.index.get_thread_ids(40)), [5])
+
+    def test_get_similar_threads(self):
+        #thread 2 shares 2 of 3 tags with thread 1,
+        #thread 4 - 2 of 3, thread 3 - 1 of 3
+        self.assertEqual(
+            self.index.get_similar_threads(1),
+            [(4, 2.0/3), (2, 2.0/3), (3, 1.0/3)]
+        )
+        self.assertEqual(
+            self.index.get_similar_threads(1, count=1, excluded_ids=set([4])),
+            [(2, 2.0/3)]
+        )
+        self.assertEqual(self.index.get_similar_threads(99), [])
+
+
+class TagIndexSearchTests(AskbotTestCase):
+
+    def setUp(self):
+        self.enabled_backup = getattr(django_settings, 'ASKBOT_TAG_INDEX_ENABLED', False)
+        django_settings.ASKBOT_TAG_INDEX_ENABLED = True
+        tag_index.shared_index.invalidate()
+        self.create_user()
+        self.q1 = self.post_question(tags='tag1 tag2 tag3')
+        self.q2 = self.post_question(tags='tag3 tag4')
+        self.q3 = self.post_question(tags='tag1 tag3')
+
+    def tearDown(self):
+        django_settings.ASKBOT_TAG_INDEX_ENABLED = self.enabled_backup
+
+    def get_thread_ids(self, tag_names):
+        threads = Thread.objects.filter_by_all_tags(tag_names)
+        return set(threads.values_list('id', flat=True))
+
+    def test_filter_by_all_tags(self):
+        self.assertEqual(
+            self.get_thread_ids(['tag1', 'tag3']),
+            set([self.q1.thread_id, self.q3.thread_id])
+        )
+        self.assertEqual(self.get_thread_ids(['tag1', 'nosuchtag']), set())
+
+    def test_index_follows_retag(self):
+        #build the index, then retag
+        self.assertEqual(self.get_thread_ids(['tag4']), set([self.q2.thread_id]))
+        self.user.retag_question(question=self.q3, tags='tag4 tag5')
+        self.assertEqual(
+            self.get_thread_ids(['tag4']),
+            set([self.q2.thread_id, self.q3.thread_id])
+        )
+        self.assertEqual(self.get_thread_ids(['tag1']), set([self.q1.thread_id]))
+
+    def test_other_processes_apply_changes(self):
+        #index of another process
+        peer = tag_index.SharedTagIndex()
+        peer_index = peer.get()
+        self.user.retag_question(question=self.q3, tags='tag4 tag5')
+        self.assertTrue(peer.get() is peer_index)
+        self.assertEqual(
+            set(peer_index.get_thread_ids(Tag.objects.get(name='tag4').id)),
+            set([self.q2.thread_id, self.q3.thread_id])
+        )
+        #missed changes are not in the log
+        tag_index.shared_index.invalidate()
+        self.assertFalse(peer.get() is peer_index)
+
+    def test_related_tags_match_database_counts(self):
+        threads = [self.q1.thread, self.q2.thread]
+        tags = Tag.objects.get_related_to_search(
+                                threads=threads, ignored_tag_names=['tag2']
+                            )
+        django_settings.ASKBOT_TAG_INDEX_ENABLED = False
+        expected_tags = Tag.objects.get_related_to_search(
+                                threads=threads, ignored_tag_names=['tag2']
+                            )
+        self.assertEqual(
+            [(tag.name, tag.local_used_count) for tag in tags],
+            [(tag.name, tag.local_used_count) for tag in expected_tags]
+        )
+
+
+class SimilarThreadTests(AskbotTestCase):
+
+    def setUp(self):
+        self.enabled_backup = getattr(
+                        django_settings,
+                        'ASKBOT_SIMILAR_THREADS_INDEX_ENABLED',
+                        False
+                    )
+        django_settings.ASKBOT_SIMILAR_THREADS_INDEX_ENABLED = True
+        tag_index.shared_index.invalidate()
+        self.create_user()
+        self.q1 = self.post_question(tags='tag1 tag2 tag3')
+        self.q2 = self.post_question(tags='tag1 tag2')
+        self.q3 = self.post_question(tags='tag3 tag4')
+        self.q4 = self.post_question(tags='tag5')
+
+    def tearDown(self):
+        django_settings.ASKBOT_SIMILAR_THREADS_INDEX_ENABLED = self.enabled_backup
+
+    def get_similar_thread_ids(self, question):
+        thread = Thread.objects.get(id=question.thread_id)
+        threads = SimilarThread.objects.get_similar_threads(thread)
+        return [thread.id for thread in threads]
+
+    def test_build_similar_threads(self):
+        SimilarThread.objects.all().delete()
+        management.call_command('build_similar_threads')
+        self.assertEqual(
+            self.get_similar_thread_ids(self.q1),
+            [self.q2.thread_id, self.q3.thread_id]
+        )
+        self.assertEqual(self.get_similar_thread_ids(self.q4), [])
+
+    def test_retag_updates_similar_threads(self):
+        management.call_command('build_similar_threads')
+        self.user.retag_question(question=self.q4, tags='tag1 tag2')
+        self.assertEqual(
+            self.get_similar_thread_ids(self.q4),
+            [self.q2.thread_id, self.q1.thread_id]
+        )
+        self.assertEqual(
+            self.get_similar_thread_ids(self.q2),
+            [self.q4.thread_id, self.q1.thread_id]
+        )
+
+    def test_deleted_threads_are_not_shown(self):
+        management.call_command('build_similar_threads')
+        self.user.delete_question(self.q2)
+        self.assertEqual(self.get_similar_thread_ids(self.q1), [self.q3.thread_id])
+
+    def test_thread_sidebar_data(self):
+        management.call_command('build_similar_threads')
+        thread = Thread.objects.get(id=self.q2.thread_id)
+        similar_threads = thread.get_similar_threads().data()
+        self.assertEqual(len(similar_threads), 1)
+        self.assertEqual(similar_threads[0]['title'], self.q1.thread.title)
@@ -126,3 +126,34 @@ class ThreadModelTestsWithGroupsEnabled(AskbotTestCase):
         answer_groups = set(answer.groups.all())
         user_groups = set(self.user.get_groups())
         self.assertEqual(len(answer_groups & user_groups), 1)
+
+    def test_post_data_cache_is_shared_by_group_members(self):
+        question = self.post_question(user=self.user, group_id=self.group.id)
+        thread = question.thread
+        other_admin = self.create_user('other_admin', status='d')
+        other_admin.join_group(self.group)
+        #personal groups of the members do not split the cache
+        self.assertEqual(
+            thread.get_post_data_visibility_key(self.admin),
+            thread.get_post_data_visibility_key(other_admin)
+        )
+        self.assertNotEqual(
+            thread.get_post_data_visibility_key(self.admin),
+            thread.get_post_data_visibility_key(None)
+        )
+
+    def test_cached_post_data_follows_group_changes(self):
+        question = self.post_question(user=self.user)
+        answer = self.post_answer(
+            user=self.admin,
+            question=question,
+            is_private=True
+        )
+        thread = question.thread
+        self.assertEqual(len(thread.get_cached_post_data(user=self.user)[1]), 0)
+        self.assertEqual(len(thread.get_cached_post_data(user=self.admin)[1]), 1)
+        #answer is published to everyone
+        self.admin.edit_answer(answer, is_private=False)
+        thread = self.reload_object(thread)
+        self.assertEqual(len(thread.get_cached_post_data(user=self.user)[1]), 1)
+        self.assertEqual(len(thread.get_cached_post_data(user=None)[1]), 1)
@@ -0,0 +1,91 @@
+from StringIO import StringIO
+from django.core import cache
+from django.core import management
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.urlresolvers import reverse
+from django.db import connection
+from askbot.tests.utils import AskbotTestCase
+from askbot.tests.utils import with_settings
+from askbot.models import Thread
+
+
+class ThreadQuestionPostTests(AskbotTestCase):
+
+    def setUp(self):
+        self.old_cache = cache.cache
+        cache.cache = LocMemCache('thread-question-post-tests', {})
+        cache.cache.clear()
+        self.create_user()
+
+    def tearDown(self):
+        cache.cache = self.old_cache
+
+    def count_queries(self, url, **data):
+        #render the question summaries, etc. again
+        for thread in Thread.objects.all():
+            thread.invalidate_cached_data(lazy=True)
+        debug_cursor_backup = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        try:
+            #the query log is reset when the request starts
+            response = self.client.get(url, data)
+            self.assertEqual(response.status_code, 200)
+            #live settings are re-read at random
+            return len([
+                query for query in connection.queries \
+                    if 'livesettings_' not in query['sql'] \
+                        and 'django_session' not in query['sql']
+            ])
+        finally:
+            connection.use_debug_cursor = debug_cursor_backup
+
+    def post_questions(self, number):
+        for idx in range(number):
+            self.post_question(title='question number %d' % idx, tags='one two')
+
+    def test_new_thread_has_question_post(self):
+        question = self.post_question()
+        thread = Thread.objects.get(id=question.thread_id)
+        self.assertEqual(thread.question_post_id, question.id)
+        self.assertEqual(thread._question_post(), question)
+
+    def test_absolute_url(self):
+        question = self.post_question(title='what is askbot')
+        thread = Thread.objects.get(id=question.thread_id)
+        self.assertEqual(thread.get_absolute_url(), question.get_absolute_url())
+
+    def test_fix_command(self):
+        questions = [self.post_question(), self.post_question()]
+        Thread.objects.update(question_post=None)
+        thread = Thread.objects.get(id=questions[0].thread_id)
+        #legacy threads still work
+        self.assertEqual(thread._question_post(), questions[0])
+        self.assertEqual(thread.get_absolute_url(), questions[0].get_absolute_url())
+
+        output = StringIO()
+        management.call_command('fix_thread_question_posts', batch_size=1, stdout=output)
+        self.assertTrue('Threads without question post: 0' in output.getvalue())
+        for question in questions:
+            thread = Thread.objects.get(id=question.thread_id)
+            self.assertEqual(thread.question_post_id, question.id)
+
+    def assert_query_count_does_not_grow(self, url):
+        self.post_questions(2)
+        #the first request loads the settings, etc.
+        self.count_queries(url)
+        expected_count = self.count_queries(url)
+        self.post_questions(3)
+        self.assertEqual(self.count_queries(url), expected_count)
+
+    @with_settings(GROUPS_ENABLED=False)
+    def test_main_page_query_count(self):
+        self.assert_query_count_does_not_grow(reverse('questions'))
+
+    def test_api_query_count(self):
+        self.assert_query_count_does_not_grow(reverse('api_v1_questions'))
+
+    @with_settings(GROUPS_ENABLED=False)
+    def test_question_page_query_count(self):
+        #similar questions are listed on the question page
+        question = self.post_question(tags='one two')
+        self.assert_query_count_does_not_grow(question.get_absolute_url())
@@ -0,0 +1,97 @@
+import datetime
+from StringIO import StringIO
+from django.conf import settings as django_settings
+from django.core import management
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.utils import simplejson
+from askbot.tests.utils import AskbotTestCase
+from askbot.tests.utils import with_settings
+from askbot.models import Thread
+from askbot.search import title_index
+
+
+class TitleIndexTests(TestCase):
+
+    def setUp(self):
+        now = datetime.datetime.now()
+        hour_ago = now - datetime.timedelta(hours=1)
+        self.index = title_index.TitleIndex()
+        self.index.load([
+            (1, 'How to install askbot', 'en', 0, hour_ago),
+            (2, 'Installing askbot on windows', 'en', 5, hour_ago),
+            (3, 'Askbot installation', 'en', 0, now),
+            (4, 'Comment installer askbot', 'fr', 10, now),
+        ])
+
+    def test_prefix_search(self):
+        self.assertEqual(self.index.search('inst', 'en'), [2, 3, 1])
+        self.assertEqual(self.index.search('instal ask', 'en', count=2), [2, 3])
+        self.assertEqual(self.index.search('installing win', 'en'), [2])
+        self.assertEqual(self.index.search('inst'), [4, 2, 3, 1])
+        self.assertEqual(self.index.search('linux'), [])
+        self.assertEqual(self.index.search('  '), [])
+
+    def test_update_thread(self):
+        now = datetime.datetime.now()
+        self.index.update_thread(1, 'Upgrading askbot', 'en', 0, now)
+        self.assertEqual(self.index.search('how'), [])
+        self.assertEqual(self.index.search('upg'), [1])
+        self.index.remove_thread(1)
+        self.assertEqual(self.index.search('upg'), [])
+        self.assertFalse('upgrading' in self.index.words)
+
+
+class TitleSuggestionTests(AskbotTestCase):
+
+    def setUp(self):
+        self.enabled_backup = getattr(django_settings, 'ASKBOT_TITLE_INDEX_ENABLED', False)
+        django_settings.ASKBOT_TITLE_INDEX_ENABLED = True
+        title_index.shared_index.invalidate()
+        self.create_user()
+        self.q1 = self.post_question(title='how to install askbot')
+        self.q2 = self.post_question(title='installing askbot on windows')
+        self.q3 = self.post_question(title='unrelated question')
+
+    def tearDown(self):
+        django_settings.ASKBOT_TITLE_INDEX_ENABLED = self.enabled_backup
+
+    def get_suggestions(self, query, **kwargs):
+        data = {'query_text': query}
+        data.update(kwargs)
+        response = self.client.get(reverse('api_get_title_suggestions'), data)
+        self.assertEqual(response.status_code, 200)
+        return simplejson.loads(response.content)
+
+    @with_settings(GROUPS_ENABLED=False)
+    def test_suggestions(self):
+        suggestions = self.get_suggestions('inst ask')
+        self.assertEqual(
+            [item['url'] for item in suggestions],
+            [self.q2.get_absolute_url(), self.q1.get_absolute_url()]
+        )
+        self.assertEqual(len(self.get_suggestions('inst', limit=1)), 1)
+        self.assertEqual(self.get_suggestions(''), [])
+
+    @with_settings(GROUPS_ENABLED=False)
+    def test_index_follows_changes(self):
+        #load the index, then change the titles
+        self.assertEqual(len(self.get_suggestions('inst')), 2)
+        self.edit_question(user=self.user, question=self.q3, title='install on linux')
+        self.assertEqual(len(self.get_suggestions('inst')), 3)
+        self.user.delete_question(self.q1)
+        suggestions = self.get_suggestions('inst')
+        self.assertEqual(len(suggestions), 2)
+        self.assertFalse(self.q1.get_absolute_url() in [item['url'] for item in suggestions])
+
+    @with_settings(GROUPS_ENABLED=False)
+    def test_get_questions_uses_index(self):
+        response = self.client.get(reverse('api_get_questions'), {'query_text': 'askb'})
+        self.assertEqual(len(simplejson.loads(response.content)), 2)
+
+    def test_benchmark_command(self):
+        output = StringIO()
+        management.call_command(
+            'benchmark_title_suggestions', queries=20, concurrency=1, stdout=output
+        )
+        self.assertTrue('Queries: 20' in output.getvalue())
@@ -0,0 +1,77 @@
+from StringIO import StringIO
+from django.conf import settings as django_settings
+from django.core import cache
+from django.core import management
+from django.core.cache.backends.locmem import LocMemCache
+from askbot.conf import settings as askbot_settings
+from askbot.tests.utils import AskbotTestCase
+from askbot.models import Award
+from askbot.models import Thread
+from askbot.utils import view_counter
+from askbot.utils.cache_slots import incr
+
+
+class ViewCounterTests(AskbotTestCase):
+
+    def setUp(self):
+        self.enabled_backup = getattr(django_settings, 'ASKBOT_VIEW_COUNTER_BUFFER_ENABLED', False)
+        django_settings.ASKBOT_VIEW_COUNTER_BUFFER_ENABLED = True
+        self.old_cache = cache.cache
+        cache.cache = LocMemCache('view-counter-tests', {})
+        cache.cache.clear()
+        self.create_user()
+        self.q1 = self.post_question(title='first question')
+        self.q2 = self.post_question(title='second question')
+
+    def tearDown(self):
+        django_settings.ASKBOT_VIEW_COUNTER_BUFFER_ENABLED = self.enabled_backup
+        cache.cache = self.old_cache
+
+    def get_view_count(self, question):
+        return Thread.objects.get(id=question.thread_id).view_count
+
+    def test_flush(self):
+        for idx in range(3):
+            view_counter.record_view(self.q1.thread_id)
+        view_counter.record_view(self.q2.thread_id)
+        self.assertEqual(self.get_view_count(self.q1), 0)
+        self.assertEqual(view_counter.get_stats()['depth'], 2)
+
+        self.assertEqual(view_counter.flush(), 2)
+        self.assertEqual(self.get_view_count(self.q1), 3)
+        self.assertEqual(self.get_view_count(self.q2), 1)
+        self.assertEqual(view_counter.get_stats()['depth'], 0)
+        self.assertEqual(view_counter.flush(), 0)
+
+        view_counter.record_view(self.q2.thread_id)
+        self.assertEqual(view_counter.flush(), 1)
+        self.assertEqual(self.get_view_count(self.q2), 2)
+
+    def test_reserved_slot_is_waited_for_once(self):
+        #slot reserved by a request that did not fill it yet
+        incr(view_counter.pending_threads.last_slot_key)
+        view_counter.record_view(self.q1.thread_id)
+        self.assertEqual(view_counter.flush(), 0)
+        self.assertEqual(view_counter.flush(), 1)
+        self.assertEqual(self.get_view_count(self.q1), 1)
+
+    def test_badges_are_awarded_at_flush(self):
+        min_views = askbot_settings.POPULAR_QUESTION_BADGE_MIN_VIEWS
+        Thread.objects.filter(id=self.q1.thread_id).update(view_count=min_views - 1)
+        view_counter.record_view(self.q1.thread_id)
+        awards = Award.objects.filter(badge__slug='popular-question', user=self.user)
+        self.assertEqual(awards.count(), 0)
+        view_counter.flush()
+        self.assertEqual(awards.count(), 1)
+
+    def test_question_page_buffers_views(self):
+        self.client.get(
+            self.q1.get_absolute_url(),
+            HTTP_ACCEPT_LANGUAGE='en',
+            HTTP_USER_AGENT='Mozilla/5.0 (X11; Linux x86_64) Gecko/20100101 Firefox/24.0'
+        )
+        self.assertEqual(self.get_view_count(self.q1), 0)
+        output = StringIO()
+        management.call_command('flush_view_counts', stdout=output)
+        self.assertTrue('Updated view counts of 1 threads' in output.getvalue())
+        self.assertEqual(self.get_view_count(self.q1), 1)
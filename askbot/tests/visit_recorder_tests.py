@@ -0,0 +1,106 @@
+import datetime
+from StringIO import StringIO
+from django.conf import settings as django_settings
+from django.core import cache
+from django.core import management
+from django.core.cache.backends.locmem import LocMemCache
+from askbot.tests.utils import AskbotTestCase
+from askbot.models import QuestionView
+from askbot.utils import visit_recorder
+
+
+class QuestionViewRecordTests(AskbotTestCase):
+
+    def setUp(self):
+        self.create_user()
+        self.create_user(username='visitor')
+        self.question = self.post_question()
+        self.hour_ago = datetime.datetime.now() - datetime.timedelta(hours=1)
+        self.now = datetime.datetime.now()
+
+    def get_views(self):
+        return QuestionView.objects.filter(who=self.visitor, question=self.question)
+
+    def test_visit_question_saves_view(self):
+        self.visitor.visit_question(self.question, timestamp=self.hour_ago)
+        self.assertEqual(self.get_views().count(), 1)
+        self.visitor.visit_question(self.question, timestamp=self.now)
+        self.assertEqual(
+            list(self.get_views().values_list('when', flat=True)),
+            [self.now]
+        )
+
+    def test_record_views_keeps_latest_time(self):
+        visitor_key = (self.visitor.id, self.question.id)
+        QuestionView.objects.record_views([
+            visitor_key + (self.now,),
+            visitor_key + (self.hour_ago,),
+            (self.user.id, self.question.id, self.hour_ago),
+        ])
+        self.assertEqual(QuestionView.objects.count(), 2)
+        self.assertEqual(self.get_views()[0].when, self.now)
+        #earlier visit does not move the time back
+        QuestionView.objects.record_views([visitor_key + (self.hour_ago,)])
+        self.assertEqual(self.get_views()[0].when, self.now)
+
+    def test_old_sqlite_falls_back_to_save_row(self):
+        import sqlite3
+        import askbot
+        if 'sqlite' not in askbot.get_database_engine_name():
+            return
+        version_backup = sqlite3.sqlite_version_info
+        sqlite3.sqlite_version_info = (3, 23, 1)
+        try:
+            self.assertFalse(QuestionView.objects.supports_upsert())
+            QuestionView.objects.record_views([
+                (self.visitor.id, self.question.id, self.hour_ago),
+                (self.visitor.id, self.question.id, self.now),
+            ])
+        finally:
+            sqlite3.sqlite_version_info = version_backup
+        self.assertEqual(self.get_views()[0].when, self.now)
+
+    def test_save_row(self):
+        QuestionView.objects.save_row(self.visitor.id, self.question.id, self.hour_ago)
+        QuestionView.objects.save_row(self.visitor.id, self.question.id, self.now)
+        QuestionView.objects.save_row(self.visitor.id, self.question.id, self.hour_ago)
+        self.assertEqual(
+            list(self.get_views().values_list('when', flat=True)),
+            [self.now]
+        )
+
+
+class VisitRecorderTests(AskbotTestCase):
+
+    def setUp(self):
+        self.enabled_backup = getattr(django_settings, 'ASKBOT_QUESTION_VISIT_BUFFER_ENABLED', False)
+        django_settings.ASKBOT_QUESTION_VISIT_BUFFER_ENABLED = True
+        self.old_cache = cache.cache
+        cache.cache = LocMemCache('visit-recorder-tests', {})
+        cache.cache.clear()
+        self.create_user()
+        self.create_user(username='visitor')
+        self.question = self.post_question()
+
+    def tearDown(self):
+        django_settings.ASKBOT_QUESTION_VISIT_BUFFER_ENABLED = self.enabled_backup
+        cache.cache = self.old_cache
+
+    def test_flush(self):
+        hour_ago = datetime.datetime.now() - datetime.timedelta(hours=1)
+        now = datetime.datetime.now()
+        self.visitor.visit_question(self.question, timestamp=hour_ago)
+        self.visitor.visit_question(self.question, timestamp=now)
+        self.assertEqual(QuestionView.objects.count(), 0)
+        self.assertEqual(visit_recorder.get_stats()['depth'], 1)
+
+        output = StringIO()
+        management.call_command('flush_question_visits', stdout=output)
+        self.assertTrue('Saved 1 visits' in output.getvalue())
+        views = QuestionView.objects.filter(who=self.visitor)
+        self.assertEqual(list(views.values_list('when', flat=True)), [now])
+        self.assertEqual(visit_recorder.flush(), 0)
+
+        self.user.visit_question(self.question, timestamp=now)
+        self.assertEqual(visit_recorder.flush(), 1)
+        self.assertEqual(QuestionView.objects.count(), 2)
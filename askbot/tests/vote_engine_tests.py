@@ -0,0 +1,175 @@
+from StringIO import StringIO
+from django.core import cache
+from django.core import management
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+from askbot import const
+from askbot.conf import settings as askbot_settings
+from askbot.tests.utils import AskbotTestCase
+from askbot.models import Post, Repute, Thread, User, Vote
+
+
+class VoteEngineTests(AskbotTestCase):
+
+    def setUp(self):
+        self.create_user()
+        self.create_user(username='voter1')
+        self.create_user(username='voter2')
+        self.question = self.post_question()
+        self.answer = self.post_answer(question=self.question)
+        self.reputation = 100
+        User.objects.all().update(reputation=self.reputation)
+
+    def reload(self, obj):
+        return obj.__class__.objects.get(id=obj.id)
+
+    def test_upvote_applies_score_and_reputation(self):
+        self.voter1.upvote(self.question)
+        question = self.reload(self.question)
+        self.assertEqual(question.points, 1)
+        self.assertEqual(question.vote_up_count, 1)
+        self.assertEqual(self.reload(question.thread).points, 1)
+        #loaded objects receive the new values
+        self.assertEqual(self.question.points, 1)
+        self.assertEqual(self.question.thread.points, 1)
+
+        gain = askbot_settings.REP_GAIN_FOR_RECEIVING_UPVOTE
+        self.assertEqual(self.reload(self.user).reputation, self.reputation + gain)
+        repute = Repute.objects.get(user=self.user)
+        self.assertEqual(repute.reputation_type, 1)
+        self.assertEqual(repute.positive, gain)
+        self.assertEqual(repute.question_id, self.question.id)
+        self.assertEqual(repute.reputation, self.reputation + gain)
+
+    def test_stale_posts_do_not_lose_votes(self):
+        post1 = Post.objects.get(id=self.answer.id)
+        post2 = Post.objects.get(id=self.answer.id)
+        self.voter1.upvote(post1)
+        self.voter2.upvote(post2)
+        answer = self.reload(self.answer)
+        self.assertEqual(answer.points, 2)
+        self.assertEqual(answer.vote_up_count, 2)
+        self.assertEqual(post2.points, 2)
+        gain = askbot_settings.REP_GAIN_FOR_RECEIVING_UPVOTE
+        self.assertEqual(self.reload(self.user).reputation, self.reputation + 2 * gain)
+
+    def test_downvote_cancelation_restores_values(self):
+        self.voter1.downvote(self.answer)
+        answer = self.reload(self.answer)
+        self.assertEqual(answer.points, -1)
+        self.assertEqual(answer.vote_down_count, 1)
+        self.assertEqual(
+            set(Repute.objects.values_list('user_id', 'reputation_type')),
+            set([(self.user.id, -3), (self.voter1.id, -5)])
+        )
+
+        vote = Vote.objects.get(user=self.voter1, voted_post=self.answer)
+        self.assertEqual(vote.cancel(), 1)
+        answer = self.reload(self.answer)
+        self.assertEqual(answer.points, 0)
+        self.assertEqual(answer.vote_down_count, 0)
+        self.assertEqual(Vote.objects.count(), 0)
+        self.assertEqual(Repute.objects.count(), 4)
+
+        expected_reputation = self.reputation \
+            + askbot_settings.REP_LOSS_FOR_RECEIVING_DOWNVOTE \
+            + askbot_settings.REP_GAIN_FOR_RECEIVING_DOWNVOTE_CANCELATION
+        self.assertEqual(self.reload(self.user).reputation, expected_reputation)
+        expected_reputation = self.reputation \
+            + askbot_settings.REP_LOSS_FOR_DOWNVOTING \
+            + askbot_settings.REP_GAIN_FOR_CANCELING_DOWNVOTE
+        self.assertEqual(self.reload(self.voter1).reputation, expected_reputation)
+
+    def test_reputation_does_not_drop_below_minimum(self):
+        User.objects.filter(id=self.user.id).update(reputation=1)
+        self.voter1.downvote(self.answer)
+        self.assertEqual(self.reload(self.user).reputation, const.MIN_REPUTATION)
+
+    def test_comment_upvote_changes_score_only(self):
+        comment = self.post_comment(parent_post=self.question)
+        self.voter1.upvote(comment)
+        self.voter1.upvote(comment, cancel=True)
+        self.voter2.upvote(comment)
+        comment = self.reload(comment)
+        self.assertEqual(comment.points, 1)
+        self.assertEqual(comment.vote_up_count, 0)
+        self.assertEqual(Repute.objects.count(), 0)
+
+    def test_vote_invalidates_thread_data(self):
+        old_cache = cache.cache
+        cache.cache = LocMemCache('vote-engine-tests', {})
+        try:
+            thread = Thread.objects.get(id=self.question.thread_id)
+            generation = thread.get_cache_generation()
+            self.voter1.upvote(self.answer)
+            thread = Thread.objects.get(id=thread.id)
+            self.assertNotEqual(thread.get_cache_generation(), generation)
+        finally:
+            cache.cache = old_cache
+
+    def test_benchmark_command(self):
+        output = StringIO()
+        management.call_command(
+            'benchmark_votes',
+            post_id=self.answer.id,
+            concurrency=1,
+            stdout=output
+        )
+        lines = output.getvalue().split('\n')
+        self.assertTrue('Votes: 2' in lines)
+        self.assertTrue('Lost votes: 0' in lines)
+        self.assertTrue('Lost cancelations: 0' in lines)
+        self.assertEqual(self.reload(self.answer).points, 0)
+        self.assertEqual(Vote.objects.count(), 0)
+
+
+class UserVotesCacheTests(AskbotTestCase):
+
+    def setUp(self):
+        self.old_cache = cache.cache
+        cache.cache = LocMemCache('user-votes-cache-tests', {})
+        cache.cache.clear()
+        self.create_user()
+        self.create_user(username='voter')
+        self.question = self.post_question()
+        self.answer = self.post_answer(question=self.question)
+        self.thread = self.question.thread
+
+    def tearDown(self):
+        cache.cache = self.old_cache
+
+    def test_votes_are_cached_until_user_votes(self):
+        self.assertEqual(self.thread.get_user_votes(self.voter), {})
+        self.voter.upvote(self.question)
+        self.voter.downvote(self.answer)
+        expected_votes = {self.question.id: 1, self.answer.id: -1}
+        self.assertEqual(self.thread.get_user_votes(self.voter), expected_votes)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.thread.get_user_votes(self.voter), expected_votes)
+        self.assertEqual(self.thread.get_user_votes(self.user), {})
+
+        self.voter.downvote(self.answer, cancel=True)
+        self.assertEqual(
+            self.thread.get_user_votes(self.voter),
+            {self.question.id: 1}
+        )
+
+    def test_question_page_reads_votes_from_cache(self):
+        self.voter.upvote(self.answer)
+        self.client.login(method='force', user_id=self.voter.id)
+        url = self.question.get_absolute_url()
+        self.client.get(url)
+        debug_cursor_backup = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        try:
+            #the query log is reset when the request starts
+            response = self.client.get(url)
+            vote_queries = [
+                query for query in connection.queries \
+                    if '"vote"."vote"' in query['sql']
+            ]
+        finally:
+            connection.use_debug_cursor = debug_cursor_backup
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['user_votes'], {self.answer.id: 1})
+        self.assertEqual(vote_queries, [])
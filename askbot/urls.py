@@ -65,6 +65,7 @@ urlpatterns = patterns('',
             r'(%s)?' % r'/author:(?P<author>\d+)' +
             r'(%s)?' % r'/page:(?P<page>\d+)' +
             r'(%s)?' % r'/page-size:(?P<page_size>\d+)' +
+            r'(%s)?' % r'/cursor:(?P<cursor>[\w\-]+)' +
             r'(%s)?' % r'/query:(?P<query>.+)' +  # INFO: query is last, b/c it can contain slash!!!
         r'/$'),
         views.readers.questions,
@@ -190,6 +191,11 @@ urlpatterns = patterns('',
         views.commands.api_get_questions,
         name='api_get_questions'
     ),
+    service_url(
+        r'^api/get_title_suggestions/',
+        views.commands.api_get_title_suggestions,
+        name='api_get_title_suggestions'
+    ),
     service_url(
         r'^get-thread-shared-users/',
         views.commands.get_thread_shared_users,
@@ -0,0 +1,68 @@
+"""Queue of the values kept in the numbered "slots" of the cache.
+
+Used by the write-behind buffers, e.g. :mod:`askbot.utils.view_counter`,
+to find the keys changed since the previous flush: a value
+is stored in the slot with the number taken from an atomic counter,
+the flush reads the slots added since the previous one.
+
+The cache backend must be shared by all processes, e.g. memcached.
+"""
+from django.core import cache
+from askbot import const
+
+def incr(key, delta=1):
+    """atomically increments the counter in the cache,
+    returns the new value"""
+    try:
+        return cache.cache.incr(key, delta)
+    except ValueError:
+        if cache.cache.add(key, delta, const.LONG_TIME):
+            return delta
+        #added by a concurrent process
+        return cache.cache.incr(key, delta)
+
+
+class SlotQueue(object):
+
+    def __init__(self, name):
+        self.slot_key_tpl = name + '-slot-%d'
+        self.last_slot_key = name + '-last-slot'
+        self.read_slot_key = name + '-read-slot'
+        #slot which was reserved, but not yet filled at the time of the read
+        self.missing_slot_key = name + '-missing-slot'
+
+    def put(self, value):
+        """stores the value in the next slot"""
+        slot = incr(self.last_slot_key)
+        cache.cache.set(self.slot_key_tpl % slot, value, const.LONG_TIME)
+
+    def read(self):
+        """returns list of the values added since the previous read"""
+        read_slot = cache.cache.get(self.read_slot_key, 0)
+        last_slot = cache.cache.get(self.last_slot_key, 0)
+        if last_slot <= read_slot:
+            return list()
+
+        slots = range(read_slot + 1, last_slot + 1)
+        keys = [self.slot_key_tpl % slot for slot in slots]
+        stored_values = cache.cache.get_many(keys)
+        values = list()
+        for slot, key in zip(slots, keys):
+            if key in stored_values:
+                values.append(stored_values[key])
+            elif cache.cache.get(self.missing_slot_key) != slot:
+                #the slot may be filled by now, read it next time,
+                #but do not wait for it any longer
+                cache.cache.set(self.missing_slot_key, slot, const.LONG_TIME)
+                break
+            read_slot = slot
+
+        cache.cache.set(self.read_slot_key, read_slot, const.LONG_TIME)
+        cache.cache.delete_many(keys[:read_slot - slots[0] + 1])
+        return values
+
+    def get_depth(self):
+        """returns number of the values not read yet"""
+        read_slot = cache.cache.get(self.read_slot_key, 0)
+        last_slot = cache.cache.get(self.last_slot_key, 0)
+        return max(last_slot - read_slot, 0)
@@ -0,0 +1,132 @@
+"""Base class of the in-process indexes kept in sync
+between the worker processes through the cache.
+
+Each process builds its copy of the index on the first use.
+A change is applied to the index by publishing it: the generation
+number in the cache is incremented and the change is stored
+in the cache under the new generation number, forming a change log.
+When a process finds that the cached generation is ahead of its copy,
+it reads the missed changes from the log and applies them,
+and only rebuilds the copy from the database when some of them are
+missing from the cache, or when it is more than :data:`MAX_CHANGES`
+generations behind.
+
+The cache backend must be shared by all processes, e.g. memcached.
+"""
+import threading
+import time
+from django.core import cache
+from askbot import const
+
+#processes further behind rebuild their copies
+MAX_CHANGES = 1000
+#time in seconds the changes are kept in the cache
+CHANGE_TIMEOUT = 24 * 3600
+
+class SharedIndex(object):
+    """per process instance of an index,
+    the subclasses define :meth:`load` and :meth:`apply_change`
+    and the prefix of the cache keys ``cache_key``
+    """
+    cache_key = None
+
+    def __init__(self):
+        self.index = None
+        self.generation = None
+        self.lock = threading.RLock()
+
+    def get_generation_cache_key(self):
+        return self.cache_key + '-generation'
+
+    def get_change_cache_key(self, generation):
+        return '%s-change-%d' % (self.cache_key, generation)
+
+    def load(self):
+        """returns the index built from the database"""
+        raise NotImplementedError()
+
+    def apply_change(self, index, change):
+        """applies the published change to the index"""
+        raise NotImplementedError()
+
+    def get_cached_generation(self):
+        key = self.get_generation_cache_key()
+        generation = cache.cache.get(key)
+        if generation is None:
+            generation = int(time.time())
+            cache.cache.set(key, generation, const.LONG_TIME)
+        return generation
+
+    def bump_cached_generation(self):
+        key = self.get_generation_cache_key()
+        try:
+            return cache.cache.incr(key)
+        except ValueError:
+            generation = int(time.time())
+            cache.cache.set(key, generation, const.LONG_TIME)
+            return generation
+
+    def catch_up(self, generation):
+        """applies the changes published since the generation
+        of the local copy up to the ``generation``,
+        returns ``False`` if some of them are missing"""
+        if self.generation is None or generation < self.generation \
+            or generation - self.generation > MAX_CHANGES:
+            return False
+        keys = [
+            self.get_change_cache_key(number) \
+                for number in range(self.generation + 1, generation + 1)
+        ]
+        changes = cache.cache.get_many(keys)
+        if len(changes) < len(keys):
+            return False
+        for key in keys:
+            self.apply_change(self.index, changes[key])
+        self.generation = generation
+        return True
+
+    def get(self):
+        """returns up to date index"""
+        self.lock.acquire()
+        try:
+            generation = self.get_cached_generation()
+            if self.index is not None and self.generation != generation:
+                if not self.catch_up(generation):
+                    self.index = None
+            if self.index is None:
+                self.index = self.load()
+                self.generation = generation
+            return self.index
+        finally:
+            self.lock.release()
+
+    def publish(self, change):
+        """stores the change in the log for the other processes
+        and applies it to the local copy, if it is loaded"""
+        self.lock.acquire()
+        try:
+            generation = self.bump_cached_generation()
+            cache.cache.set(
+                self.get_change_cache_key(generation), change, CHANGE_TIMEOUT
+            )
+            if self.index is None:
+                return
+            if self.generation == generation - 1:
+                self.apply_change(self.index, change)
+                self.generation = generation
+            elif not self.catch_up(generation):
+                self.index = None
+        finally:
+            self.lock.release()
+
+    def invalidate(self):
+        """makes all processes rebuild the index,
+        to be used after bulk changes"""
+        self.lock.acquire()
+        try:
+            #no change is stored for this generation
+            self.bump_cached_generation()
+            self.index = None
+            self.generation = None
+        finally:
+            self.lock.release()
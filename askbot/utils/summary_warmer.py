@@ -0,0 +1,182 @@
+"""Background rendering of the cached question summaries.
+
+When the warmer is enabled, votes, edits and the other changes
+of the threads do not render the summary html within the request,
+but mark the thread in the table
+:class:`~askbot.models.ThreadSummaryUpdate`, repeated marks
+of the same thread are merged. :func:`warm` renders summaries
+of the marked threads, the recently active and the frequently
+viewed ones first, threads of each language - in a separate worker
+process. It is called from the celery task
+``warm_summary_cache_celery_task`` or the command
+``python manage.py warm_summary_cache``.
+
+Summaries not yet rendered by the warmer are rendered
+by the pages that show them, as usual.
+
+The warmer is enabled with ``ASKBOT_SUMMARY_WARMER_ENABLED = True``
+in the ``settings.py`` file.
+"""
+import datetime
+import logging
+import math
+import multiprocessing
+from django.conf import settings as django_settings
+from django.core import cache
+from django.db import connection
+from django.db import transaction
+from django.db import IntegrityError
+from django.db.models import Count, Min
+from django.template.loader import get_template
+from django.utils.translation import activate as activate_language
+from django.utils.translation import get_language
+from askbot import const
+
+BATCH_SIZE = 100
+
+def is_enabled():
+    return getattr(django_settings, 'ASKBOT_SUMMARY_WARMER_ENABLED', False)
+
+
+def get_seconds(timedelta):
+    return timedelta.days * 86400 + timedelta.seconds
+
+
+def mark_dirty(thread_ids):
+    """marks summaries of the threads for rendering by the warmer"""
+    from askbot.models import ThreadSummaryUpdate
+    now = datetime.datetime.now()
+    for thread_id in thread_ids:
+        updates = ThreadSummaryUpdate.objects.filter(thread__id=thread_id)
+        if updates.update(marked_at=now):
+            continue
+
+        savepoint_id = transaction.savepoint()
+        try:
+            ThreadSummaryUpdate.objects.create(thread_id=thread_id, marked_at=now)
+            transaction.savepoint_commit(savepoint_id)
+        except IntegrityError:
+            #marked by a concurrent request
+            transaction.savepoint_rollback(savepoint_id)
+            updates.update(marked_at=now)
+
+
+def get_priority(last_activity_at, view_count, now):
+    """importance of the thread summary, grows with the number
+    of views and decays with the time since the last activity"""
+    age_hours = max(get_seconds(now - last_activity_at), 0) / 3600.0
+    return math.log(view_count + 2) / math.pow(age_hours + 2, 1.5)
+
+
+def get_dirty_threads(limit=None):
+    """returns list of tuples (language code, thread id)
+    of the marked threads, the most important first"""
+    from askbot.models import ThreadSummaryUpdate
+    records = ThreadSummaryUpdate.objects.values_list(
+                                    'thread__id',
+                                    'thread__language_code',
+                                    'thread__last_activity_at',
+                                    'thread__view_count'
+                                )
+    now = datetime.datetime.now()
+    records = sorted(
+                records,
+                key=lambda record: get_priority(record[2], record[3], now),
+                reverse=True
+            )
+    if limit:
+        records = records[:limit]
+    return [(record[1], record[0]) for record in records]
+
+
+def render_summaries(thread_ids):
+    """renders summaries of the threads in the current
+    language and puts them into the cache"""
+    from askbot.models import Thread
+    from askbot.models.question import split_summary_html
+    threads = list(Thread.objects.filter(id__in=thread_ids, deleted=False))
+    if len(threads) == 0:
+        return
+    Thread.objects.precache_view_data_hack(threads)
+    template = get_template('widgets/question_summary.html')
+    segments = dict()
+    for thread in threads:
+        html = thread.render_summary_html(
+                                question=thread._question_post(),
+                                template=template
+                            )
+        segments[thread.get_summary_cache_key()] = split_summary_html(html)
+    cache.cache.set_many(segments, const.LONG_TIME)
+
+
+def warm_language(language_code, thread_ids, batch_size=BATCH_SIZE):
+    """renders summaries of the threads in one language,
+    in the given order, returns number of the threads"""
+    from askbot.models import ThreadSummaryUpdate
+    activate_language(language_code)
+    for start in range(0, len(thread_ids), batch_size):
+        batch_ids = thread_ids[start:start + batch_size]
+        started_at = datetime.datetime.now()
+        render_summaries(batch_ids)
+        #threads marked again while rendering stay marked
+        ThreadSummaryUpdate.objects.filter(
+                                thread__id__in=batch_ids,
+                                marked_at__lte=started_at
+                            ).delete()
+    return len(thread_ids)
+
+
+def _warm_language(args):
+    """runs :func:`warm_language` in the worker process"""
+    return warm_language(*args)
+
+
+def render_languages(threads, parallel=False):
+    """renders summaries of the threads given as
+    tuples (language code, thread id), optionally in parallel
+    worker processes - one per language,
+    returns number of the rendered summaries"""
+    languages = dict()
+    for language_code, thread_id in threads:
+        languages.setdefault(language_code, list()).append(thread_id)
+
+    jobs = languages.items()
+    if parallel and len(jobs) > 1:
+        #forked workers must not share the database connection
+        connection.close()
+        pool = multiprocessing.Pool(len(jobs))
+        try:
+            counts = pool.map(_warm_language, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        current_language = get_language()
+        try:
+            counts = map(_warm_language, jobs)
+        finally:
+            activate_language(current_language)
+    return sum(counts)
+
+
+def warm(limit=None, parallel=False):
+    """renders summaries of the marked threads,
+    returns number of the rendered summaries"""
+    count = render_languages(get_dirty_threads(limit), parallel=parallel)
+    logging.info('rendered %d question summaries' % count)
+    return count
+
+
+def get_stats():
+    """returns dictionary with the number of marked
+    threads ("depth") and the age of the oldest mark
+    in seconds ("lag")"""
+    from askbot.models import ThreadSummaryUpdate
+    data = ThreadSummaryUpdate.objects.aggregate(
+                                    depth=Count('thread'),
+                                    oldest=Min('marked_at')
+                                )
+    stats = {'depth': data['depth'], 'lag': 0}
+    if data['oldest']:
+        stats['lag'] = get_seconds(datetime.datetime.now() - data['oldest'])
+    return stats
@@ -0,0 +1,106 @@
+"""Write-behind counters of the question views.
+
+When the buffering is enabled, the question page does not update
+the ``Thread.view_count`` column on every visit, which locks
+the row of the popular threads, but increments a counter of the thread
+in the cache. :func:`flush` periodically adds the accumulated
+counts to the threads with one ``UPDATE`` per distinct count
+and considers the badges awarded for the question views.
+It is called from the celery task ``flush_view_counts_celery_task``
+or the command ``python manage.py flush_view_counts``.
+
+Threads with the pending views are put into the
+:class:`~askbot.utils.cache_slots.SlotQueue` when their counter
+grows from zero, so the flush reads only the threads added since
+the previous one.
+
+The counters must be shared by all processes, so the cache
+backend must be e.g. memcached, not the local memory one.
+Counts evicted from the cache before the flush are lost.
+
+The buffering is enabled with ``ASKBOT_VIEW_COUNTER_BUFFER_ENABLED = True``
+in the ``settings.py`` file.
+"""
+import logging
+from django.conf import settings as django_settings
+from django.core import cache
+from django.db.models import F
+from askbot.utils.cache_slots import incr, SlotQueue
+
+VIEW_COUNT_KEY_TPL = 'thread-view-count-%d'
+FLUSH_LOCK_KEY = 'thread-view-flush-lock'
+FLUSH_LOCK_TIMEOUT = 300
+
+#ids of the threads with the buffered views
+pending_threads = SlotQueue('thread-view')
+
+def is_enabled():
+    return getattr(django_settings, 'ASKBOT_VIEW_COUNTER_BUFFER_ENABLED', False)
+
+
+def record_view(thread_id):
+    """counts one view of the thread"""
+    if incr(VIEW_COUNT_KEY_TPL % thread_id) == 1:
+        pending_threads.put(thread_id)
+
+
+def take_counts(thread_ids):
+    """returns dictionary thread id -> number of views
+    and subtracts the returned numbers from the counters"""
+    keys = dict([(VIEW_COUNT_KEY_TPL % thread_id, thread_id) for thread_id in thread_ids])
+    counts = dict()
+    for key, count in cache.cache.get_many(keys.keys()).items():
+        if not count:
+            continue
+        thread_id = keys[key]
+        counts[thread_id] = count
+        #views counted after the get_many stay for the next flush
+        if cache.cache.decr(key, count) > 0:
+            pending_threads.put(thread_id)
+    return counts
+
+
+def save_counts(counts):
+    """adds the counts to the view counters of the threads,
+    then considers the badges for the question views"""
+    from askbot.models import Thread
+    from askbot.models.badges import award_badges_signal
+    increments = dict()
+    for thread_id, count in counts.items():
+        increments.setdefault(count, list()).append(thread_id)
+    for count, thread_ids in increments.items():
+        Thread.objects.filter(
+                        id__in=thread_ids
+                    ).update(view_count=F('view_count') + count)
+
+    threads = list(Thread.objects.filter(id__in=counts.keys()))
+    Thread.objects.precache_view_data_hack(threads)
+    for thread in threads:
+        thread.refresh_summary_html()
+        question = thread._question_post()
+        award_badges_signal.send(None,
+                        event='view_question',
+                        actor=question.author,
+                        context_object=question
+                    )
+
+
+def flush():
+    """writes the buffered view counts to the database,
+    returns number of the updated threads"""
+    if not cache.cache.add(FLUSH_LOCK_KEY, 1, FLUSH_LOCK_TIMEOUT):
+        logging.info('view counts are being flushed by another process')
+        return 0
+    try:
+        counts = take_counts(set(pending_threads.read()))
+        save_counts(counts)
+    finally:
+        cache.cache.delete(FLUSH_LOCK_KEY)
+    logging.info('flushed view counts of %d threads' % len(counts))
+    return len(counts)
+
+
+def get_stats():
+    """returns dictionary with the number of the threads
+    registered since the last flush ("depth")"""
+    return {'depth': pending_threads.get_depth()}
@@ -0,0 +1,80 @@
+"""Write-behind recording of the question visits.
+
+When the buffering is enabled, the visit of the question page
+does not write the :class:`~askbot.models.QuestionView` record,
+but stores the time of the visit in the cache, repeated visits
+of the same question by the same user replace the stored time.
+:func:`flush` periodically saves the buffered visits with one
+multi-row "upsert" statement per batch.
+It is called from the celery task ``flush_question_visits_celery_task``
+or the command ``python manage.py flush_question_visits``.
+
+Like in the :mod:`askbot.utils.view_counter`, the cache
+backend must be shared by all processes, e.g. memcached.
+
+The buffering is enabled with ``ASKBOT_QUESTION_VISIT_BUFFER_ENABLED = True``
+in the ``settings.py`` file.
+"""
+import logging
+from django.conf import settings as django_settings
+from django.core import cache
+from askbot import const
+from askbot.utils.cache_slots import incr, SlotQueue
+
+VISIT_TIME_KEY_TPL = 'question-visit-time-%d-%d'
+VISIT_COUNT_KEY_TPL = 'question-visit-count-%d-%d'
+FLUSH_LOCK_KEY = 'question-visit-flush-lock'
+FLUSH_LOCK_TIMEOUT = 300
+
+#tuples (user id, question id) of the buffered visits
+pending_visits = SlotQueue('question-visit')
+
+def is_enabled():
+    return getattr(django_settings, 'ASKBOT_QUESTION_VISIT_BUFFER_ENABLED', False)
+
+
+def record_visit(user_id, question_id, timestamp):
+    """buffers visit of the question by the user"""
+    key = (user_id, question_id)
+    cache.cache.set(VISIT_TIME_KEY_TPL % key, timestamp, const.LONG_TIME)
+    if incr(VISIT_COUNT_KEY_TPL % key) == 1:
+        pending_visits.put(key)
+
+
+def take_visits(keys):
+    """returns list of tuples (user id, question id, time)
+    of the buffered visits"""
+    time_keys = [VISIT_TIME_KEY_TPL % key for key in keys]
+    count_keys = [VISIT_COUNT_KEY_TPL % key for key in keys]
+    values = cache.cache.get_many(time_keys + count_keys)
+    visits = list()
+    for key, time_key, count_key in zip(keys, time_keys, count_keys):
+        count = values.get(count_key)
+        if not count or time_key not in values:
+            continue
+        visits.append(key + (values[time_key],))
+        #visits recorded after the get_many stay for the next flush
+        if cache.cache.decr(count_key, count) > 0:
+            pending_visits.put(key)
+    return visits
+
+
+def flush():
+    """saves the buffered visits to the database,
+    returns number of the saved visits"""
+    from askbot.models import QuestionView
+    if not cache.cache.add(FLUSH_LOCK_KEY, 1, FLUSH_LOCK_TIMEOUT):
+        logging.info('question visits are being flushed by another process')
+        return 0
+    try:
+        visits = take_visits(list(set(pending_visits.read())))
+        QuestionView.objects.record_views(visits)
+    finally:
+        cache.cache.delete(FLUSH_LOCK_KEY)
+    logging.info('saved %d question visits' % len(visits))
+    return len(visits)
+
+
+def get_stats():
+    """returns dictionary with the number of the buffered visits ("depth")"""
+    return {'depth': pending_visits.get_depth()}
@@ -0,0 +1,183 @@
+"""Application of the votes to the scores of the posts
+and to the reputation of the users.
+
+The vote record, the counters of the post, the reputation
+of the users and the :class:`~askbot.models.Repute` records
+are saved in one short transaction. The counters and the
+reputation are changed with the ``UPDATE`` statements adding
+the deltas to the values stored in the database (``F()`` expressions),
+so the concurrent votes do not overwrite each other's changes,
+as it happened when the loaded objects were saved.
+
+The rest of the work - the cached data and the summary of the thread,
+the question list records and the badges - is done after the commit
+by the celery task ``apply_vote_effects_celery_task``, which
+runs right away with ``CELERY_ALWAYS_EAGER = True``.
+
+The throughput of the voting can be measured with
+the command ``python manage.py benchmark_votes``.
+"""
+import datetime
+from django.db import transaction
+from django.db.models import F
+from askbot import const
+from askbot.conf import settings as askbot_settings
+
+def get_reputation_changes(post, voter, vote_type, cancel):
+    """returns list of tuples (user, change of reputation, reputation type)
+    caused by the vote of the ``voter`` or by its cancelation"""
+    from askbot.models import Repute, Vote
+    if post.post_type == 'comment' or post.wiki or post.is_anonymous:
+        return list()
+
+    author = post.author
+    if vote_type == Vote.VOTE_UP:
+        if cancel:
+            return [(
+                author,
+                askbot_settings.REP_LOSS_FOR_RECEIVING_UPVOTE_CANCELATION,
+                -8
+            )]
+        todays_rep_gain = Repute.objects.get_reputation_by_upvoted_today(author)
+        if todays_rep_gain < askbot_settings.MAX_REP_GAIN_PER_USER_PER_DAY:
+            return [(author, askbot_settings.REP_GAIN_FOR_RECEIVING_UPVOTE, 1)]
+        return list()
+
+    if cancel:
+        return [
+            (author, askbot_settings.REP_GAIN_FOR_RECEIVING_DOWNVOTE_CANCELATION, 4),
+            (voter, askbot_settings.REP_GAIN_FOR_CANCELING_DOWNVOTE, 5)
+        ]
+    return [
+        (author, askbot_settings.REP_LOSS_FOR_RECEIVING_DOWNVOTE, -3),
+        (voter, askbot_settings.REP_LOSS_FOR_DOWNVOTING, -5)
+    ]
+
+
+def add_reputation(user_id, delta):
+    """adds ``delta`` to the reputation of the user in the database,
+    returns the new reputation"""
+    from askbot.models import User
+    users = User.objects.filter(id=user_id)
+    users.update(reputation=F('reputation') + delta)
+    if delta < 0:
+        users.filter(reputation__lte=0).update(reputation=const.MIN_REPUTATION)
+    return users.values_list('reputation', flat=True)[0]
+
+
+@transaction.commit_on_success
+def apply_vote(vote, post, user, timestamp, cancel=False):
+    """saves the vote, or deletes the canceled one, and applies
+    the changes of the score of the post and of the reputation,
+    the loaded ``post`` and users receive the new values.
+
+    Returns change of the score of the post.
+    """
+    from askbot.models import Post, Thread, Repute, signals
+    if cancel:
+        vote.delete()
+    else:
+        vote.save()
+
+    if vote.is_upvote():
+        score_delta = 1
+        counter = 'vote_up_count'
+    else:
+        score_delta = -1
+        counter = 'vote_down_count'
+    if cancel:
+        score_delta = -score_delta
+
+    posts = Post.objects.filter(id=post.id)
+    changes = {'points': F('points') + score_delta}
+    #comment upvotes are counted by the score only
+    if not (vote.is_upvote() and post.post_type == 'comment'):
+        if cancel:
+            posts.filter(**{counter + '__gt': 0}).update(**{counter: F(counter) - 1})
+        else:
+            changes[counter] = F(counter) + 1
+    posts.update(**changes)
+    post.points, post.vote_up_count, post.vote_down_count = posts.values_list(
+                            'points', 'vote_up_count', 'vote_down_count'
+                        )[0]
+
+    if post.post_type == 'question':
+        #the post row is locked until the commit,
+        #so the thread receives the latest score
+        Thread.objects.filter(id=post.thread_id).update(points=post.points)
+        post.thread.points = post.points
+        question_id = post.id
+    else:
+        question_id = None
+
+    reputes = list()
+    for receiver, delta, reputation_type in \
+        get_reputation_changes(post, user, vote.vote, cancel):
+        receiver.reputation = add_reputation(receiver.id, delta)
+        signals.reputation_received.send(None,
+                        user=receiver,
+                        reputation_before=receiver.reputation - delta
+                    )
+        if question_id is None:
+            question_id = post.thread.get_question_post_id()
+        repute = Repute(
+                    user=receiver,
+                    question_id=question_id,
+                    reputed_at=timestamp,
+                    reputation_type=reputation_type,
+                    reputation=receiver.reputation
+                )
+        if reputation_type > 0:
+            repute.positive = delta
+        else:
+            repute.negative = delta
+        reputes.append(repute)
+
+    if reputes:
+        Repute.objects.bulk_create(reputes)
+
+    return score_delta
+
+
+def process_vote(vote, post, user, timestamp=None, cancel=False, event=None):
+    """applies the vote and schedules the updates of the cached data
+    and, if the ``event`` is given, the badges,
+    returns change of the score of the post"""
+    from askbot import tasks
+    from askbot.models import Thread
+    if timestamp is None:
+        timestamp = datetime.datetime.now()
+    score_delta = apply_vote(vote, post, user, timestamp, cancel=cancel)
+    Thread.objects.invalidate_user_votes(post.thread_id, user.id)
+    tasks.apply_vote_effects_celery_task.delay(post.id, user.id, event, timestamp)
+    return score_delta
+
+
+def apply_vote_effects(post_id, voter_id, event=None, timestamp=None):
+    """updates the cached data of the thread of the voted post
+    and the records derived from the score, then,
+    if the ``event`` is given, considers the badges"""
+    from askbot.models import Post, ThreadListing, User
+    from askbot.models.badges import award_badges_signal
+    from askbot.search import result_cache as search_result_cache
+    from askbot.search import title_index
+    post = Post.objects.select_related('thread').get(id=post_id)
+    thread = post.thread
+    thread.invalidate_cached_data()
+
+    if post.post_type == 'question':
+        if ThreadListing.objects.is_enabled():
+            ThreadListing.objects.update_for_thread(thread)
+        if title_index.is_enabled():
+            title_index.shared_index.update_thread(thread)
+
+    if search_result_cache.is_enabled():
+        search_result_cache.bump_generation()
+
+    if event:
+        award_badges_signal.send(None,
+                    event=event,
+                    actor=User.objects.get(id=voter_id),
+                    context_object=post,
+                    timestamp=timestamp
+                )
@@ -8,6 +8,7 @@ from django.core.urlresolvers import reverse
 from askbot import models
 from askbot.conf import settings as askbot_settings
 from askbot.search.state_manager import SearchState
+from askbot.search import paginator as keyset_paginator
 from askbot.utils.html import site_url
 
 def get_user_data(user):
@@ -29,7 +30,7 @@ def get_question_data(thread):
     """returns data dictionary for a given thread"""
     datum = {
         'added_at': thread.added_at.strftime('%s'),
-        'id': thread._question_post().id,
+        'id': thread.get_question_post_id(),
         'answer_count': thread.answer_count,
         'view_count': thread.view_count,
         'score': thread.score,
@@ -38,9 +39,10 @@ def get_question_data(thread):
         'tags': thread.tagnames.strip().split(),
         'url': site_url(thread.get_absolute_url()),
     }
+    author = thread._question_post().author
     datum['author'] = {
-        'id': thread._question_post().author.id,
-        'username': thread._question_post().author.username
+        'id': author.id,
+        'username': author.username
     }
     datum['last_activity_by'] = {
         'id': thread.last_activity_by.id,
@@ -166,6 +168,7 @@ def questions(request):
                 tags=request.GET.get('tags', None),
                 author=author_id,
                 page=page,
+                cursor=request.GET.get('cursor', None),
                 user_logged_in=request.user.is_authenticated(),
             )
 
@@ -175,15 +178,31 @@ def questions(request):
     if meta_data['non_existing_tags']:
         search_state = search_state.remove_tags(meta_data['non_existing_tags'])
 
+    #authors are shown for each question
+    qs = qs.select_related('question_post__author', 'last_activity_by')
+
     #exludes the question from groups
     #global_group = models.Group.objects.get_global_group()
     #qs = qs.exclude(~Q(groups__id=global_group.id))
 
     page_size = askbot_settings.DEFAULT_QUESTIONS_PAGE_SIZE
-    paginator = Paginator(qs, page_size)
-    if paginator.num_pages < search_state.page:
-        search_state.page = 1
-    page = paginator.page(search_state.page)
+    keyset_ordering = meta_data.get('keyset_ordering', None)
+    if keyset_paginator.is_enabled() and keyset_ordering:
+        paginator = keyset_paginator.KeysetPaginator(
+                qs,
+                page_size,
+                keyset_ordering,
+                count_cache_key=keyset_paginator.get_count_cache_key(
+                                                search_state, request.user
+                                            ),
+                count_cache_timeout=keyset_paginator.get_count_cache_timeout()
+            )
+        page = paginator.page(search_state.cursor)
+    else:
+        paginator = Paginator(qs, page_size)
+        if paginator.num_pages < search_state.page:
+            search_state.page = 1
+        page = paginator.page(search_state.page)
 
     question_list = list()
     for thread in page.object_list:
@@ -192,8 +211,12 @@ def questions(request):
 
     ajax_data = {
         'count': paginator.count,
-        'pages' : paginator.num_pages,
         'questions': question_list
     }
+    if isinstance(paginator, keyset_paginator.KeysetPaginator):
+        ajax_data['next'] = page.next_cursor
+        ajax_data['previous'] = page.previous_cursor
+    else:
+        ajax_data['pages'] = paginator.num_pages
     response_data = simplejson.dumps(ajax_data)
     return HttpResponse(response_data, content_type='application/json')
@@ -45,6 +45,7 @@ from django.template import RequestContext
 from askbot.skins.loaders import render_into_skin_as_string
 from askbot.skins.loaders import render_text_into_skin
 from askbot.models.tag import get_tags_by_names
+from askbot.search import title_index
 
 
 @csrf.csrf_exempt
@@ -279,7 +280,7 @@ def vote(request):
                     request.user.accept_best_answer(answer)
 
                 ####################################################################
-                answer.thread.update_summary_html() # regenerate question/thread summary html
+                answer.thread.refresh_summary_html() # regenerate question/thread summary html
                 ####################################################################
 
             else:
@@ -313,11 +314,6 @@ def vote(request):
                                         post = post
                                     )
 
-            ####################################################################
-            if vote_type in ('1', '2'): # up/down-vote question
-                post.thread.update_summary_html() # regenerate question/thread summary html
-            ####################################################################
-
         elif vote_type in ['7', '8']:
             #flag question or answer
             if vote_type == '7':
@@ -831,38 +827,82 @@ def delete_bulk_tag_subscription(request):
     else:
         return HttpResponseRedirect(reverse('list_bulk_tag_subscription'))
 
+def can_use_title_index(tag_name=None):
+    """True if title matches can be looked up
+    in the :mod:`askbot.search.title_index`, which does
+    not know the tags and the group visibility"""
+    if tag_name or askbot_settings.GROUPS_ENABLED:
+        return False
+    return title_index.is_enabled()
+
+def get_title_matches_json(threads, user):
+    thread_list = list()
+    for thread in threads:#todo: this is a temp hack until thread model is fixed
+        try:
+            thread_list.append({
+                    'title': escape(thread.title),
+                    'url': thread.get_absolute_url(),
+                    'answer_count': thread.get_answer_count(user)
+                })
+        except:
+            continue
+    return simplejson.dumps(thread_list)
+
 @decorators.get_only
 def api_get_questions(request):
     """json api for retrieving questions by title match"""
     query = request.GET.get('query_text', '').strip()
     tag_name = request.GET.get('tag_name', None)
 
-    if askbot_settings.GROUPS_ENABLED:
-        threads = models.Thread.objects.get_visible(user=request.user)
+    if query and can_use_title_index(tag_name):
+        threads = models.Thread.objects.get_title_suggestions(
+                                        query, count=title_index.MAX_SUGGESTIONS
+                                    )
     else:
-        threads = models.Thread.objects.all()
+        if askbot_settings.GROUPS_ENABLED:
+            threads = models.Thread.objects.get_visible(user=request.user)
+        else:
+            threads = models.Thread.objects.all()
 
-    if tag_name:
-        threads = threads.filter(tags__name=tag_name)
+        if tag_name:
+            threads = threads.filter(tags__name=tag_name)
 
-    if query:
-        threads = threads.get_for_title_query(query)
+        if query:
+            threads = threads.get_for_title_query(query)
 
-    #todo: filter out deleted threads, for now there is no way
-    threads = threads.distinct()[:30]
+        #todo: filter out deleted threads, for now there is no way
+        threads = threads.distinct()[:title_index.MAX_SUGGESTIONS]
 
-    thread_list = list()
-    for thread in threads:#todo: this is a temp hack until thread model is fixed
-        try:
-            thread_list.append({
-                    'title': escape(thread.title),
-                    'url': thread.get_absolute_url(),
-                    'answer_count': thread.get_answer_count(request.user)
-                })
-        except:
-            continue
+    json_data = get_title_matches_json(threads, request.user)
+    return HttpResponse(json_data, mimetype = "application/json")
+
+@decorators.get_only
+def api_get_title_suggestions(request):
+    """json api for the search-as-you-type title suggestions,
+    returns up to ``limit`` questions (10 by default)
+    matching the beginning of each word of the ``query_text``,
+    the highest voted and the most recently active first
+    """
+    query = request.GET.get('query_text', '').strip()
+    try:
+        limit = int(request.GET.get('limit', 10))
+    except ValueError:
+        limit = 10
+    limit = max(1, min(limit, title_index.MAX_SUGGESTIONS))
+
+    if query == '':
+        threads = list()
+    elif can_use_title_index():
+        threads = models.Thread.objects.get_title_suggestions(query, count=limit)
+    else:
+        if askbot_settings.GROUPS_ENABLED:
+            threads = models.Thread.objects.get_visible(user=request.user)
+        else:
+            threads = models.Thread.objects.all()
+        threads = threads.get_for_title_query(query)
+        threads = threads.order_by('-points', '-last_activity_at').distinct()[:limit]
 
-    json_data = simplejson.dumps(thread_list)
+    json_data = get_title_matches_json(threads, request.user)
     return HttpResponse(json_data, mimetype = "application/json")
 
 
@@ -46,16 +46,19 @@ from askbot.models.tag import Tag
 from askbot import const
 from askbot.startup_procedures import domain_is_bad
 from askbot.utils import functions
+from askbot.utils import view_counter
 from askbot.utils.html import sanitize_html
 from askbot.utils.decorators import anonymous_forbidden, ajax_only, get_only
 from askbot.search.state_manager import SearchState, DummySearchState
+from askbot.search import paginator as keyset_paginator
+from askbot.search import result_cache as search_result_cache
 from askbot.templatetags import extra_tags
 from askbot.conf import settings as askbot_settings
 from askbot.views import context
 
 # used in index page
 #todo: - take these out of const or settings
-from askbot.models import Post, Vote
+from askbot.models import Post
 
 INDEX_PAGE_SIZE = 30
 INDEX_AWARD_SIZE = 15
@@ -76,6 +79,77 @@ def index(request):#generates front page - shows listing of questions sorted in
     """
     return HttpResponseRedirect(reverse('questions'))
 
+def get_questions_page_data(request_user, search_state):
+    """runs the search and returns a dictionary with
+    the data for the page of the question list:
+    the page object, search meta data, paginator context,
+    total number of questions, related tags and contributors,
+    and the search state, updated if the page or tags were not valid
+    """
+    qs, meta_data = models.Thread.objects.run_advanced_search(
+                        request_user=request_user, search_state=search_state
+                    )
+    if meta_data['non_existing_tags']:
+        search_state = search_state.remove_tags(meta_data['non_existing_tags'])
+
+    keyset_ordering = meta_data.get('keyset_ordering', None)
+    if keyset_paginator.is_enabled() and keyset_ordering:
+        paginator = keyset_paginator.KeysetPaginator(
+                qs,
+                search_state.page_size,
+                keyset_ordering,
+                count_cache_key=keyset_paginator.get_count_cache_key(
+                                                search_state, request_user
+                                            ),
+                count_cache_timeout=keyset_paginator.get_count_cache_timeout()
+            )
+        page = paginator.page(search_state.cursor)
+        paginator_context = {
+            'keyset': True,
+            'is_paginated': page.has_other_pages(),
+            'has_previous': page.has_previous(),
+            'has_next': page.has_next(),
+            'previous': page.previous_cursor,
+            'next': page.next_cursor,
+            'page_object': page,
+            'base_url' : search_state.query_string(),
+            'page_size' : search_state.page_size,
+        }
+    else:
+        paginator = Paginator(qs, search_state.page_size)
+        if paginator.num_pages < search_state.page:
+            search_state.page = 1
+        page = paginator.page(search_state.page)
+        paginator_context = {
+            'is_paginated' : (paginator.count > search_state.page_size),
+            'pages': paginator.num_pages,
+            'current_page_number': search_state.page,
+            'page_object': page,
+            'base_url' : search_state.query_string(),
+            'page_size' : search_state.page_size,
+        }
+    page.object_list = list(page.object_list) # evaluate the queryset
+
+    related_tags = Tag.objects.get_related_to_search(
+                        threads=page.object_list,
+                        ignored_tag_names=meta_data.get('ignored_tag_names',[])
+                    )
+
+    contributors = list(
+        models.Thread.objects.get_thread_contributors(
+                                        thread_list=page.object_list
+                                    ).only('id', 'username', 'gravatar')
+                        )
+    return {
+        'search_state': search_state,
+        'meta_data': meta_data,
+        'page': page,
+        'paginator_context': paginator_context,
+        'questions_count': paginator.count,
+        'related_tags': related_tags,
+        'contributors': contributors,
+    }
+
 def questions(request, **kwargs):
     """
     List of Questions, Tagged questions, and Unanswered questions.
@@ -90,45 +164,31 @@ def questions(request, **kwargs):
                     **kwargs
                 )
 
-    qs, meta_data = models.Thread.objects.run_advanced_search(
-                        request_user=request.user, search_state=search_state
-                    )
-    if meta_data['non_existing_tags']:
-        search_state = search_state.remove_tags(meta_data['non_existing_tags'])
-
-    paginator = Paginator(qs, search_state.page_size)
-    if paginator.num_pages < search_state.page:
-        search_state.page = 1
-    page = paginator.page(search_state.page)
-    page.object_list = list(page.object_list) # evaluate the queryset
+    use_result_cache = search_result_cache.can_use(request.user, search_state)
+    page_data = None
+    if use_result_cache:
+        page_data = search_result_cache.get_page_data(search_state)
+    if page_data is None:
+        page_data = get_questions_page_data(request.user, search_state)
+        if use_result_cache:
+            search_result_cache.set_page_data(search_state, page_data)
+
+    search_state = page_data['search_state']
+    meta_data = page_data['meta_data']
+    page = page_data['page']
+    paginator_context = page_data['paginator_context']
+    questions_count = page_data['questions_count']
+    contributors = page_data['contributors']
 
     # INFO: Because for the time being we need question posts and thread authors
     #       down the pipeline, we have to precache them in thread objects
     models.Thread.objects.precache_view_data_hack(threads=page.object_list)
 
-    related_tags = Tag.objects.get_related_to_search(
-                        threads=page.object_list,
-                        ignored_tag_names=meta_data.get('ignored_tag_names',[])
-                    )
+    related_tags = page_data['related_tags']
     tag_list_type = askbot_settings.TAG_LIST_FORMAT
     if tag_list_type == 'cloud': #force cloud to sort by name
         related_tags = sorted(related_tags, key = operator.attrgetter('name'))
 
-    contributors = list(
-        models.Thread.objects.get_thread_contributors(
-                                        thread_list=page.object_list
-                                    ).only('id', 'username', 'gravatar')
-                        )
-
-    paginator_context = {
-        'is_paginated' : (paginator.count > search_state.page_size),
-        'pages': paginator.num_pages,
-        'current_page_number': search_state.page,
-        'page_object': page,
-        'base_url' : search_state.query_string(),
-        'page_size' : search_state.page_size,
-    }
-
     # We need to pass the rss feed url based
     # on the search state to the template.
     # We use QueryDict to get a querystring
@@ -151,13 +211,13 @@ def questions(request, **kwargs):
     reset_method_count = len(filter(None, [search_state.query, search_state.tags, meta_data.get('author_name', None)]))
 
     if request.is_ajax():
-        q_count = paginator.count
+        q_count = questions_count
 
         #todo: words
         question_counter = ungettext('%(q_num)s question', '%(q_num)s questions', q_count)
         question_counter = question_counter % {'q_num': humanize.intcomma(q_count),}
 
-        if q_count > search_state.page_size:
+        if paginator_context['is_paginated']:
             paginator_tpl = get_template('main_page/paginator.html')
             paginator_html = paginator_tpl.render(
                 RequestContext(
@@ -239,7 +299,7 @@ def questions(request, **kwargs):
             'page_size': search_state.page_size,
             'query': search_state.query,
             'threads' : page,
-            'questions_count' : paginator.count,
+            'questions_count' : questions_count,
             'reset_method_count': reset_method_count,
             'scope': search_state.scope,
             'show_sort_by_relevance': conf.should_show_sort_by_relevance(),
@@ -469,7 +529,7 @@ def question(request, id):#refactor - long subroutine. display question body, an
             request.user.message_set.create(message = error_message)
             return HttpResponseRedirect(question_post.thread.get_absolute_url())
 
-        if str(show_comment.thread._question_post().id) != str(id):
+        if str(show_comment.thread.get_question_post_id()) != str(id):
             return HttpResponseRedirect(show_comment.get_absolute_url())
         show_post = show_comment.parent
 
@@ -489,7 +549,7 @@ def question(request, id):#refactor - long subroutine. display question body, an
         #whether answer is actually corresponding to the current question
         #and that the visitor is allowed to see it
         show_post = get_object_or_404(models.Post, post_type='answer', id=show_answer)
-        if str(show_post.thread._question_post().id) != str(id):
+        if str(show_post.thread.get_question_post_id()) != str(id):
             return HttpResponseRedirect(show_post.get_absolute_url())
 
         try:
@@ -499,6 +559,7 @@ def question(request, id):#refactor - long subroutine. display question body, an
             return HttpResponseRedirect(reverse('question', kwargs = {'id': id}))
 
     thread = question_post.thread
+    thread._question_cache = question_post
 
     if getattr(django_settings, 'ASKBOT_MULTILINGUAL', False):
         if thread.language_code != translation.get_language():
@@ -520,13 +581,8 @@ def question(request, id):#refactor - long subroutine. display question body, an
 
     user_votes = {}
     user_post_id_list = list()
-    #todo: cache this query set, but again takes only 3ms!
     if request.user.is_authenticated():
-        user_votes = Vote.objects.filter(
-                            user=request.user,
-                            voted_post__id__in = post_to_author.keys()
-                        ).values_list('voted_post_id', 'vote')
-        user_votes = dict(user_votes)
+        user_votes = thread.get_user_votes(request.user)
         #we can avoid making this query by iterating through
         #already loaded posts
         user_post_id_list = [
@@ -568,13 +624,19 @@ def question(request, id):#refactor - long subroutine. display question body, an
         request.session['question_view_times'][question_post.id] = \
                                                     datetime.datetime.now()
 
+        if update_view_count and view_counter.is_enabled():
+            #written to the database later, in a batch
+            view_counter.record_view(thread.id)
+            update_view_count = False
+
         #2) run the slower jobs in a celery task
-        from askbot import tasks
-        tasks.record_question_visit.delay(
-            question_post = question_post,
-            user_id = request.user.id,
-            update_view_count = update_view_count
-        )
+        if update_view_count or request.user.is_authenticated():
+            from askbot import tasks
+            tasks.record_question_visit.delay(
+                question_post = question_post,
+                user_id = request.user.id,
+                update_view_count = update_view_count
+            )
 
     paginator_data = {
         'is_paginated' : (objects_list.count > const.ANSWERS_PAGE_SIZE),